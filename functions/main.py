@@ -1,12 +1,22 @@
+import os
 from flask import Flask, request, jsonify
-from src.functions.chat.chat_application import ChatApplication
+from src.functions.chat.session_manager import ChatSessionManager, telegram_session_ids
+from src.functions.chat.conversation_scheduler import ConversationScheduler
 import requests
 
 # Import Firebase Functions
 from firebase_functions.https import CallableRequest, on_call
 
 app = Flask(__name__)
-chat_app = ChatApplication(user_id="g")
+# One ChatApplication per Telegram chat. The instance may be frozen once the webhook returns,
+# so each turn waits for its writes before replying.
+sessions = ChatSessionManager(max_sessions=int(os.getenv("MAX_CHAT_SESSIONS", "100")),
+                              routing_mode=os.getenv("CHAT_ROUTING_MODE", "multi_call"),
+                              durability="ack_before_reply")
+# Turns for one chat run in order; different chats run in parallel on a bounded pool
+scheduler = ConversationScheduler(max_workers=int(os.getenv("MAX_CONCURRENT_TURNS", "8")))
+# The owner's Telegram chat ID, see telegram_bot/config.py. Unset, every chat shares the owner's session.
+TELEGRAM_OWNER_CHAT_ID = os.getenv("TELEGRAM_OWNER_CHAT_ID")
 
 @app.route("/", methods=["GET"])
 def home():
@@ -19,9 +29,11 @@ def webhook():
         chat_id = update["message"]["chat"]["id"]
         user_input = update["message"]["text"]
 
+        user_id, conversation_id = telegram_session_ids(chat_id, TELEGRAM_OWNER_CHAT_ID)
         try:
-            chat_app.chat(user_input)
-            response_message = chat_app.chat_context.context[-1].content
+            response_message = scheduler.submit(
+                conversation_id, lambda: run_turn(user_id, conversation_id, user_input)
+            ).result()
         except Exception as e:
             response_message = f"Error: {e}"
 
@@ -29,6 +41,13 @@ def webhook():
 
     return jsonify({"status": "ok"})
 
+def run_turn(user_id, conversation_id, user_input):
+    """
+    Runs one turn on the conversation's session, keeping the session open until the turn is done.
+    """
+    with sessions.use(user_id, conversation_id) as chat_app:
+        return chat_app.chat(user_input)
+
 def send_message(chat_id, text):
     """
     Send a message to Telegram
@@ -36,7 +55,7 @@ def send_message(chat_id, text):
     TELEGRAM_API_URL = f"https://api.telegram.org/bot{os.getenv('TELEGRAM_BOT_TOKEN')}"
     url = f"{TELEGRAM_API_URL}/sendMessage"
     payload = {"chat_id": chat_id, "text": text}
-    requests.post(url, json=payload)
+    requests.post(url, json=payload, timeout=10)
 
 # Deploy the webhook
 @on_call
@@ -1,11 +1,19 @@
 import os
 import json
+from anthropic import APITimeoutError
 from dotenv import load_dotenv
-from typing import List, Any
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage
-from src.llm.context.tools.tool_handler import execute_tools, select_input_tools_with_llm
+from typing import List, Dict, Any, Optional
+from src.llm.context.tools.tool_handler import (
+    ToolResponse, execute_tools, aexecute_tools, select_input_tools_with_llm, aselect_input_tools_with_llm,
+    speculate_tools
+)
+from src.llm.context.tools.tool_usage import Speculation, speculation_metrics, tool_usage
+from src.llm.context.tools.tool_registry import OWNER_USER_ID
 from src.interface.output_manager import OutputManager  # Import output_manager
+from src.llm.context.tools.tool_preselector import Preselection, tool_preselector
+from src.llm.context.tools.tool_plan import validate_tool_plan
+from src.llm.context.tools.augmentation_compactor import MAX_AUGMENTATION_TOKENS, augmentation_compactor
+from src.utils.timing import TurnDeadline
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -15,58 +23,220 @@ API_KEY = os.getenv("ANTHROPIC_API_KEY")
 if not API_KEY:
     raise ValueError("Anthropic API key is missing. Please set your API key in a .env file.")
 
-# Initialize the Anthropic chat model
-model = ChatAnthropic(
-    model="claude-3-5-sonnet-20241022",  # Specify model version
-    temperature=0.7,                     # Adjust temperature for response variability
-    anthropic_api_key=API_KEY            # Use the API key
-)
-
-def get_augmentation_data(user_query: str, context: str, output_manager: OutputManager) -> str:
+def get_augmentation_data(user_query: str, context: str, output_manager: OutputManager,
+                          deadline: Optional[TurnDeadline] = None, max_tokens: int = MAX_AUGMENTATION_TOKENS,
+                          user_id: str = OWNER_USER_ID) -> str:
     """
     Executes the two-step chain:
-    1. Uses the LLM to determine tools.
+    1. Determines tools, locally when the plan is obvious and with the LLM otherwise.
     2. Executes tools and uses the LLM again to generate the final response.
 
     Args:
         user_query (str): The user's input query.
         context (str): Serialized context from prior conversation.
         output_manager (OutputManager): An instance of OutputManager to handle logging.
+        deadline (Optional[TurnDeadline]): When generation has to start; tools that would run past it are
+            reported as unavailable.
+        max_tokens (int): The token budget for the compacted tool outputs.
+        user_id (str): The user asking. The tools read this user's data; the tools their turns usually select
+            are started speculatively while the LLM picks the tools, and the final plan is recorded.
 
     Returns:
         str: Augmentation data.
     """
-    # Step 1: Determine tools using LLM
+    # Step 1: Determine tools, skipping the LLM when the local preselector is confident
+    preselection = tool_preselector.preselect(user_query)
+    if preselection.confident:
+        _log_preselection(preselection, output_manager)
+        tool_preselector.maybe_shadow(user_query, preselection, select_input_tools_with_llm)
+        _record_plan(user_id, preselection.tool_choices)
+        return run_tool_plan(preselection.tool_choices, output_manager, deadline, max_tokens, user_id)
+
+    # Start the tools this user's turns usually need while the LLM is still choosing
+    speculation = _start_speculation(user_id, output_manager)
     try:
         output_manager.log("🔍 Determining tools with LLM...")
-        raw_tool_choices = select_input_tools_with_llm(user_query)  # Get raw JSON
+        raw_tool_choices = select_input_tools_with_llm(user_query, deadline)
+    except APITimeoutError:
+        return _answer_without_tools(output_manager)
+    except Exception as e:
+        output_manager.log(f"❌ Error selecting tools: {e}", level="ERROR")
+        raise RuntimeError(f"Error selecting tools: {e}")
+    tool_preselector.observe(user_query, preselection, raw_tool_choices)
+    _record_plan(user_id, raw_tool_choices, speculation, speculated=True)
 
-        # Parse JSON string into a Python object if necessary
-        if isinstance(raw_tool_choices, str):
-            raw_tool_choices = json.loads(raw_tool_choices)
+    # Step 2: Execute tools and gather data
+    return run_tool_plan(raw_tool_choices, output_manager, deadline, max_tokens, user_id)
 
-        tools_used = [tool["tool_name"] for tool in raw_tool_choices]  # Extract tool names
-        output_manager.log("🔧 Using Tools:")
-        for tool in tools_used:
-            output_manager.log(f"    ☑️ {tool}")
+
+async def aget_augmentation_data(user_query: str, context: str, output_manager: OutputManager,
+                                 deadline: Optional[TurnDeadline] = None,
+                                 max_tokens: int = MAX_AUGMENTATION_TOKENS, user_id: str = OWNER_USER_ID) -> str:
+    """
+    Async version of `get_augmentation_data`.
+
+    Args:
+        user_query (str): The user's input query.
+        context (str): Serialized context from prior conversation.
+        output_manager (OutputManager): An instance of OutputManager to handle logging.
+        deadline (Optional[TurnDeadline]): When generation has to start; tools that would run past it are
+            reported as unavailable.
+        max_tokens (int): The token budget for the compacted tool outputs.
+        user_id (str): The user asking, whose data the tools read.
+
+    Returns:
+        str: Augmentation data.
+    """
+    preselection = tool_preselector.preselect(user_query)
+    if preselection.confident:
+        _log_preselection(preselection, output_manager)
+        tool_preselector.maybe_shadow(user_query, preselection, select_input_tools_with_llm)
+        _record_plan(user_id, preselection.tool_choices)
+        return await arun_tool_plan(preselection.tool_choices, output_manager, deadline, max_tokens, user_id)
+
+    speculation = _start_speculation(user_id, output_manager)
+    try:
+        output_manager.log("🔍 Determining tools with LLM...")
+        raw_tool_choices = await aselect_input_tools_with_llm(user_query, deadline)
+    except APITimeoutError:
+        return _answer_without_tools(output_manager)
     except Exception as e:
         output_manager.log(f"❌ Error selecting tools: {e}", level="ERROR")
         raise RuntimeError(f"Error selecting tools: {e}")
+    tool_preselector.observe(user_query, preselection, raw_tool_choices)
+    _record_plan(user_id, raw_tool_choices, speculation, speculated=True)
+
+    return await arun_tool_plan(raw_tool_choices, output_manager, deadline, max_tokens, user_id)
+
+
+def run_tool_plan(tool_choices: List[Dict[str, Any]], output_manager: OutputManager,
+                  deadline: Optional[TurnDeadline] = None, max_tokens: int = MAX_AUGMENTATION_TOKENS,
+                  user_id: str = OWNER_USER_ID) -> str:
+    """
+    Validates an already-selected tool plan, executes it and serializes the outputs for the prompt.
+
+    Args:
+        tool_choices (List[Dict[str, Any]]): Tool choices like [{"tool_name": ..., "params": {...}}].
+        output_manager (OutputManager): An instance of OutputManager to handle logging.
+        deadline (Optional[TurnDeadline]): When generation has to start; tools that would run past it are
+            reported as unavailable.
+        max_tokens (int): The token budget for the compacted tool outputs.
+        user_id (str): The user whose data the tools read.
+
+    Returns:
+        str: Augmentation data.
+    """
+    tool_choices = _validated_plan(tool_choices, output_manager)
+    _log_tool_plan(tool_choices, output_manager)
 
-    # Step 2: Execute tools and gather data
     try:
         output_manager.log("⚙️ Executing tools...")
 
         # Convert the parsed Python object back to JSON string for execute_tools
-        raw_tool_choices_json = json.dumps(raw_tool_choices)
-        tool_outputs = execute_tools(raw_tool_choices_json, output_manager)  # Pass JSON string
+        raw_tool_choices_json = json.dumps(tool_choices)
+        tool_outputs = execute_tools(raw_tool_choices_json, output_manager, deadline, user_id)  # Pass JSON string
     except Exception as e:
         output_manager.log(f"❌ Error executing tools: {e}", level="ERROR")
         raise RuntimeError(f"Error executing tools: {e}")
 
-    # Step 3: Generate response with data and context
-    combined_data = "\n".join([json.dumps(tool.to_dict(), indent=2) for tool in tool_outputs])  # Serialize ToolResponse objects
-    return combined_data
+    return _combine_tool_outputs(tool_outputs, output_manager, max_tokens)
+
+
+async def arun_tool_plan(tool_choices: List[Dict[str, Any]], output_manager: OutputManager,
+                         deadline: Optional[TurnDeadline] = None, max_tokens: int = MAX_AUGMENTATION_TOKENS,
+                         user_id: str = OWNER_USER_ID) -> str:
+    """
+    Async version of `run_tool_plan`.
+
+    Args:
+        tool_choices (List[Dict[str, Any]]): Tool choices like [{"tool_name": ..., "params": {...}}].
+        output_manager (OutputManager): An instance of OutputManager to handle logging.
+        deadline (Optional[TurnDeadline]): When generation has to start; tools that would run past it are
+            reported as unavailable.
+        max_tokens (int): The token budget for the compacted tool outputs.
+        user_id (str): The user whose data the tools read.
+
+    Returns:
+        str: Augmentation data.
+    """
+    tool_choices = _validated_plan(tool_choices, output_manager)
+    _log_tool_plan(tool_choices, output_manager)
+
+    try:
+        output_manager.log("⚙️ Executing tools...")
+        tool_outputs = await aexecute_tools(json.dumps(tool_choices), output_manager, deadline, user_id)
+    except Exception as e:
+        output_manager.log(f"❌ Error executing tools: {e}", level="ERROR")
+        raise RuntimeError(f"Error executing tools: {e}")
+
+    return _combine_tool_outputs(tool_outputs, output_manager, max_tokens)
+
+
+def _answer_without_tools(output_manager: OutputManager) -> str:
+    # Tool selection used up the turn deadline; generation starts on time without tool data
+    output_manager.log("⏱️ Tool selection ran past the turn deadline, answering without tools", level="WARNING")
+    return ""
+
+
+def _start_speculation(user_id: Optional[str], output_manager: OutputManager) -> Optional[Speculation]:
+    if not user_id:
+        return None
+    speculation = speculate_tools(user_id)
+    if speculation is not None:
+        names = ", ".join(choice["tool_name"] for choice in speculation.choices)
+        output_manager.log(f"🔮 Speculatively started: {names}")
+    return speculation
+
+
+def _record_plan(user_id: Optional[str], tool_choices: Any, speculation: Optional[Speculation] = None,
+                 speculated: bool = False):
+    # Compared after validation, so a plan matches a speculation whenever the same tool and params will run
+    if not user_id:
+        return
+    plan, _ = validate_tool_plan(tool_choices)
+    tool_usage.record_plan(user_id, plan)
+    if speculated:
+        speculation_metrics.settle(speculation, plan)
+
+
+def _validated_plan(tool_choices: Any, output_manager: OutputManager) -> List[Dict[str, Any]]:
+    # Malformed choices are repaired or dropped here, so they never fail the turn
+    plan, repairs = validate_tool_plan(tool_choices)
+    for repair in repairs:
+        output_manager.log(f"🩹 Tool plan: {repair}", level="WARNING")
+    return plan
+
+
+def _log_preselection(preselection: Preselection, output_manager: OutputManager):
+    output_manager.log(
+        f"⚡ Tools chosen locally ({preselection.source}, confidence {preselection.confidence:.2f}), "
+        f"skipping the tool-selection LLM call"
+    )
+
+
+def _log_tool_plan(tool_choices: List[Dict[str, Any]], output_manager: OutputManager):
+    try:
+        tools_used = [tool["tool_name"] for tool in tool_choices]  # Extract tool names
+        output_manager.log("🔧 Using Tools:")
+        for tool in tools_used:
+            output_manager.log(f"    ☑️ {tool}")
+    except Exception as e:
+        output_manager.log(f"❌ Error selecting tools: {e}", level="ERROR")
+        raise RuntimeError(f"Error selecting tools: {e}")
+
+
+def _combine_tool_outputs(tool_outputs: List[ToolResponse], output_manager: OutputManager,
+                          max_tokens: int = MAX_AUGMENTATION_TOKENS) -> str:
+    # Reduce each tool's output and fit them all into the augmentation budget
+    compacted = augmentation_compactor.compact(tool_outputs, max_tokens)
+    if compacted.raw_tokens:
+        output_manager.log(
+            f"🗜️ Augmentation: {compacted.raw_tokens} → {compacted.compacted_tokens} tokens "
+            f"(saved {compacted.saved_tokens}, {compacted.saved_tokens / compacted.raw_tokens:.0%})"
+        )
+    for tool_name in compacted.truncated_tools:
+        output_manager.log(f"✂️ Truncated to fit the augmentation budget: {tool_name}", level="WARNING")
+    return compacted.text
 
 
 # CLI Main Loop
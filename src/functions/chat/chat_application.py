@@ -1,15 +1,36 @@
 import json
+import asyncio
+import contextvars
 import datetime
+import threading
 import warnings
-from src.functions.chat.augmented_chat import get_augmentation_data
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.functions.chat.conversation_scheduler import ConversationScheduler
+from src.functions.chat.augmented_chat import get_augmentation_data, aget_augmentation_data, run_tool_plan, arun_tool_plan
+from src.llm.context.tools.tool_handler import prefetch_tools
+from src.llm.context.tools.tool_usage import speculation_metrics
 from src.utils.constants import ChatContext, ChatMessage, Conversation, ExpertLLM
 from src.utils.firebase.firestore.chat_helper import ChatHelper
+from src.utils.firebase.firestore.persistence_queue import get_write_behind_queue
 from src.llm.intelligence.mixture_of_experts.select_expert import ExpertSelector
+from src.llm.intelligence.turn_router import TurnRouter
+from src.llm.intelligence.history_summarizer import HistorySummarizer
 from src.interface.output_manager import OutputManager
+from src.utils.timing import TurnDeadline, TurnTimer
+from src.llm.client_pool import get_chat_model, llm_client_pool
+from src.llm.response_cache import ResponseCache
+from src.llm.context.tools.tool_cache import tool_result_cache
+from src.llm.context.tools.tool_preselector import tool_preselector
+from src.llm.context.tools.augmentation_compactor import MAX_AUGMENTATION_TOKENS, augmentation_compactor
+from src.llm.context.tools.whoop.whoop_store import get_whoop_store
+from src.llm.token_accounting import PromptBudget, evict_oldest_messages, message_tokens, messages_tokens
+from src.llm.prompt_cache import (
+    begin_turn_cache_stats, cached_block, current_turn_cache_stats, record_cache_usage, split_history_for_cache
+)
 from langchain_anthropic import ChatAnthropic
-from typing import Optional
+from typing import Optional, Iterator, AsyncIterator, Tuple, List
 import os
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
 # Suppress warnings globally
 warnings.filterwarnings("ignore")
@@ -18,77 +39,405 @@ if not API_KEY:
     raise ValueError(
         "Anthropic API key is missing. Please set your API key in a .env file.")
 
+# "multi_call" asks separate LLM calls for the expert switch, expert selection and tool selection;
+# "single_call" lets the TurnRouter pick the expert and the tools in one call.
+ROUTING_MODES = ("multi_call", "single_call")
+
+# Messages are always written behind the reply path. "ack_after_reply" returns the reply without waiting
+# for the write; "ack_before_reply" waits until the turn's messages are committed before returning.
+DURABILITY_MODES = ("ack_after_reply", "ack_before_reply")
+
+# Expert routing and tool augmentation are independent until prompt assembly, so each turn runs them side by
+# side on this pool. Stage work never waits on the pool itself (tools run on tool_handler's pools).
+MAX_STAGE_WORKERS = 16
+_stage_executor = ThreadPoolExecutor(max_workers=MAX_STAGE_WORKERS, thread_name_prefix="chat-turn")
+# Summary updates run after the reply, one at a time and in order per conversation
+MAX_SUMMARY_WORKERS = 2
+_summary_scheduler = ConversationScheduler(max_workers=MAX_SUMMARY_WORKERS, thread_name_prefix="chat-summary")
+
 
 class ChatApplication:
-    def __init__(self, user_id: str, conversation_id: str = '', max_context_tokens: int = 10000, debug: bool = False):
+    def __init__(self, user_id: str, conversation_id: str = '', max_context_tokens: int = 10000, debug: bool = False,
+                 routing_mode: str = "multi_call", max_prompt_tokens: int = 30000,
+                 durability: str = "ack_after_reply", lazy: bool = True,
+                 response_cache: Optional[ResponseCache] = None, turn_deadline_seconds: float = 20.0,
+                 max_augmentation_tokens: int = MAX_AUGMENTATION_TOKENS, prefetch: bool = True):
         """
         Initializes the ChatApplication with a ChatContext and ExpertSelector.
 
         Args:
             user_id (str): Unique identifier for the user.
             max_context_tokens (int): Maximum number of tokens for the context window.
-            telegram_chat_id (str, optional): Telegram chat ID for real-time updates.
-            telegram_bot_token (str, optional): Telegram bot token for API access.
+            debug (bool): If True, logs detailed output such as per-stage timings.
+            routing_mode (str): "multi_call" (default) or "single_call" for the unified TurnRouter.
+            max_prompt_tokens (int): Maximum input tokens for the generation prompt (persona + history + augmentation + query).
+            durability (str): "ack_after_reply" (default) or "ack_before_reply", see DURABILITY_MODES.
+            lazy (bool): If True (default), the conversation is loaded on the first turn instead of here.
+            response_cache (Optional[ResponseCache]): Opt-in cache of generated responses, which may be shared
+                between sessions. Repeated queries with the same expert and augmentation data skip generation.
+            turn_deadline_seconds (float): Seconds from the start of a turn until generation must start. Tools
+                still running by then are reported to the prompt as unavailable.
+            max_augmentation_tokens (int): Token budget for the compacted tool outputs in the generation prompt.
+            prefetch (bool): If True (default), the foundational tools (basic user info, far horizon context,
+                personality profile) are fetched into the tool result cache in the background on creation.
         """
+        if routing_mode not in ROUTING_MODES:
+            raise ValueError(f"Invalid routing mode '{routing_mode}'. Must be one of {list(ROUTING_MODES)}.")
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Invalid durability mode '{durability}'. Must be one of {list(DURABILITY_MODES)}.")
+
         self.chat_context = ChatContext(
             user_id=user_id, max_tokens=max_context_tokens)
         self.debug = debug
+        self.routing_mode = routing_mode
+        self.max_prompt_tokens = max_prompt_tokens
+        self.durability = durability
+        self.response_cache = response_cache
+        self.turn_deadline_seconds = turn_deadline_seconds
+        self.max_augmentation_tokens = max_augmentation_tokens
         self.chat_helper = ChatHelper()
+        self.write_queue = get_write_behind_queue()
         self.expert_selector = ExpertSelector()  # Initialize ExpertSelector
+        self.turn_router = TurnRouter()
+        self.history_summarizer = HistorySummarizer()
         if conversation_id != '':
             self.conversation_id = conversation_id
         else:
             self.conversation_id = f"conversation_{user_id}_{datetime.datetime.now(datetime.timezone.utc).isoformat()}"
         self.chat_context.current_expert = None 
         self.output_manager = OutputManager(debug=debug)
+        self.last_turn_timings = {}
+        self.last_turn_cache_stats = {}
+        self.last_prompt_budget = {}
+        # Messages trimmed from the context that still have to be folded into the summary. The update runs
+        # after the reply, queued per conversation (or as a single task), so summaries are applied in order.
+        self.pending_evictions: List[ChatMessage] = []
+        self._evictions_lock = threading.Lock()
+        self._summary_task: Optional[asyncio.Task] = None
+
+        # History is loaded on first use so construction makes no Firestore reads or LLM calls
+        self._loaded = False
+        if not lazy:
+            self._ensure_loaded()
+        self.prefetch = prefetch
+        if prefetch:
+            self.prefetch_context()
+
+    def prefetch_context(self):
+        """
+        Warms the foundational tool results in the background, so turns that select them skip the fetch.
+
+        Called when a session is created or resumed. Does not block; results land in the shared tool cache.
+        """
+        if self.debug:
+            self.output_manager.log("🔥 Prefetching foundational context in the background", level="DEBUG")
+        prefetch_tools(self.chat_context.user_id)
 
+    def _ensure_loaded(self):
+        """
+        Loads the recent conversation window on first use and restores the last expert from it.
+
+        The expert comes from the `expert_used` of the latest assistant message, so no LLM call is needed.
+        """
+        if self._loaded:
+            return
+        # Make sure writes still queued by an earlier instance are visible to the load below
+        self._flush_queued_writes()
         try:
-            existing_conversation = self.chat_helper.load_conversation(self.conversation_id)
-            self.chat_context.context = existing_conversation.messages
-            self.chat_context.token_count = sum(
-                len(msg.content.split()) for msg in existing_conversation.messages
-            )
-            selected_expert = self.expert_selector.select_expert(existing_conversation)
-            self.chat_context.current_expert = selected_expert  # Assign the ExpertLLM instance
+            existing_conversation = self.chat_helper.load_recent_messages(
+                self.conversation_id, token_budget=self.chat_context.max_tokens)
+            self._restore_conversation(existing_conversation)
         except ValueError:
             self.output_manager.log("No existing conversation found. Starting fresh.", level="INFO")
+        self._restore_unflushed_messages()
+        self._loaded = True
 
-        # Attempt to load an existing conversation
+    async def _aensure_loaded(self):
+        """
+        Async version of `_ensure_loaded`.
+        """
+        if self._loaded:
+            return
+        await asyncio.to_thread(self._flush_queued_writes)
         try:
-            existing_conversation = self.chat_helper.load_conversation(
-                self.conversation_id)
-            self.chat_context.context = existing_conversation.messages
-            self.chat_context.token_count = sum(
-                len(msg.content.split()) for msg in existing_conversation.messages)
-            self.chat_context.current_expert = self.expert_selector.select_expert(
-                existing_conversation)
+            existing_conversation = await self.chat_helper.aload_recent_messages(
+                self.conversation_id, token_budget=self.chat_context.max_tokens)
+            self._restore_conversation(existing_conversation)
         except ValueError:
-            self.output_manager.log(
-                "No existing conversation found. Starting fresh.", level="INFO")
+            self.output_manager.log("No existing conversation found. Starting fresh.", level="INFO")
+        self._restore_unflushed_messages()
+        self._loaded = True
+
+    def _flush_queued_writes(self):
+        try:
+            self.write_queue.flush()
+        except Exception as e:
+            # The writes stay queued for a retry; `_restore_unflushed_messages` picks them up from the queue
+            self.output_manager.log(f"Queued messages are not committed yet: {e}", level="WARNING")
 
-    def chat(self, user_input: str) -> None:
+    def _restore_unflushed_messages(self):
+        """
+        Adds this conversation's messages that are still in the write-behind queue, so new messages are
+        numbered after them rather than after the (older) last_seq read from Firestore.
+        """
+        unflushed = [message for message in self.write_queue.pending_messages(self.conversation_id)
+                     if message.seq > self.chat_context.last_seq]
+        if not unflushed:
+            return
+        self.chat_context.context.extend(unflushed)
+        self.chat_context.token_count += messages_tokens(unflushed)
+        self.chat_context.last_seq = unflushed[-1].seq
+        self._trim_context()
+
+    def _restore_conversation(self, conversation: Conversation):
+        self.chat_context.context = conversation.messages
+        self.chat_context.token_count = messages_tokens(conversation.messages)
+        self.chat_context.summary = conversation.summary
+        self.chat_context.last_seq = conversation.last_seq
+        self.chat_context.current_expert = ExpertSelector.restore_expert(conversation)
+        if conversation.unsummarized:
+            # In the stored window but over the load budget; summarize them before window_start moves past them
+            with self._evictions_lock:
+                self.pending_evictions = conversation.unsummarized + self.pending_evictions
+
+    def chat(self, user_input: str) -> str:
         """
         Manages the chat flow by updating context and invoking the augmented chat.
 
+        Expert selection and augmentation (tool selection + tool execution) run concurrently,
+        and the wall time of each stage is stored in `last_turn_timings`.
+
+        Args:
+            user_input (str): The user's query.
+
+        Returns:
+            str: The assistant's response.
+        """
+        timer = TurnTimer()
+        begin_turn_cache_stats()
+        selected_expert, messages, cache_key = self._prepare_turn(timer, user_input)
+
+        response_content = self._lookup_response(timer, cache_key)
+        if response_content is None:
+            # Generate response using Claude
+            model = self._generation_model(selected_expert)
+            with timer.stage("generation"):
+                response = model.invoke(messages)
+            record_cache_usage("generation", response)
+            timer.record("time_to_answer", timer.elapsed())
+
+            # Extract content from the response
+            response_content = response.content.strip()
+            self._store_response(timer, cache_key, response_content)
+
+        # Log the assistant's response
+        self.output_manager.log(
+            f"{response_content}\n-{selected_expert.template_name} ")
+
+        response_content = self._finish_turn(timer, selected_expert, response_content)
+        self.schedule_summary_update()
+        return response_content
+
+    async def achat(self, user_input: str) -> str:
+        """
+        Async version of `chat`. Every Claude call and Firestore write is awaited, so an event loop
+        (e.g. the Telegram bot) can serve other chats while this turn is in flight.
+
+        Args:
+            user_input (str): The user's query.
+
+        Returns:
+            str: The assistant's response.
+        """
+        timer = TurnTimer()
+        begin_turn_cache_stats()
+        selected_expert, messages, cache_key = await self._aprepare_turn(timer, user_input)
+
+        response_content = self._lookup_response(timer, cache_key)
+        if response_content is None:
+            model = self._generation_model(selected_expert)
+            with timer.stage("generation"):
+                response = await model.ainvoke(messages)
+            record_cache_usage("generation", response)
+            timer.record("time_to_answer", timer.elapsed())
+
+            response_content = response.content.strip()
+            self._store_response(timer, cache_key, response_content)
+        self.output_manager.log(
+            f"{response_content}\n-{selected_expert.template_name} ")
+
+        response_content = await self._afinish_turn(timer, selected_expert, response_content)
+        self.aschedule_summary_update()
+        return response_content
+
+    def stream_chat(self, user_input: str) -> Iterator[str]:
+        """
+        Same flow as `chat`, but yields the response text chunk by chunk as Claude generates it.
+
+        The full response is added to the context once the stream is exhausted.
+
+        Args:
+            user_input (str): The user's query.
+
+        Yields:
+            str: Chunks of the assistant's response.
+        """
+        timer = TurnTimer()
+        begin_turn_cache_stats()
+        selected_expert, messages, cache_key = self._prepare_turn(timer, user_input)
+
+        cached_response = self._lookup_response(timer, cache_key)
+        if cached_response is not None:
+            yield cached_response
+            self._finish_turn(timer, selected_expert, cached_response)
+            self.schedule_summary_update()
+            return
+
+        model = self._generation_model(selected_expert)
+        chunks = []
+        with timer.stage("generation"):
+            for chunk in model.stream(messages):
+                record_cache_usage("generation", chunk)
+                text = self._chunk_text(chunk)
+                if not text:
+                    continue
+                if not chunks:
+                    timer.record("time_to_first_token", timer.elapsed())
+                chunks.append(text)
+                yield text
+        timer.record("time_to_answer", timer.elapsed())
+
+        response_content = "".join(chunks).strip()
+        self._store_response(timer, cache_key, response_content)
+        self._finish_turn(timer, selected_expert, response_content)
+        self.schedule_summary_update()
+
+    async def astream_chat(self, user_input: str) -> AsyncIterator[str]:
+        """
+        Async version of `stream_chat` for event-loop based callers such as the Telegram bot.
+
+        Args:
+            user_input (str): The user's query.
+
+        Yields:
+            str: Chunks of the assistant's response.
+        """
+        timer = TurnTimer()
+        begin_turn_cache_stats()
+        selected_expert, messages, cache_key = await self._aprepare_turn(timer, user_input)
+
+        cached_response = self._lookup_response(timer, cache_key)
+        if cached_response is not None:
+            yield cached_response
+            await self._afinish_turn(timer, selected_expert, cached_response)
+            self.aschedule_summary_update()
+            return
+
+        model = self._generation_model(selected_expert)
+        chunks = []
+        with timer.stage("generation"):
+            async for chunk in model.astream(messages):
+                record_cache_usage("generation", chunk)
+                text = self._chunk_text(chunk)
+                if not text:
+                    continue
+                if not chunks:
+                    timer.record("time_to_first_token", timer.elapsed())
+                chunks.append(text)
+                yield text
+        timer.record("time_to_answer", timer.elapsed())
+
+        response_content = "".join(chunks).strip()
+        self._store_response(timer, cache_key, response_content)
+        await self._afinish_turn(timer, selected_expert, response_content)
+        self.aschedule_summary_update()
+
+    def _prepare_turn(self, timer: TurnTimer, user_input: str) -> Tuple[ExpertLLM, List[BaseMessage], Optional[str]]:
+        """
+        Runs everything that has to happen before generation: saving the user message,
+        picking the expert, gathering augmentation data and building the prompt.
+
         Args:
+            timer (TurnTimer): The timer for the current turn.
             user_input (str): The user's query.
+
+        Returns:
+            Tuple[ExpertLLM, List[BaseMessage], Optional[str]]: The selected expert, the prompt messages and
+            the response cache key (None when no response cache is configured).
         """
+        if not self._loaded:
+            with timer.stage("load_conversation"):
+                self._ensure_loaded()
+
         # Add user input to context
-        self.add_message_to_context("user", user_input)
+        with timer.stage("save_user_message"):
+            self.add_message_to_context("user", user_input)
 
         # Determine the expert to use for the response
         conversation = Conversation(
             conversation_id=self.conversation_id,
             user_id=self.chat_context.user_id,
-            messages=self.chat_context.context
+            messages=list(self.chat_context.context)
         )
 
-        # Call select_expert and log its result
-        selected_expert = self.expert_selector.select_expert(
-            conversation,
-            current_expert=self.chat_context.current_expert.template_name if self.chat_context.current_expert else None
+        # Serialize the current context
+        serialized_context = self.get_serialized_context()
+
+        # Pick the expert and gather augmentation data
+        selected_expert, augmentation_data = self._route_and_augment(
+            timer, conversation, user_input, serialized_context)
+
+        return self._build_turn_messages(selected_expert, conversation.messages[:-1], augmentation_data, user_input)
+
+    async def _aprepare_turn(self, timer: TurnTimer, user_input: str) -> Tuple[ExpertLLM, List[BaseMessage], Optional[str]]:
+        """
+        Async version of `_prepare_turn`.
+
+        Args:
+            timer (TurnTimer): The timer for the current turn.
+            user_input (str): The user's query.
+
+        Returns:
+            Tuple[ExpertLLM, List[BaseMessage], Optional[str]]: The selected expert, the prompt messages and
+            the response cache key (None when no response cache is configured).
+        """
+        if not self._loaded:
+            with timer.stage("load_conversation"):
+                await self._aensure_loaded()
+
+        with timer.stage("save_user_message"):
+            await self.aadd_message_to_context("user", user_input)
+
+        conversation = Conversation(
+            conversation_id=self.conversation_id,
+            user_id=self.chat_context.user_id,
+            messages=list(self.chat_context.context)
         )
+        serialized_context = self.get_serialized_context()
+
+        selected_expert, augmentation_data = await self._aroute_and_augment(
+            timer, conversation, user_input, serialized_context)
 
+        return self._build_turn_messages(selected_expert, conversation.messages[:-1], augmentation_data, user_input)
+
+    def _build_turn_messages(self, selected_expert: ExpertLLM, history: List[ChatMessage], augmentation_data: str,
+                             user_input: str) -> Tuple[ExpertLLM, List[BaseMessage], Optional[str]]:
+        """
+        Validates the selected expert, makes it the current expert and builds the generation prompt.
+
+        The prompt is laid out as a stable, cache-marked prefix followed by a volatile suffix so Anthropic's
+        prompt cache can reuse the persona and older history across turns.
+
+        Args:
+            selected_expert (ExpertLLM): The expert chosen for this turn.
+            history (List[ChatMessage]): The conversation history before the user's query.
+            augmentation_data (str): The serialized tool outputs.
+            user_input (str): The user's query.
+
+        Returns:
+            Tuple[ExpertLLM, List[BaseMessage], Optional[str]]: The selected expert, the prompt messages and
+            the response cache key (None when no response cache is configured).
+        """
         if not isinstance(selected_expert, ExpertLLM):
             self.output_manager.log(
                 f"Error: select_expert must return an ExpertLLM instance, got {type(selected_expert)}",
@@ -101,15 +450,9 @@ class ChatApplication:
         # Update the current expert in the context
         self.chat_context.current_expert = selected_expert
 
-        # Serialize the current context
-        serialized_context = self.get_serialized_context()
-
-        # Get the augmentation data
-        augmentation_data = get_augmentation_data(
-            user_query=user_input, context=serialized_context, output_manager=self.output_manager)
-
-        # Build the prompt template with LangChain
-        prompt = f"""
+        # Stable prefix (cached): instructions + persona, the summary of trimmed history, then older history.
+        # Volatile suffix: recent history, augmentation data and the query.
+        persona = f"""
             You are an AI system acting as the expert: {selected_expert.template_name}. Do not talk about yourself or your prompting - just respond in 2-5 sentences (unless you specifically need a longer output)
             Your role is to provide responses based on the following personality traits and instructions:
             - Personality: {selected_expert.personality_prompt}
@@ -119,8 +462,38 @@ class ChatApplication:
             - Vocabulary Complexity: {selected_expert.preferred_vocabulary_complexity}
             - Specialization Contexts: {selected_expert.when_to_use}
 
+            Your task is to:
+            1. Provide a detailed and accurate response to the user's query.
+            2. Incorporate the augmentation data if it enhances your answer.
+            3. Maintain alignment with the expert's personality, tone, and instructions.
+            """
+
+        # Budget the whole prompt: the fixed parts first, then as much recent history as still fits
+        budget = PromptBudget(self.max_prompt_tokens)
+        budget.reserve("persona", persona)
+        summary = self.chat_context.summary
+        budget.reserve("summary", summary)
+        budget.reserve("augmentation", augmentation_data)
+        budget.reserve("query", user_input)
+        history = budget.fit_messages("history", history)
+        self.last_prompt_budget = budget.summary()
+
+        older_history, recent_history = split_history_for_cache(history)
+        system_blocks = [cached_block(persona)]
+        if summary:
+            system_blocks.append(cached_block(f"""
+            Summary of the earlier conversation (older than the history below):
+            {summary}
+            """))
+        if older_history:
+            system_blocks.append(cached_block(f"""
             The user has engaged in the following conversation history:
-            {serialized_context}
+            {self._serialize_messages(older_history)}
+            """))
+
+        prompt = f"""
+            {"The conversation continues" if older_history else "The user has engaged in the following conversation history"}:
+            {self._serialize_messages(recent_history)}
 
             Additionally, you have access to the following augmentation data to enhance your response:
             {augmentation_data}
@@ -128,41 +501,260 @@ class ChatApplication:
             Now, the user has provided a query:
             User Query: "{user_input}"
 
-            Your task is to:
-            1. Provide a detailed and accurate response to the user's query.
-            2. Incorporate the augmentation data if it enhances your answer.
-            3. Maintain alignment with the expert's personality, tone, and instructions.
-
             Respond below:
             """
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(self.chat_context.user_id, user_input, selected_expert, augmentation_data)
+        return selected_expert, [SystemMessage(content=system_blocks), HumanMessage(content=prompt)], cache_key
 
-        # Generate response using Claude
-        model = ChatAnthropic(
-            model="claude-3-5-sonnet-20241022",
-            temperature=selected_expert.temperature or 0.7,
-            anthropic_api_key=API_KEY
-        )
+    def _lookup_response(self, timer: TurnTimer, cache_key: Optional[str]) -> Optional[str]:
+        """
+        Returns the cached response for this turn, if the response cache has one.
+        """
+        if cache_key is None:
+            return None
+        with timer.stage("response_cache_lookup"):
+            entry = self.response_cache.get(cache_key)
+        if entry is None:
+            return None
+        timer.record("time_to_answer", timer.elapsed())
+        self.output_manager.log(
+            f"⚡ Response cache hit, skipped ~{entry.generation_seconds:.2f}s of generation")
+        return entry.response
 
-        message = HumanMessage(content=prompt)
-        response = model.invoke([message])
+    def _store_response(self, timer: TurnTimer, cache_key: Optional[str], response_content: str):
+        """
+        Stores a generated response in the response cache, if one is configured.
+        """
+        if cache_key is not None and response_content:
+            self.response_cache.put(cache_key, response_content, timer.stages.get("generation", 0.0))
 
-        # Extract content from the response
-        response_content = response.content.strip()
+    def _finish_turn(self, timer: TurnTimer, selected_expert: ExpertLLM, response_content: str) -> str:
+        """
+        Stores the assistant's response and records the turn timings.
 
-        # Log the assistant's response
-        self.output_manager.log(
-            f"{response_content}\n-{selected_expert.template_name} ")
+        Args:
+            timer (TurnTimer): The timer for the current turn.
+            selected_expert (ExpertLLM): The expert that generated the response.
+            response_content (str): The full response text.
 
+        Returns:
+            str: The assistant's response.
+        """
         # Add assistant response to context
-        self.add_message_to_context(
-            "assistant",
-            response_content,
-            expert_used=selected_expert.template_name,
-            expert_version=selected_expert.version
+        ack_before_reply = self.durability == "ack_before_reply"
+        with timer.stage("save_assistant_message"):
+            saved = self.add_message_to_context(
+                "assistant",
+                response_content,
+                expert_used=selected_expert.template_name,
+                expert_version=selected_expert.version,
+                flush_now=ack_before_reply
+            )
+        if ack_before_reply:
+            with timer.stage("persistence_ack"):
+                saved.result()
+
+        return self._record_turn(timer, response_content)
+
+    async def _afinish_turn(self, timer: TurnTimer, selected_expert: ExpertLLM, response_content: str) -> str:
+        """
+        Async version of `_finish_turn`.
+        """
+        ack_before_reply = self.durability == "ack_before_reply"
+        with timer.stage("save_assistant_message"):
+            saved = await self.aadd_message_to_context(
+                "assistant",
+                response_content,
+                expert_used=selected_expert.template_name,
+                expert_version=selected_expert.version,
+                flush_now=ack_before_reply
+            )
+        if ack_before_reply:
+            with timer.stage("persistence_ack"):
+                await asyncio.wrap_future(saved)
+
+        return self._record_turn(timer, response_content)
+
+    def _record_turn(self, timer: TurnTimer, response_content: str) -> str:
+        """
+        Stores the turn timings and prompt-cache statistics, and logs them in debug mode. Response cache
+        statistics are logged on every turn when a response cache is configured.
+        """
+        self.last_turn_timings = timer.summary()
+        cache_stats = current_turn_cache_stats()
+        self.last_turn_cache_stats = cache_stats.summary() if cache_stats else {}
+        if self.debug:
+            self.output_manager.log_with_emojis("Turn Timings", self.last_turn_timings)
+            self.output_manager.log_with_emojis("Prompt Cache", self.last_turn_cache_stats)
+            self.output_manager.log_with_emojis("Prompt Budget", self.last_prompt_budget)
+            self.output_manager.log_with_emojis("LLM Client Pool", llm_client_pool.stats())
+            self.output_manager.log_with_emojis("Write-Behind Queue", self.write_queue.stats())
+            self.output_manager.log_with_emojis("Tool Cache", tool_result_cache.stats())
+            self.output_manager.log_with_emojis("Augmentation Compaction", augmentation_compactor.stats())
+            self.output_manager.log_with_emojis("WHOOP Store", get_whoop_store().stats())
+            if self.routing_mode == "multi_call":
+                self.output_manager.log_with_emojis("Tool Preselector", tool_preselector.stats())
+                self.output_manager.log_with_emojis("Tool Speculation", speculation_metrics.summary())
+        if self.response_cache is not None:
+            # Opt-in, so its hit rate and savings are reported on every turn, not only in debug mode
+            self.output_manager.log_with_emojis("Response Cache", self.response_cache.stats())
+
+        return response_content
+
+    @staticmethod
+    def _generation_model(selected_expert: ExpertLLM) -> ChatAnthropic:
+        """
+        Returns the shared Claude model used to generate the response for the selected expert.
+        """
+        return get_chat_model(
+            model="claude-3-5-sonnet-20241022",
+            temperature=selected_expert.temperature or 0.7
+        )
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """
+        Extracts the text from a streamed message chunk, whose content is either a string or a list of content blocks.
+        """
+        if isinstance(chunk.content, str):
+            return chunk.content
+        return "".join(
+            block.get("text", "") for block in chunk.content if isinstance(block, dict) and block.get("type") == "text"
         )
 
+    def _route_and_augment(self, timer: TurnTimer, conversation: Conversation, user_input: str, serialized_context: str):
+        """
+        Selects the expert for this turn and gathers the augmentation data.
+
+        In "multi_call" mode expert selection and tool augmentation run concurrently. In "single_call"
+        mode one router call returns both the expert and the tool plan, and only the tools run afterwards.
+
+        Args:
+            timer (TurnTimer): The timer for the current turn.
+            conversation (Conversation): The conversation, including the latest user message.
+            user_input (str): The user's query.
+            serialized_context (str): The serialized conversation context.
+
+        Returns:
+            Tuple[ExpertLLM, str]: The selected expert and the augmentation data.
+        """
+        current_expert = self.chat_context.current_expert.template_name if self.chat_context.current_expert else None
+        deadline = self._turn_deadline(timer)
+
+        if self.routing_mode == "single_call":
+            with timer.stage("routing"):
+                decision = self.turn_router.route(conversation, user_input, current_expert=current_expert,
+                                                  deadline=deadline)
+            if self.debug:
+                self.output_manager.log(f"🧭 Router: {decision.expert.template_name}. {decision.reasoning}", level="DEBUG")
+            with timer.stage("augmentation"):
+                augmentation_data = run_tool_plan(decision.tool_choices, self.output_manager, deadline,
+                                                    self.max_augmentation_tokens, self.chat_context.user_id)
+            return decision.expert, augmentation_data
+
+        # Route to an expert and gather augmentation data at the same time
+        with timer.stage("routing_and_augmentation"):
+            # Each worker gets a copy of this context so its LLM calls record into this turn's cache stats
+            expert_future = _stage_executor.submit(
+                contextvars.copy_context().run,
+                self._run_stage,
+                timer,
+                "expert_selection",
+                self.expert_selector.select_expert,
+                conversation,
+                current_expert=current_expert,
+                deadline=deadline
+            )
+            augmentation_future = _stage_executor.submit(
+                contextvars.copy_context().run,
+                self._run_stage,
+                timer,
+                "augmentation",
+                get_augmentation_data,
+                user_query=user_input,
+                context=serialized_context,
+                output_manager=self.output_manager,
+                deadline=deadline,
+                max_tokens=self.max_augmentation_tokens,
+                user_id=self.chat_context.user_id
+            )
+            return expert_future.result(), augmentation_future.result()
+
+    async def _aroute_and_augment(self, timer: TurnTimer, conversation: Conversation, user_input: str,
+                                  serialized_context: str):
+        """
+        Async version of `_route_and_augment`; in "multi_call" mode both stages are gathered on the event loop.
+
+        Returns:
+            Tuple[ExpertLLM, str]: The selected expert and the augmentation data.
+        """
+        current_expert = self.chat_context.current_expert.template_name if self.chat_context.current_expert else None
+        deadline = self._turn_deadline(timer)
+
+        if self.routing_mode == "single_call":
+            with timer.stage("routing"):
+                decision = await self.turn_router.aroute(conversation, user_input, current_expert=current_expert,
+                                                         deadline=deadline)
+            if self.debug:
+                self.output_manager.log(f"🧭 Router: {decision.expert.template_name}. {decision.reasoning}", level="DEBUG")
+            with timer.stage("augmentation"):
+                augmentation_data = await arun_tool_plan(decision.tool_choices, self.output_manager, deadline,
+                                                         self.max_augmentation_tokens, self.chat_context.user_id)
+            return decision.expert, augmentation_data
+
+        with timer.stage("routing_and_augmentation"):
+            selected_expert, augmentation_data = await asyncio.gather(
+                self._arun_stage(
+                    timer,
+                    "expert_selection",
+                    self.expert_selector.aselect_expert(conversation, current_expert=current_expert,
+                                                        deadline=deadline)
+                ),
+                self._arun_stage(
+                    timer,
+                    "augmentation",
+                    aget_augmentation_data(user_query=user_input, context=serialized_context,
+                                           output_manager=self.output_manager, deadline=deadline,
+                                           max_tokens=self.max_augmentation_tokens,
+                                           user_id=self.chat_context.user_id)
+                ),
+            )
+            return selected_expert, augmentation_data
+
+    def _turn_deadline(self, timer: TurnTimer) -> TurnDeadline:
+        """
+        Returns the deadline for this turn's data gathering, counted from the start of the turn.
+        """
+        return TurnDeadline(self.turn_deadline_seconds - timer.elapsed())
 
-    def add_message_to_context(self, role: str, content: str, expert_used: str = "general", expert_version: int = 1):
+    @staticmethod
+    async def _arun_stage(timer: TurnTimer, name: str, coroutine):
+        """
+        Awaits one stage of the turn pipeline and records its wall time.
+        """
+        with timer.stage(name):
+            return await coroutine
+
+    @staticmethod
+    def _run_stage(timer: TurnTimer, name: str, func, *args, **kwargs):
+        """
+        Runs one stage of the turn pipeline and records its wall time.
+
+        Args:
+            timer (TurnTimer): The timer for the current turn.
+            name (str): The stage name to record.
+            func (Callable): The stage function.
+
+        Returns:
+            Any: Whatever the stage function returns.
+        """
+        with timer.stage(name):
+            return func(*args, **kwargs)
+
+    def add_message_to_context(self, role: str, content: str, expert_used: str = "general", expert_version: int = 1,
+                               flush_now: bool = False) -> Future:
         """
         Adds a message to the chat context.
 
@@ -171,41 +763,150 @@ class ChatApplication:
             content(str): Content of the message.
             expert_used(str): Expert template used for the response.
             expert_version(int): Version of the expert used.
+            flush_now(bool): If True, the write queue commits without waiting for its timer.
+
+        Returns:
+            Future: Resolves once the message is committed to Firestore.
+        """
+        self._ensure_loaded()  # New messages are numbered after the stored ones
+        message = self._append_message(role, content, expert_used, expert_version)
+
+        # Queue only the new message; the write-behind queue batches it into Firestore. The window start moves
+        # with the summary (see `update_summary`), so trimmed messages are skipped on reload only once summarized.
+        return self.write_queue.enqueue(
+            self.conversation_id, self.chat_context.user_id, [message], flush_now=flush_now)
+
+    async def aadd_message_to_context(self, role: str, content: str, expert_used: str = "general", expert_version: int = 1,
+                                      flush_now: bool = False) -> Future:
+        """
+        Async version of `add_message_to_context`. Queueing never blocks, so nothing is awaited here;
+        await `asyncio.wrap_future` on the result to wait for the commit.
+
+        Args:
+            role(str): Role of the message(e.g., 'user', 'assistant').
+            content(str): Content of the message.
+            expert_used(str): Expert template used for the response.
+            expert_version(int): Version of the expert used.
+            flush_now(bool): If True, the write queue commits without waiting for its timer.
+
+        Returns:
+            Future: Resolves once the message is committed to Firestore.
+        """
+        return self.add_message_to_context(role, content, expert_used, expert_version, flush_now=flush_now)
+
+    def _append_message(self, role: str, content: str, expert_used: str, expert_version: int) -> ChatMessage:
         """
+        Appends a message to the in-memory context, numbers it and trims the context.
+
+        Returns:
+            ChatMessage: The new message, to persist.
+        """
+        self.chat_context.last_seq += 1
         message = ChatMessage(
             role=role,
             content=content,
             expert_used=expert_used,
             expert_version=expert_version,
-            timestamp=datetime.datetime.now(datetime.timezone.utc)
+            timestamp=datetime.datetime.now(datetime.timezone.utc),
+            seq=self.chat_context.last_seq
         )
         self.chat_context.context.append(message)
 
         # Update token count
-        self.chat_context.token_count += len(content.split())
+        self.chat_context.token_count += message_tokens(message)
 
         # Trim context if token count exceeds max tokens
         self._trim_context()
 
-        # Save the updated conversation to Firestore
-        self.chat_helper.save_conversation(
-            Conversation(
-                conversation_id=self.conversation_id,
-                user_id=self.chat_context.user_id,
-                messages=self.chat_context.context,
-                created_at=self.chat_context.context[0].timestamp if self.chat_context.context else datetime.datetime.now(
-                    datetime.timezone.utc)
-            )
-        )
+        return message
 
     def _trim_context(self):
         """
         Trims the chat context to ensure it stays within the token limit.
+
+        Once over the limit, the context is trimmed in one chunk to TRIM_TARGET_RATIO of it rather than by one
+        message per turn, so the cached summary and older-history prompt blocks stay the same until the next
+        eviction. Trimmed messages are queued for the running summary instead of being dropped.
+        """
+        evicted = evict_oldest_messages(self.chat_context.context, self.chat_context.token_count,
+                                        self.chat_context.max_tokens)
+        if not evicted:
+            return
+        self.chat_context.token_count -= messages_tokens(evicted)
+        with self._evictions_lock:
+            self.pending_evictions.extend(evicted)
+
+    def _take_pending_evictions(self) -> List[ChatMessage]:
+        with self._evictions_lock:
+            evicted, self.pending_evictions = self.pending_evictions, []
+        return evicted
+
+    def schedule_summary_update(self):
+        """
+        Folds any trimmed messages into the running summary on a background worker, off the reply path.
+
+        Updates are queued per conversation on a pool shared by all sessions, so they apply in order.
+        """
+        if self.pending_evictions:
+            _summary_scheduler.submit(self.conversation_id, self.update_summary)
+
+    def update_summary(self):
+        """
+        Folds the trimmed messages into the running summary and persists it.
+
+        The summary and the new window start are saved in one write, so a reload never skips messages the
+        stored summary does not cover. On failure the messages are put back so the next update retries them.
         """
-        while self.chat_context.token_count > self.chat_context.max_tokens:
-            removed_message = self.chat_context.context.pop(0)
-            self.chat_context.token_count -= len(
-                removed_message.content.split())
+        evicted = self._take_pending_evictions()
+        if not evicted:
+            return
+        try:
+            summary = self.history_summarizer.update(self.chat_context.summary, evicted)
+            self.chat_context.summary = summary
+            self.chat_helper.save_summary(self.conversation_id, summary, window_start=evicted[-1].seq + 1)
+        except Exception as e:
+            with self._evictions_lock:
+                self.pending_evictions = evicted + self.pending_evictions
+            self.output_manager.log(f"Failed to update the conversation summary: {e}", level="ERROR")
+
+    def aschedule_summary_update(self):
+        """
+        Async version of `schedule_summary_update`; runs the update as a task on the current event loop.
+
+        A single task drains the queue, so a turn that ends while an update is running leaves its messages
+        for that task instead of starting a second one.
+        """
+        if self.pending_evictions and (self._summary_task is None or self._summary_task.done()):
+            self._summary_task = asyncio.create_task(self.aupdate_summary())
+
+    async def aupdate_summary(self):
+        """
+        Async version of `update_summary`; keeps folding until no trimmed messages are left.
+        """
+        while True:
+            evicted = self._take_pending_evictions()
+            if not evicted:
+                return
+            try:
+                summary = await self.history_summarizer.aupdate(self.chat_context.summary, evicted)
+                self.chat_context.summary = summary
+                await self.chat_helper.asave_summary(self.conversation_id, summary, window_start=evicted[-1].seq + 1)
+            except Exception as e:
+                with self._evictions_lock:
+                    self.pending_evictions = evicted + self.pending_evictions
+                self.output_manager.log(f"Failed to update the conversation summary: {e}", level="ERROR")
+                return
+
+    def iter_older_history(self) -> Iterator[ChatMessage]:
+        """
+        Lazily pages in the stored messages older than the current context, newest first.
+
+        Yields:
+            ChatMessage: The older messages, fetched from Firestore one page at a time as iteration proceeds.
+        """
+        self._ensure_loaded()
+        before_seq = self.chat_context.context[0].seq if self.chat_context.context else self.chat_context.last_seq + 1
+        return self.chat_helper.iter_older_messages(self.conversation_id, before_seq)
 
     def get_serialized_context(self) -> str:
         """
@@ -214,9 +915,13 @@ class ChatApplication:
         Returns:
             str: The current serialized context as a JSON string.
         """
+        return self._serialize_messages(self.chat_context.context)
+
+    @staticmethod
+    def _serialize_messages(messages: List[ChatMessage]) -> str:
         return json.dumps(
             [{"role": msg.role, "content": msg.content}
-                for msg in self.chat_context.context],
+                for msg in messages],
             indent=2
         )
 
@@ -237,8 +942,12 @@ def main():
             break
 
         try:
-            # Use the chat application to generate a response
-            chat_app.chat(user_input)
+            # Stream the response as Claude generates it
+            for i, chunk in enumerate(chat_app.stream_chat(user_input)):
+                if i == 0:
+                    print("\nAssistant 🤖: ", end="")
+                print(chunk, end="", flush=True)
+            print(f"\n-{chat_app.chat_context.current_expert.template_name}")
         except Exception as e:
             print(f"An error occurred: {e}")
 
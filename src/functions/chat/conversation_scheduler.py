@@ -0,0 +1,211 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict
+
+
+class QueueMetrics:
+    def __init__(self):
+        """
+        Tracks queue depth and wait times for work that is serialized per conversation.
+        """
+        self.completed = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_depth = 0
+        self._depths: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def enqueued(self, key: str):
+        with self._lock:
+            self._depths[key] = self._depths.get(key, 0) + 1
+            self.max_depth = max(self.max_depth, self._depths[key])
+
+    def started(self, key: str, wait_seconds: float):
+        with self._lock:
+            self._leave(key)
+            self.completed += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def abandoned(self, key: str):
+        """
+        Records a turn that stopped waiting (e.g. was cancelled) without starting.
+        """
+        with self._lock:
+            self._leave(key)
+
+    def _leave(self, key: str):
+        self._depths[key] -= 1
+        if not self._depths[key]:
+            del self._depths[key]
+
+    def depth(self, key: str) -> int:
+        """
+        Returns:
+            int: The number of turns waiting for a conversation.
+        """
+        with self._lock:
+            return self._depths.get(key, 0)
+
+    def summary(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable queue statistics for logging.
+        """
+        with self._lock:
+            average_wait = self.total_wait_seconds / self.completed if self.completed else 0.0
+            return {
+                "waiting": str(sum(self._depths.values())),
+                "busiest_queue": str(max(self._depths.values(), default=0)),
+                "max_depth": str(self.max_depth),
+                "started": str(self.completed),
+                "average_wait": f"{average_wait:.2f}s",
+                "max_wait": f"{self.max_wait_seconds:.2f}s",
+            }
+
+
+@dataclass
+class _Task:
+    func: Callable[..., Any]
+    args: tuple
+    kwargs: dict
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ConversationScheduler:
+    def __init__(self, max_workers: int = 8, thread_name_prefix: str = "conversation"):
+        """
+        Runs turns for the same conversation strictly in order, and turns for different conversations in
+        parallel on a bounded worker pool.
+
+        Each conversation has its own FIFO queue and at most one worker at a time. A worker runs one turn
+        and then re-queues the conversation, so a busy conversation cannot starve the others.
+
+        Args:
+            max_workers (int): The most turns running at once across all conversations.
+            thread_name_prefix (str): The name prefix of the worker threads.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.metrics = QueueMetrics()
+        self._queues: Dict[str, Deque[_Task]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Queues a turn for a conversation.
+
+        Args:
+            key (str): The conversation ID.
+            func (Callable): The work to run.
+
+        Returns:
+            Future: Resolves to whatever `func` returns.
+        """
+        task = _Task(func, args, kwargs)
+        self.metrics.enqueued(key)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(task)  # A worker is already draining this conversation
+                return task.future
+            self._queues[key] = deque([task])
+        self.executor.submit(self._run_next, key)
+        return task.future
+
+    def depth(self, key: str) -> int:
+        """
+        Returns:
+            int: The number of turns waiting for a conversation, excluding the one running.
+        """
+        return self.metrics.depth(key)
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable scheduler statistics for logging.
+        """
+        stats = self.metrics.summary()
+        with self._lock:
+            stats["active_conversations"] = str(len(self._queues))
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+    def _run_next(self, key: str):
+        with self._lock:
+            task = self._queues[key].popleft()
+        self.metrics.started(key, time.monotonic() - task.enqueued_at)
+
+        if task.future.set_running_or_notify_cancel():
+            try:
+                task.future.set_result(task.func(*task.args, **task.kwargs))
+            except BaseException as e:
+                task.future.set_exception(e)
+
+        with self._lock:
+            if not self._queues[key]:
+                del self._queues[key]
+                return
+        self.executor.submit(self._run_next, key)
+
+
+class AsyncKeyedLock:
+    def __init__(self):
+        """
+        One asyncio lock per conversation, for event-loop callers such as the Telegram bot.
+
+        asyncio.Lock wakes waiters in FIFO order, so turns for a conversation run in the order they arrived,
+        while other conversations proceed concurrently. Locks are dropped once nobody holds or waits on them.
+        """
+        self.metrics = QueueMetrics()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        """
+        Holds the lock for a conversation for the duration of the block.
+
+        Args:
+            key (str): The conversation ID.
+        """
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        self.metrics.enqueued(key)
+        enqueued_at = time.monotonic()
+        started = False
+        try:
+            async with lock:
+                started = True
+                self.metrics.started(key, time.monotonic() - enqueued_at)
+                yield
+        finally:
+            if not started:
+                self.metrics.abandoned(key)
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    def depth(self, key: str) -> int:
+        """
+        Returns:
+            int: The number of turns waiting for a conversation, excluding the one running.
+        """
+        return self.metrics.depth(key)
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable lock statistics for logging.
+        """
+        stats = self.metrics.summary()
+        stats["active_conversations"] = str(len(self._locks))
+        return stats
@@ -0,0 +1,202 @@
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from src.functions.chat.chat_application import ChatApplication
+
+# Rough in-memory cost of a session, used to cap resident memory without walking every object
+SESSION_OVERHEAD_BYTES = 64 * 1024  # ChatApplication and its helpers
+MESSAGE_OVERHEAD_BYTES = 600  # ChatMessage instance, datetime and dict entries
+BYTES_PER_TOKEN = 4
+
+# A session unused for this long counts as resumed, and its foundational context is prefetched again
+RESUME_AFTER_SECONDS = 5 * 60
+
+
+@dataclass
+class ChatSession:
+    app: ChatApplication
+    last_used: float
+    active_turns: int = 0  # Turns running on the app; a busy session is never evicted by the caps or TTL
+
+
+class ChatSessionManager:
+    def __init__(self, max_sessions: int = 100, max_memory_bytes: int = 256 * 1024 * 1024,
+                 idle_ttl_seconds: float = 30 * 60, **app_kwargs: Any):
+        """
+        Keeps one ChatApplication per conversation, so users served by the same process never share a context.
+
+        Sessions are kept in least-recently-used order. A session is evicted when it has been idle for longer
+        than `idle_ttl_seconds`, or when the number of sessions or their estimated memory goes over the caps.
+        Sessions with a turn in progress (see `use`) are skipped. Sessions own no threads (their workers are
+        shared by the process), so evicting only drops the reference. Evicting loses nothing: messages are
+        persisted as they are added, and the next `get` builds a fresh ChatApplication that loads the
+        conversation from Firestore on its first turn. New sessions, and sessions resumed after a quiet period,
+        prefetch their foundational context in the background.
+
+        Args:
+            max_sessions (int): The most sessions kept in memory.
+            max_memory_bytes (int): The most estimated memory used by all sessions.
+            idle_ttl_seconds (float): Sessions unused for this long are evicted.
+            **app_kwargs: Passed to every ChatApplication (e.g., routing_mode, durability).
+        """
+        self.max_sessions = max_sessions
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.app_kwargs = app_kwargs
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, conversation_id: str) -> ChatApplication:
+        """
+        Returns the ChatApplication for a conversation, creating it if it is not resident.
+
+        The returned app is not marked busy, so it may be evicted under the caller; run turns through `use`.
+
+        Args:
+            user_id (str): The owner of the conversation.
+            conversation_id (str): The ID of the conversation.
+
+        Returns:
+            ChatApplication: The session's application.
+        """
+        return self._checkout(user_id, conversation_id, busy=False).app
+
+    @contextmanager
+    def use(self, user_id: str, conversation_id: str) -> Iterator[ChatApplication]:
+        """
+        Yields the ChatApplication for a conversation and keeps the session from being evicted by the caps or
+        TTL until the block exits. Works inside coroutines too, since entering and leaving never block.
+
+        Args:
+            user_id (str): The owner of the conversation.
+            conversation_id (str): The ID of the conversation.
+
+        Yields:
+            ChatApplication: The session's application.
+        """
+        session = self._checkout(user_id, conversation_id, busy=True)
+        try:
+            yield session.app
+        finally:
+            with self._lock:
+                session.active_turns -= 1
+
+    def _checkout(self, user_id: str, conversation_id: str, busy: bool) -> ChatSession:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._resident(conversation_id, now, busy)
+        if session is not None:
+            return session
+
+        # Construction is cheap (the conversation is loaded lazily on the first turn), but it stays outside the
+        # lock so other conversations are never held up by it
+        app = ChatApplication(user_id=user_id, conversation_id=conversation_id, **self.app_kwargs)
+        with self._lock:
+            session = self._resident(conversation_id, now, busy)
+            if session is None:
+                self.misses += 1
+                session = ChatSession(app=app, last_used=now, active_turns=int(busy))
+                self._sessions[conversation_id] = session
+                self._evict_over_capacity(keep=conversation_id)
+            # Otherwise another caller created the session first and this app is simply dropped
+        return session
+
+    def _resident(self, conversation_id: str, now: float, busy: bool) -> Optional[ChatSession]:
+        session = self._sessions.get(conversation_id)
+        if session is None:
+            return None
+        self.hits += 1
+        resumed = now - session.last_used > RESUME_AFTER_SECONDS
+        session.last_used = now
+        session.active_turns += int(busy)
+        self._sessions.move_to_end(conversation_id)
+        if resumed and session.app.prefetch:
+            session.app.prefetch_context()  # Re-warm anything that expired while the chat was quiet
+        return session
+
+    def evict(self, conversation_id: str) -> bool:
+        """
+        Removes a session from memory. A turn in progress finishes on the removed app.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+
+        Returns:
+            bool: True if the session was resident.
+        """
+        with self._lock:
+            return self._sessions.pop(conversation_id, None) is not None
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable session statistics for logging.
+        """
+        with self._lock:
+            return {
+                "sessions": f"{len(self._sessions)} / {self.max_sessions}",
+                "estimated_memory": f"{self._memory_bytes() / (1024 * 1024):.1f} MiB",
+                "hits": str(self.hits),
+                "hydrations": str(self.misses),
+                "evictions": str(self.evictions),
+            }
+
+    @staticmethod
+    def estimate_session_bytes(app: ChatApplication) -> int:
+        """
+        Estimates the memory held by a session from its cached token counts.
+        """
+        context = app.chat_context
+        return (SESSION_OVERHEAD_BYTES
+                + len(context.context) * MESSAGE_OVERHEAD_BYTES
+                + (context.token_count + len(context.summary) // BYTES_PER_TOKEN) * BYTES_PER_TOKEN)
+
+    def _memory_bytes(self) -> int:
+        return sum(self.estimate_session_bytes(session.app) for session in self._sessions.values())
+
+    def _evict_expired(self, now: float):
+        self._evict_idle(lambda session: now - session.last_used > self.idle_ttl_seconds)
+
+    def _evict_over_capacity(self, keep: str):
+        self._evict_idle(
+            lambda session: len(self._sessions) > self.max_sessions or self._memory_bytes() > self.max_memory_bytes,
+            keep=keep)
+
+    def _evict_idle(self, should_evict: Callable[[ChatSession], bool], keep: Optional[str] = None):
+        """
+        Evicts sessions in least-recently-used order while `should_evict` holds, skipping busy ones.
+        """
+        for conversation_id, session in list(self._sessions.items()):
+            if conversation_id == keep or session.active_turns > 0:
+                continue
+            if not should_evict(session):
+                break
+            del self._sessions[conversation_id]
+            self.evictions += 1
+
+
+def telegram_session_ids(chat_id: int, owner_chat_id: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Maps a Telegram chat to the user and conversation IDs of its session.
+
+    The owner's chat keeps the original "g" user and "g_telegram_chat" conversation; every other chat gets
+    its own user and conversation. Without an owner chat ID there is no way to tell the owner apart, so every
+    chat keeps the original single-session mapping rather than cutting the owner off from their history.
+
+    Args:
+        chat_id (int): The Telegram chat ID.
+        owner_chat_id (Optional[str]): The owner's Telegram chat ID (TELEGRAM_OWNER_CHAT_ID), if configured.
+
+    Returns:
+        Tuple[str, str]: The user ID and the conversation ID.
+    """
+    if not owner_chat_id or str(chat_id) == str(owner_chat_id):
+        return "g", "g_telegram_chat"
+    return f"telegram_{chat_id}", f"telegram_{chat_id}_chat"
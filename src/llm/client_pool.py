@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+from typing import Dict, Optional, Tuple
+from langchain_anthropic import ChatAnthropic
+from src.utils.timing import TurnDeadline
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
+# Upper bound for a single Anthropic request, so a hung connection cannot hold a turn indefinitely
+REQUEST_TIMEOUT_SECONDS = 60.0
+# Even past the turn deadline a call gets this long, so a cached-prefix call that is nearly done can finish
+MIN_REQUEST_TIMEOUT_SECONDS = 1.0
+# The Anthropic SDK default. Deadline-bound clients use 0: each retry restarts the full timeout
+DEFAULT_MAX_RETRIES = 2
+
+
+class LLMClientPool:
+    def __init__(self):
+        """
+        A process-wide registry of ChatAnthropic clients keyed by (model, temperature, max_retries).
+
+        Every ChatAnthropic instance owns its own Anthropic HTTP client, so building one per call
+        throws away HTTP keep-alive connections and TLS sessions. Handing out one long-lived instance
+        per key lets every stage (expert selection, routing, tool selection, generation) reuse the
+        same connection pool. The underlying sync and async Anthropic clients are safe to share
+        across threads and asyncio tasks; the lock only guards the registry itself.
+        """
+        self._clients: Dict[Tuple[str, float, int], ChatAnthropic] = {}
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.clients_reused = 0
+        self.setup_seconds = 0.0  # Total time spent constructing clients
+
+    def get(self, model: str = DEFAULT_MODEL, temperature: float = 0.7,
+            max_retries: int = DEFAULT_MAX_RETRIES) -> ChatAnthropic:
+        """
+        Returns the shared client for a model, temperature and retry count, creating it on first use.
+
+        Args:
+            model (str): The Claude model name.
+            temperature (float): The sampling temperature.
+            max_retries (int): How often the SDK retries a failed or timed-out request.
+
+        Returns:
+            ChatAnthropic: A long-lived client that can be shared across threads and tasks.
+        """
+        key = (model, round(float(temperature), 3), max_retries)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.clients_reused += 1
+                return client
+
+            start = time.perf_counter()
+            client = ChatAnthropic(
+                model=model,
+                temperature=key[1],
+                anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
+                default_request_timeout=REQUEST_TIMEOUT_SECONDS,
+                max_retries=max_retries,
+            )
+            self.setup_seconds += time.perf_counter() - start
+            self.clients_created += 1
+            self._clients[key] = client
+            return client
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Reports how many clients were built and reused.
+
+        `construction_time_saved` only covers building the ChatAnthropic objects; connection and TLS reuse
+        happen inside the shared HTTP clients and are not measured here.
+
+        Returns:
+            Dict[str, str]: Human-readable pool statistics for logging.
+        """
+        with self._lock:
+            average_setup = self.setup_seconds / self.clients_created if self.clients_created else 0.0
+            return {
+                "clients": str(len(self._clients)),
+                "created": str(self.clients_created),
+                "reused": str(self.clients_reused),
+                "construction_time_saved": f"{average_setup * self.clients_reused:.3f}s",
+            }
+
+
+# Shared by every stage in the process
+llm_client_pool = LLMClientPool()
+
+
+def request_timeout(deadline: Optional[TurnDeadline]) -> float:
+    """
+    Returns the timeout for an LLM call made before generation: what is left of the turn deadline, capped
+    by REQUEST_TIMEOUT_SECONDS. Pass it as `timeout=` to `invoke`/`ainvoke` on a client from
+    `get_chat_model(..., deadline=deadline)`, which does not retry past it.
+
+    Args:
+        deadline (Optional[TurnDeadline]): The turn deadline; None leaves the client's default timeout.
+
+    Returns:
+        float: The timeout in seconds.
+    """
+    if deadline is None:
+        return REQUEST_TIMEOUT_SECONDS
+    return max(MIN_REQUEST_TIMEOUT_SECONDS, deadline.budget(REQUEST_TIMEOUT_SECONDS))
+
+
+def get_chat_model(model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                   deadline: Optional[TurnDeadline] = None) -> ChatAnthropic:
+    """
+    Returns the shared ChatAnthropic client for the given model and temperature.
+
+    Args:
+        model (str): The Claude model name.
+        temperature (float): The sampling temperature.
+        deadline (Optional[TurnDeadline]): Set for calls bounded by the turn deadline. Their client does not
+            retry, so a call given `request_timeout(deadline)` gives up within that time.
+
+    Returns:
+        ChatAnthropic: The pooled client.
+    """
+    max_retries = DEFAULT_MAX_RETRIES if deadline is None else 0
+    return llm_client_pool.get(model, temperature, max_retries)
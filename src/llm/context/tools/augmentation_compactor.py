@@ -0,0 +1,320 @@
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+from src.llm.token_accounting import estimate_tokens
+
+# Default token budget for all tool outputs in one prompt
+MAX_AUGMENTATION_TOKENS = 6000
+
+# WHOOP columns: (column, path into the record, transform). Records come newest first from the API.
+_WHOOP_COLUMNS: Dict[str, List[Tuple[str, str, str]]] = {
+    "sleep": [
+        ("start", "start", "time"),
+        ("nap", "nap", ""),
+        ("performance_pct", "score.sleep_performance_percentage", ""),
+        ("efficiency_pct", "score.sleep_efficiency_percentage", ""),
+        ("consistency_pct", "score.sleep_consistency_percentage", ""),
+        ("in_bed_h", "score.stage_summary.total_in_bed_time_milli", "hours"),
+        ("awake_h", "score.stage_summary.total_awake_time_milli", "hours"),
+        ("light_h", "score.stage_summary.total_light_sleep_time_milli", "hours"),
+        ("deep_h", "score.stage_summary.total_slow_wave_sleep_time_milli", "hours"),
+        ("rem_h", "score.stage_summary.total_rem_sleep_time_milli", "hours"),
+        ("disturbances", "score.stage_summary.disturbance_count", ""),
+        ("respiratory_rate", "score.respiratory_rate", ""),
+        ("need_h", "score.sleep_needed.baseline_milli", "hours"),
+    ],
+    "recovery": [
+        ("date", "created_at", "date"),
+        ("recovery_pct", "score.recovery_score", ""),
+        ("resting_hr", "score.resting_heart_rate", ""),
+        ("hrv_ms", "score.hrv_rmssd_milli", ""),
+        ("spo2_pct", "score.spo2_percentage", ""),
+        ("skin_temp_c", "score.skin_temp_celsius", ""),
+    ],
+    "workout": [
+        ("start", "start", "time"),
+        ("end", "end", "time"),
+        ("sport_id", "sport_id", ""),
+        ("strain", "score.strain", ""),
+        ("avg_hr", "score.average_heart_rate", ""),
+        ("max_hr", "score.max_heart_rate", ""),
+        ("kilojoule", "score.kilojoule", ""),
+        ("distance_m", "score.distance_meter", ""),
+    ],
+    "cycle": [
+        ("start", "start", "time"),
+        ("end", "end", "time"),
+        ("strain", "score.strain", ""),
+        ("kilojoule", "score.kilojoule", ""),
+        ("avg_hr", "score.average_heart_rate", ""),
+        ("max_hr", "score.max_heart_rate", ""),
+    ],
+}
+
+# Static explanations that do not change between turns and add little to an answer
+_PERSONALITY_DROP_FIELDS = {"description"}
+
+
+@dataclass
+class CompactedAugmentation:
+    text: str
+    raw_tokens: int  # What the outputs would have cost serialized as indented JSON
+    compacted_tokens: int
+    truncated_tools: List[str]
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.compacted_tokens)
+
+
+class AugmentationCompactor:
+    def __init__(self):
+        """
+        Shrinks tool outputs before they go into the generation prompt.
+
+        Each tool has a reducer (field projection, unit conversion, rounding, dropping empty values) and
+        lists of uniform records are encoded as a table instead of repeated JSON keys. The sections are then
+        fitted into a token budget: small sections are kept whole and the largest ones are cut to an equal
+        share of what is left, dropping their oldest rows first.
+        """
+        self.turns = 0
+        self.raw_tokens = 0
+        self.compacted_tokens = 0
+        self.truncations = 0
+        self._lock = threading.Lock()
+
+    def compact(self, tool_outputs: List[Any], max_tokens: int = MAX_AUGMENTATION_TOKENS) -> CompactedAugmentation:
+        """
+        Reduces and encodes tool outputs, fitting them into a token budget.
+
+        Args:
+            tool_outputs (List[ToolResponse]): The executed tools, in plan order.
+            max_tokens (int): The token budget for all sections together.
+
+        Returns:
+            CompactedAugmentation: The prompt text and the token accounting.
+        """
+        raw_tokens = sum(estimate_tokens(json.dumps(tool.to_dict(), indent=2, default=str)) for tool in tool_outputs)
+        sections = [self._section(tool) for tool in tool_outputs]
+        sections, truncated = _fit_sections(sections, max_tokens)
+        text = "\n\n".join(sections)
+        result = CompactedAugmentation(text, raw_tokens, estimate_tokens(text), truncated)
+
+        with self._lock:
+            self.turns += 1
+            self.raw_tokens += result.raw_tokens
+            self.compacted_tokens += result.compacted_tokens
+            self.truncations += len(truncated)
+        return result
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable compaction statistics for logging.
+        """
+        with self._lock:
+            saved = max(0, self.raw_tokens - self.compacted_tokens)
+            return {
+                "turns": str(self.turns),
+                "raw_tokens": str(self.raw_tokens),
+                "compacted_tokens": str(self.compacted_tokens),
+                "saved": f"{saved} ({saved / self.raw_tokens:.0%})" if self.raw_tokens else "0",
+                "truncated_sections": str(self.truncations),
+            }
+
+    @staticmethod
+    def _section(tool: Any) -> str:
+        params = ", ".join(f"{key}={value}" for key, value in (tool.params or {}).items())
+        header = f"### {tool.tool_name}" + (f" ({params})" if params else "")
+        reducer = TOOL_REDUCERS.get(tool.tool_name, reduce_generic)
+        try:
+            body = reducer(tool.output)
+        except Exception:
+            body = reduce_generic(tool.output)  # Unexpected shapes (e.g. error strings) still get through
+        return f"{header}\n{body}"
+
+
+def reduce_generic(output: Any) -> str:
+    """
+    Drops empty values, rounds floats and encodes the result as a table or minified JSON.
+    """
+    cleaned = _clean(output)
+    if isinstance(cleaned, str):
+        return cleaned
+    if _is_table(cleaned):
+        return encode_table(cleaned)
+    return json.dumps(cleaned, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def encode_table(rows: List[Dict[str, Any]]) -> str:
+    """
+    Encodes uniform records as a header line and one "|"-separated line per record.
+
+    Args:
+        rows (List[Dict[str, Any]]): Flat records.
+
+    Returns:
+        str: The table.
+    """
+    columns: List[str] = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    lines = ["|".join(columns)]
+    for row in rows:
+        lines.append("|".join(_cell(row.get(column)) for column in columns))
+    return "\n".join(lines)
+
+
+def _whoop_reducer(data_type: str) -> Callable[[Any], str]:
+    columns = _WHOOP_COLUMNS[data_type]
+
+    def reduce(output: Any) -> str:
+        if not isinstance(output, list):
+            return reduce_generic(output)
+        rows = []
+        for record in output:
+            row = {}
+            for column, path, transform in columns:
+                value = _transform(_get_path(record, path), transform)
+                if value is not None:
+                    row[column] = value
+            rows.append(row)
+        return encode_table(rows) if rows else "No records."
+    return reduce
+
+
+def _reduce_journal(output: Any) -> str:
+    if not isinstance(output, list):
+        return reduce_generic(output)
+    entries = []
+    for entry in output:
+        lines = str(entry).splitlines()
+        kept = []
+        for i, line in enumerate(lines):
+            if line.startswith("JournalingQuestion:") and i + 1 < len(lines) \
+                    and lines[i + 1] == "UserAnswer: user did not answer":
+                continue  # Skip unanswered questions
+            if line == "UserAnswer: user did not answer" or (line == "---" and kept and kept[-1] == "---"):
+                continue
+            kept.append(line.replace("JournalingQuestion: ", "Q: ").replace("UserAnswer: ", "A: "))
+        entries.append("\n".join(kept).strip())
+    return "\n\n".join(entries)
+
+
+def _reduce_personality(output: Any) -> str:
+    if isinstance(output, list):
+        output = [{k: v for k, v in metric.items() if k not in _PERSONALITY_DROP_FIELDS} if isinstance(metric, dict)
+                  else metric for metric in output]
+    elif isinstance(output, dict):
+        output = {name: ({k: v for k, v in metric.items() if k not in _PERSONALITY_DROP_FIELDS}
+                         if isinstance(metric, dict) else metric) for name, metric in output.items()}
+    return reduce_generic(output)
+
+
+TOOL_REDUCERS: Dict[str, Callable[[Any], str]] = {
+    "WHOOP Data - Sleep": _whoop_reducer("sleep"),
+    "WHOOP Data - Recovery": _whoop_reducer("recovery"),
+    "WHOOP Data - Workout": _whoop_reducer("workout"),
+    "WHOOP Data - Cycle": _whoop_reducer("cycle"),
+    "Morning Journaling Exercises": _reduce_journal,
+    "Read Personality Profile": _reduce_personality,
+}
+
+
+def _fit_sections(sections: List[str], max_tokens: int) -> Tuple[List[str], List[str]]:
+    """
+    Fits sections into the budget: the smallest keep everything, the rest share what is left equally.
+    """
+    sizes = [estimate_tokens(section) for section in sections]
+    if sum(sizes) <= max_tokens:
+        return sections, []
+
+    fitted = list(sections)
+    truncated = []
+    remaining = max_tokens
+    order = sorted(range(len(sections)), key=lambda i: sizes[i])
+    for position, index in enumerate(order):
+        share = remaining // (len(order) - position)
+        if sizes[index] > share:
+            fitted[index] = _truncate(sections[index], share)
+            truncated.append(sections[index].split("\n", 1)[0].lstrip("# "))
+        remaining -= min(sizes[index], share)
+    return fitted, truncated
+
+
+def _truncate(section: str, max_tokens: int) -> str:
+    # Keep the header (and table header), then as many leading lines as fit; records are newest first
+    lines = section.split("\n")
+    kept, used, partial = [], 0, False
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > max_tokens:
+            if not kept[1:]:
+                # A single long line: keep a proportional prefix, and count the line as truncated
+                characters = max(0, (max_tokens - used) * 3)
+                kept.append(line[:characters])
+                partial = True
+            break
+        kept.append(line)
+        used += tokens
+    dropped = len(lines) - len(kept) + partial
+    if dropped > 0:
+        kept.append(f"[truncated: {dropped} more lines]")
+    return "\n".join(kept)
+
+
+def _clean(value: Any) -> Any:
+    if isinstance(value, dict):
+        cleaned = {key: _clean(item) for key, item in value.items()}
+        return {key: item for key, item in cleaned.items() if not _is_empty(item)}
+    if isinstance(value, list):
+        return [item for item in (_clean(item) for item in value) if not _is_empty(item)]
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _is_table(value: Any) -> bool:
+    return (isinstance(value, list) and len(value) > 1 and all(isinstance(row, dict) for row in value)
+            and all(not isinstance(item, (dict, list)) for row in value for item in row.values()))
+
+
+def _get_path(record: Any, path: str) -> Any:
+    for key in path.split("."):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def _transform(value: Any, transform: str) -> Any:
+    if value is None:
+        return None
+    if transform == "hours":
+        return round(value / 3_600_000, 2)
+    if transform == "time":
+        return str(value)[:16].replace("T", " ")
+    if transform == "date":
+        return str(value)[:10]
+    if isinstance(value, float):
+        return round(value, 1)
+    return value
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "y" if value else "n"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+# Shared by every conversation in the process
+augmentation_compactor = AugmentationCompactor()
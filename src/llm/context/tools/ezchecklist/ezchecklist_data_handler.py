@@ -3,6 +3,7 @@ from dotenv import load_dotenv
 import gspread
 from google.oauth2.service_account import Credentials
 import os
+from src.utils.timing import REQUEST_TIMEOUT
 
 # Load environment variables
 load_dotenv()
@@ -11,11 +12,16 @@ load_dotenv()
 scopes = ["https://www.googleapis.com/auth/spreadsheets"]
 creds = Credentials.from_service_account_file("secrets/google_sheets_service_key.json", scopes=scopes)
 client = gspread.authorize(creds)
+client.set_timeout(REQUEST_TIMEOUT)
 
-# Fetch Google Sheet data
 sheet_id = os.getenv("EZCHECKLIST_GSHEET_ID")
-sheet = client.open_by_key(sheet_id).sheet1
-values_list = sheet.get_all_values()
+
+def fetch_sheet_values():
+    """
+    Fetches the checklist sheet. Called per tool run (results are cached by the tool layer), so the sheet is
+    no longer downloaded at import time and a slow fetch is bounded by the request timeout.
+    """
+    return client.open_by_key(sheet_id).sheet1.get_all_values()
 
 def strip_emojis(text):
     """
@@ -95,7 +101,7 @@ def get_ezchecklist_data_for_days(n):
     :return: List of dictionaries for the most recent n days.
     """
     # Clean and trim the data
-    cleaned_data = trim_data(values_list)
+    cleaned_data = trim_data(fetch_sheet_values())
     
     # Format the cleaned data into a list of dictionaries
     formatted_data = format_to_dict(cleaned_data)
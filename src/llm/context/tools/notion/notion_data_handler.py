@@ -1,7 +1,9 @@
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
+from src.utils.timing import REQUEST_TIMEOUT
 # Load environment variables
 load_dotenv()
 
@@ -10,6 +12,8 @@ NOTION_API_KEY = os.getenv("NOTION_INTEGRATION_SECRET")
 DATABASE_ID = os.getenv("NOTION_DATABASE_ID")
 NOTION_VERSION = "2022-06-28"
 BASE_URL = "https://api.notion.com/v1"
+# Journal pages fetched at once (Notion allows about three requests per second on average)
+NOTION_FETCH_WORKERS = 4
 
 if not NOTION_API_KEY:
     raise ValueError("NOTION_INTEGRATION_SECRET is not set in the environment variables.")
@@ -29,7 +33,7 @@ def query_most_recent_entry():
         ],
         "page_size": 1
     }
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = requests.post(url, headers=HEADERS, json=payload, timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
         raise Exception(f"Failed to query Notion database: {response.status_code}, {response.text}")
     data = response.json()
@@ -40,7 +44,7 @@ def query_most_recent_entry():
 
 def retrieve_page_content(page_id):
     url = f"{BASE_URL}/blocks/{page_id}/children"
-    response = requests.get(url, headers=HEADERS)
+    response = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
         raise Exception(f"Failed to retrieve page content: {response.status_code}, {response.text}")
     data = response.json()
@@ -48,7 +52,7 @@ def retrieve_page_content(page_id):
 
 def retrieve_child_blocks(block_id):
     url = f"{BASE_URL}/blocks/{block_id}/children"
-    response = requests.get(url, headers=HEADERS)
+    response = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
     if response.status_code != 200:
         raise Exception(f"Failed to retrieve child blocks: {response.status_code}, {response.text}")
     data = response.json()
@@ -86,7 +90,7 @@ def get_entries_with_content_for_n_days(n):
         ]
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = requests.post(url, headers=HEADERS, json=payload, timeout=REQUEST_TIMEOUT)
 
     if response.status_code != 200:
         raise Exception(f"Failed to query Notion database: {response.status_code}, {response.text}")
@@ -97,70 +101,71 @@ def get_entries_with_content_for_n_days(n):
     if not results:
         return []  # Return an empty list if no entries are found
 
-    # Fetch and process each entry
-    formatted_entries = []
+    # Fetch and process the entries side by side; each needs its own block requests
+    with ThreadPoolExecutor(max_workers=NOTION_FETCH_WORKERS, thread_name_prefix="notion") as executor:
+        return list(executor.map(_format_journal_entry, results))
 
-    for entry in results:
-        page_id = entry["id"]
-        page_content = retrieve_page_content(page_id)
 
-        # Start with metadata
-        formatted_entry = f"# {entry['properties']['Name']['title'][0]['plain_text']} | Created: {entry['properties']['Created']['created_time']}\n"
-
-        def process_blocks(blocks, output):
-            """
-            Processes blocks to extract journaling questions and answers in a formatted manner.
-            """
-            last_question = None
-
-            for block in blocks:
-                block_type = block.get("type")
-
-                # Heading 2 as a journaling question
-                if block_type == "heading_2":
-                    # Handle unanswered question
-                    if last_question is not None:
-                        output += "UserAnswer: user did not answer\n"
-
-                    text = block["heading_2"]["rich_text"]
-                    question = "".join([t["plain_text"] for t in text]).strip()
-                    output += f"JournalingQuestion: {question}\n"
-                    last_question = question
-
-                # Paragraph as an answer
-                elif block_type == "paragraph" and last_question is not None:
-                    text = block["paragraph"]["rich_text"]
-                    answer = "".join([t["plain_text"] for t in text]).strip()
-                    output += f"UserAnswer: {answer or 'user did not answer'}\n"
-                    last_question = None
+def _format_journal_entry(entry):
+    """
+    Retrieves one journal entry's content and formats it as labeled markdown-like output.
+    """
+    page_id = entry["id"]
+    page_content = retrieve_page_content(page_id)
+
+    # Start with metadata
+    formatted_entry = f"# {entry['properties']['Name']['title'][0]['plain_text']} | Created: {entry['properties']['Created']['created_time']}\n"
 
-                # Process nested blocks in column_list
-                elif block_type == "column_list":
-                    children = retrieve_child_blocks(block["id"])
-                    for child in children:
-                        child_blocks = retrieve_child_blocks(child["id"])
-                        output = process_blocks(child_blocks, output)
+    def process_blocks(blocks, output):
+        """
+        Processes blocks to extract journaling questions and answers in a formatted manner.
+        """
+        last_question = None
 
-                # Divider
-                elif block_type == "divider":
-                    if last_question is not None:
-                        output += "UserAnswer: user did not answer\n"
-                        last_question = None
-                    output += "---\n"
+        for block in blocks:
+            block_type = block.get("type")
+
+            # Heading 2 as a journaling question
+            if block_type == "heading_2":
+                # Handle unanswered question
+                if last_question is not None:
+                    output += "UserAnswer: user did not answer\n"
+
+                text = block["heading_2"]["rich_text"]
+                question = "".join([t["plain_text"] for t in text]).strip()
+                output += f"JournalingQuestion: {question}\n"
+                last_question = question
 
-            # Handle any remaining unanswered question
-            if last_question is not None:
-                output += "UserAnswer: user did not answer\n"
+            # Paragraph as an answer
+            elif block_type == "paragraph" and last_question is not None:
+                text = block["paragraph"]["rich_text"]
+                answer = "".join([t["plain_text"] for t in text]).strip()
+                output += f"UserAnswer: {answer or 'user did not answer'}\n"
+                last_question = None
+
+            # Process nested blocks in column_list
+            elif block_type == "column_list":
+                children = retrieve_child_blocks(block["id"])
+                for child in children:
+                    child_blocks = retrieve_child_blocks(child["id"])
+                    output = process_blocks(child_blocks, output)
+
+            # Divider
+            elif block_type == "divider":
+                if last_question is not None:
+                    output += "UserAnswer: user did not answer\n"
+                    last_question = None
+                output += "---\n"
 
-            return output
+        # Handle any remaining unanswered question
+        if last_question is not None:
+            output += "UserAnswer: user did not answer\n"
 
-        # Process content
-        formatted_entry = process_blocks(page_content, formatted_entry)
+        return output
 
-        # Append the formatted entry
-        formatted_entries.append(formatted_entry)
+    # Process content
+    return process_blocks(page_content, formatted_entry)
 
-    return formatted_entries
 
 def get_far_horizon_context():
     """
@@ -185,7 +190,7 @@ def get_far_horizon_context():
             ],
             "page_size": 1
         }
-        response = requests.post(url, headers=HEADERS, json=payload)
+        response = requests.post(url, headers=HEADERS, json=payload, timeout=REQUEST_TIMEOUT)
         if response.status_code != 200:
             raise Exception(f"Failed to query Notion database: {response.status_code}, {response.text}")
 
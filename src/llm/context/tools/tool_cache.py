@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Set
+
+
+@dataclass
+class CachedToolResult:
+    output: Any
+    stored_at: float  # Wall-clock time, so entries stay meaningful in the disk tier across restarts
+
+
+class ToolResultCache:
+    def __init__(self, disk_dir: Optional[str] = None, refresh_workers: int = 2):
+        """
+        Caches tool outputs by tool name, user and params, with a TTL per tool and stale-while-revalidate.
+
+        A result younger than the tool's TTL is served as is. A result past its TTL but within the tool's
+        stale window is still served, and a background refresh replaces it for the next turn. Anything older
+        is fetched again while the caller waits. Errors are never cached. Concurrent misses for the same key
+        share one run, so a turn that needs a result a prefetch is already fetching waits for that fetch.
+
+        Each key has a generation that `invalidate` bumps. A run (or background refresh) that started before
+        an invalidation finishes without storing its result, so data read before a write never lands in the
+        cache after it.
+
+        Args:
+            disk_dir (Optional[str]): If set, results are also kept as JSON files in this directory, so they
+                survive restarts and can be invalidated from other processes.
+            refresh_workers (int): Threads used for background refreshes.
+        """
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._entries: Dict[str, CachedToolResult] = {}
+        self._refreshing: Set[str] = set()
+        self._in_flight: Dict[str, Future] = {}
+        self._generations: Dict[str, int] = {}  # Only keys that were invalidated; the rest are at 0
+        self._lock = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="tool-refresh")
+
+    @staticmethod
+    def make_key(tool_name: str, user_id: str, params: Dict[str, Any]) -> str:
+        return f"{tool_name}|{user_id}|{json.dumps(params or {}, sort_keys=True, default=str)}"
+
+    def get_or_run(self, tool_name: str, user_id: str, params: Dict[str, Any], run: Callable[[], Any],
+                   ttl_seconds: float, stale_seconds: float = 0.0) -> Any:
+        """
+        Returns the cached output of a tool call, running it when there is no usable result.
+
+        Args:
+            tool_name (str): The tool name.
+            user_id (str): The user whose data the tool returns; users never share entries.
+            params (Dict[str, Any]): The tool params.
+            run (Callable[[], Any]): Runs the tool; exceptions propagate and nothing is cached.
+            ttl_seconds (float): How long a result is fresh.
+            stale_seconds (float): How much longer a stale result may be served while it is refreshed.
+
+        Returns:
+            Any: The tool output.
+        """
+        key = self.make_key(tool_name, user_id, params)
+        entry = self._lookup(key)
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age <= ttl_seconds:
+                with self._lock:
+                    self.hits += 1
+                return entry.output
+            if age <= ttl_seconds + stale_seconds:
+                with self._lock:
+                    self.stale_hits += 1
+                self._refresh_in_background(key, run)
+                return entry.output
+
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                self.misses += 1
+                in_flight = self._in_flight[key] = Future()
+                generation = self._generations.get(key, 0)
+                owner = True
+            else:
+                self.joined += 1
+                owner = False
+        if not owner:
+            return in_flight.result()  # Another caller is already running this tool
+
+        try:
+            output = run()
+            self._store(key, output, generation)
+            in_flight.set_result(output)
+            return output
+        except BaseException as e:
+            in_flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is in_flight:  # An invalidation may have detached it already
+                    del self._in_flight[key]
+
+    def invalidate(self, tool_name: str, user_id: Optional[str] = None,
+                   params: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Drops cached results of a tool, e.g. after the data behind it was written.
+
+        Args:
+            tool_name (str): The tool name.
+            user_id (Optional[str]): Only drop this user's results; None drops them for every user.
+            params (Optional[Dict[str, Any]]): Only drop the result for these params (requires `user_id`).
+
+        Returns:
+            int: The number of in-memory entries dropped.
+        """
+        prefix = f"{tool_name}|" if user_id is None else f"{tool_name}|{user_id}|"
+        exact = self.make_key(tool_name, user_id, params) if user_id is not None and params is not None else None
+
+        def matches(key: str) -> bool:
+            return key == exact or (exact is None and key.startswith(prefix))
+
+        with self._lock:
+            keys = [key for key in self._entries if matches(key)]
+            for key in keys:
+                del self._entries[key]
+            # Runs already started read the old data: they must not store it, and new callers must not join them
+            for key in {key for key in list(self._in_flight) + list(self._refreshing) if matches(key)}:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._in_flight.pop(key, None)
+
+        if self.disk_dir:
+            if exact is not None:
+                paths = [self._disk_path(exact)]
+            else:
+                file_prefix = f"{self._slug(tool_name)}__" + (f"{self._slug(user_id)}__" if user_id is not None else "")
+                paths = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir)
+                         if name.startswith(file_prefix)]
+            for path in paths:
+                self._remove_path(path)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable cache statistics for logging.
+        """
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.joined
+            return {
+                "entries": str(len(self._entries)),
+                "hits": str(self.hits),
+                "stale_hits": str(self.stale_hits),
+                "misses": str(self.misses),
+                "joined_in_flight": str(self.joined),
+                "hit_rate": f"{(self.hits + self.stale_hits) / lookups:.0%}" if lookups else "n/a",
+                "background_refreshes": str(self.refreshes),
+                "refresh_failures": str(self.refresh_failures),
+            }
+
+    def _lookup(self, key: str) -> Optional[CachedToolResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.disk_dir:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._entries.setdefault(key, entry)
+        return entry
+
+    def _store(self, key: str, output: Any, generation: int):
+        entry = CachedToolResult(output=output, stored_at=time.time())
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return  # Invalidated while the tool was running
+            self._entries[key] = entry
+        if self.disk_dir:
+            self._write_disk(key, entry)
+            with self._lock:
+                invalidated = self._generations.get(key, 0) != generation
+            if invalidated:  # The invalidation ran while the file was being written
+                self._remove_disk(key)
+
+    def _refresh_in_background(self, key: str, run: Callable[[], Any]):
+        with self._lock:
+            if key in self._refreshing:
+                return  # One refresh per key at a time
+            self._refreshing.add(key)
+            generation = self._generations.get(key, 0)
+
+        def refresh():
+            try:
+                self._store(key, run(), generation)
+                with self._lock:
+                    self.refreshes += 1
+            except Exception:
+                with self._lock:
+                    self.refresh_failures += 1  # Keep serving the stale result
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_executor.submit(refresh)
+
+    @staticmethod
+    def _slug(tool_name: str) -> str:
+        return re.sub(r"[^A-Za-z0-9]+", "_", tool_name).strip("_").lower()
+
+    def _disk_path(self, key: str) -> str:
+        tool_name, user_id, _ = key.split("|", 2)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.disk_dir, f"{self._slug(tool_name)}__{self._slug(user_id)}__{digest}.json")
+
+    def _read_disk(self, key: str) -> Optional[CachedToolResult]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data.get("key") != key:
+            return None
+        return CachedToolResult(output=data["output"], stored_at=data["stored_at"])
+
+    def _remove_disk(self, key: str):
+        self._remove_path(self._disk_path(key))
+
+    @staticmethod
+    def _remove_path(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _write_disk(self, key: str, entry: CachedToolResult):
+        try:
+            payload = json.dumps({"key": key, "stored_at": entry.stored_at, "output": entry.output})
+        except TypeError:
+            return  # Not JSON-serializable; keep it in memory only
+        path = self._disk_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(payload)
+        os.replace(temp_path, path)  # Readers never see a half-written file
+
+
+# Shared by every conversation in the process; set TOOL_CACHE_DIR to enable the on-disk tier
+tool_result_cache = ToolResultCache(disk_dir=os.getenv("TOOL_CACHE_DIR"))
@@ -1,22 +1,32 @@
 # tool_handler.py
 import os
+import time
 import json
-from typing import Dict, Any, List
-from src.llm.context.tools.ezchecklist.ezchecklist_data_handler import get_ezchecklist_data_for_days
-from src.llm.context.tools.whoop.token_manager import WhoopTokenManager
-from src.llm.context.tools.whoop.whoop_data_fetcher import WhoopDataFetcher
-from src.llm.context.tools.notion.notion_data_handler import get_entries_with_content_for_n_days, get_far_horizon_context
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional
 from src.interface.output_manager import OutputManager  # Add this import
-from src.utils.firebase.firebase_init import firestore_client
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage
-from src.llm.context.tools.tool_implementations.get_basic_user_info import get_basic_user_info
+from src.llm.context.tools.tool_registry import OWNER_USER_ID, tool_registry
+from src.llm.context.tools.tool_cache import tool_result_cache
+from src.llm.context.tools.tool_plan import PLAN_TOOL_NAME, default_params, plan_from_response, plan_tools_schema
+from src.llm.context.tools.tool_preselector import FOUNDATIONAL_TOOLS
+from src.llm.context.tools.tool_usage import Speculation, tool_usage
+from functools import lru_cache
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from src.llm.client_pool import get_chat_model, request_timeout
+from src.llm.prompt_cache import cached_block, record_cache_usage
+from src.utils.timing import TurnDeadline
 
 class ToolResponse:
-    def __init__(self, tool_name: str, params: Dict[str, Any], output: Any):
+    def __init__(self, tool_name: str, params: Dict[str, Any], output: Any, started_at: float = 0.0,
+                 finished_at: float = 0.0, timed_out: bool = False):
         self.tool_name = tool_name
         self.params = params
         self.output = output
+        # Seconds since the batch of tools started; kept out of to_dict so they never reach the prompt
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.timed_out = timed_out
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert ToolResponse to a dictionary for JSON serialization."""
@@ -26,120 +36,301 @@ class ToolResponse:
             "output": self.output
         }
 
+# Tools are I/O bound (HTTP APIs, Firestore), so they run side by side on a shared, bounded pool
+MAX_TOOL_WORKERS = 6
+_tool_executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tool")
+# Prefetch and speculation run on their own pool, so background work never delays the tools a turn waits on
+MAX_BACKGROUND_TOOL_WORKERS = 3
+_background_tool_executor = ThreadPoolExecutor(max_workers=MAX_BACKGROUND_TOOL_WORKERS,
+                                               thread_name_prefix="tool-background")
+
+# Fallback for tools without a registered timeout (e.g. unknown tool names, which return immediately anyway)
+DEFAULT_TOOL_TIMEOUT_SECONDS = 15.0
+# Even past the deadline a tool gets this long, so cached results still make it into the prompt
+MIN_TOOL_BUDGET_SECONDS = 0.25
+
+# Speculation: only tools a user selects this often, that are not "heavy" and usually finish this fast
+SPECULATION_MIN_PROBABILITY = 0.5
+SPECULATION_MAX_LATENCY_SECONDS = 5.0
+MAX_SPECULATIVE_TOOLS = 3
+
 # Real implementations of tool functions
 
-def execute_tools(raw_tool_choices: str, output_manager: OutputManager) -> List[ToolResponse]:
+def execute_tools(raw_tool_choices: str, output_manager: OutputManager,
+                  deadline: Optional[TurnDeadline] = None, user_id: str = OWNER_USER_ID) -> List[ToolResponse]:
     """
     Executes a list of tools with their respective parameters, taking in raw JSON input.
 
+    The tools run concurrently, so the batch takes about as long as its slowest tool. Results are returned
+    in the order the tools were chosen, and a failing tool only affects its own result.
+
+    Each tool gets its registered timeout, capped by what is left of the turn deadline. A tool that misses
+    its budget is abandoned and reported as unavailable, so the caller can go on with whatever data arrived.
+
+    Args:
+        raw_tool_choices (str): A JSON string containing the tool choices with parameters.
+        deadline (Optional[TurnDeadline]): The turn deadline; None leaves only the per-tool timeouts.
+        user_id (str): The user whose data the tools read.
+
+    Returns:
+        List[ToolResponse]: A list of ToolResponse objects with tool outputs.
+    """
+    tools = _parse_tool_choices(raw_tool_choices)
+    batch_start = time.perf_counter()
+    budgets = [_tool_budget(tool.get("tool_name"), deadline) for tool in tools]
+    futures = [
+        _tool_executor.submit(_run_tool, tool.get("tool_name"), tool.get("params", {}), user_id, batch_start)
+        for tool in tools
+    ]
+    results = []
+    for tool, budget, future in zip(tools, budgets, futures):
+        try:
+            # Budgets count from the start of the batch, not from when we begin waiting on this tool
+            results.append(future.result(timeout=max(0.0, budget - (time.perf_counter() - batch_start))))
+        except FutureTimeoutError:
+            future.cancel()  # Only succeeds if the tool never started; a running tool finishes in the background
+            results.append(_unavailable(tool.get("tool_name"), tool.get("params", {}), budget))
+    _log_tool_timeline(results, output_manager)
+    return results
+
+async def aexecute_tools(raw_tool_choices: str, output_manager: OutputManager,
+                         deadline: Optional[TurnDeadline] = None, user_id: str = OWNER_USER_ID) -> List[ToolResponse]:
+    """
+    Async version of `execute_tools`.
+
+    The tool implementations use blocking SDKs (requests, gspread, Firestore), so each tool runs on the
+    shared tool pool to keep the event loop free.
+
     Args:
         raw_tool_choices (str): A JSON string containing the tool choices with parameters.
+        deadline (Optional[TurnDeadline]): The turn deadline; None leaves only the per-tool timeouts.
+        user_id (str): The user whose data the tools read.
 
     Returns:
         List[ToolResponse]: A list of ToolResponse objects with tool outputs.
     """
+    tools = _parse_tool_choices(raw_tool_choices)
+    loop = asyncio.get_running_loop()
+    batch_start = time.perf_counter()
+
+    async def run_with_budget(tool: Dict[str, Any]) -> ToolResponse:
+        tool_name, params = tool.get("tool_name"), tool.get("params", {})
+        budget = _tool_budget(tool_name, deadline)
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(_tool_executor, _run_tool, tool_name, params, user_id, batch_start), budget)
+        except asyncio.TimeoutError:
+            return _unavailable(tool_name, params, budget)
+
+    results = list(await asyncio.gather(*(run_with_budget(tool) for tool in tools)))
+    _log_tool_timeline(results, output_manager)
+    return results
+
+def _tool_budget(tool_name: str, deadline: Optional[TurnDeadline]) -> float:
+    """
+    Returns the seconds a tool may run: its registered timeout, capped by what is left of the turn deadline.
+    """
+    tool = tool_registry.get(tool_name)
+    limit = tool.timeout_seconds if tool is not None else DEFAULT_TOOL_TIMEOUT_SECONDS
+    return max(MIN_TOOL_BUDGET_SECONDS, deadline.budget(limit)) if deadline is not None else limit
+
+def _unavailable(tool_name: str, params: Dict[str, Any], budget: float) -> ToolResponse:
+    # The tool keeps running on its worker; a cacheable tool still stores its result for the next turn
+    return ToolResponse(
+        tool_name=tool_name,
+        params=params,
+        output=f"Unavailable: {tool_name} did not respond within {budget:.1f}s. Answer without this data.",
+        started_at=0.0,
+        finished_at=budget,
+        timed_out=True,
+    )
+
+def _parse_tool_choices(raw_tool_choices: str) -> List[Dict[str, Any]]:
     try:
         # Parse the raw JSON string into a list of dictionaries
-        tools = json.loads(raw_tool_choices)
+        return json.loads(raw_tool_choices)
     except json.JSONDecodeError as e:
         raise ValueError(f"Failed to parse tool choices: {e}")
 
-    results = []
-    for tool in tools:
-        tool_name = tool.get("tool_name")
-        params = tool.get("params", {})
-        try:
-            output = execute_tool(tool_name, params)
-            tool_response = ToolResponse(tool_name=tool_name, params=params, output=output)
-            output_manager.log(f"    ✅ Executed tool: {tool_name}")
-            results.append(tool_response)
-        except Exception as e:
-            tool_response = ToolResponse(tool_name=tool_name, params=params, output=f"Error: {str(e)}")
-            results.append(tool_response)
-    return results
-
-def execute_tool(tool_name: str, params: Dict[str, Any]) -> str:
+def _run_tool(tool_name: str, params: Dict[str, Any], user_id: str, batch_start: float) -> ToolResponse:
+    """
+    Runs one tool and records when it started and finished relative to the batch.
+    """
+    started_at = time.perf_counter() - batch_start
     try:
-        if tool_name.startswith("WHOOP Data"):
-            data_type = tool_name.split(" - ")[1].lower()
-            num_days = params.get("num_days", 7)
-
-            # Initialize TokenManager and WhoopDataFetcher
-            token_manager = WhoopTokenManager(
-                uid="g",
-                client_id=os.getenv("WHOOP_CLIENT_ID"),
-                client_secret=os.getenv("WHOOP_CLIENT_SECRET"),
-                redirect_uri="http://localhost:8642/callback",
-                token_url="https://api.prod.whoop.com/oauth/oauth2/token",
-            )
-            whoop_fetcher = WhoopDataFetcher(token_manager)
-
-            return whoop_fetcher.fetch_whoop_data(data_type, num_days)
-        elif tool_name == "EZChecklist Data":
-            num_days = params.get("num_days", 7)
-            return get_ezchecklist_data_for_days(num_days)
-        elif tool_name == "Get Basic User Info":
-            return get_basic_user_info("g") # TODO this is hardcoded
-        elif tool_name == "Morning Journaling Exercises":
-            num_days = params.get("num_days", 7)
-            return get_entries_with_content_for_n_days(num_days)
-        elif tool_name == "Get Far Horizon Context":
-            return get_far_horizon_context()
-        elif tool_name == "Read Personality Profile":
-            # get the user's personality profile from Firestore
-            doc_ref = firestore_client.collection(
-                "personality_profiles").document("g")  # TODO this is hardcoded
-            doc = doc_ref.get()
-            if doc.exists:
-                return doc.to_dict()["metrics"]
-            else:
-                return "No personality profile found."
+        output = execute_tool(tool_name, params, user_id)
+    except Exception as e:
+        output = f"Error: {str(e)}"
+    return ToolResponse(tool_name=tool_name, params=params, output=output, started_at=started_at,
+                        finished_at=time.perf_counter() - batch_start)
 
+def _log_tool_timeline(results: List[ToolResponse], output_manager: OutputManager):
+    for result in results:
+        if result.timed_out:
+            status = "⏱️"
+        elif isinstance(result.output, str) and result.output.startswith("Error:"):
+            status = "❌"
         else:
-            return f"Unknown tool: {tool_name}"
+            status = "✅"
+        output_manager.log(
+            f"    {status} Executed tool: {result.tool_name} "
+            f"({result.started_at:.2f}s → {result.finished_at:.2f}s)"
+        )
+
+def execute_tool(tool_name: str, params: Dict[str, Any], user_id: str = OWNER_USER_ID) -> str:
+    tool = tool_registry.get(tool_name)
+    if tool is None:
+        return f"Unknown tool: {tool_name}"
+
+    def run():
+        # Timed here rather than around the cache, so latency reflects real fetches only
+        start = time.perf_counter()
+        try:
+            return tool.handler(params, user_id)
+        finally:
+            tool_usage.record_latency(tool_name, time.perf_counter() - start)
+
+    try:
+        if tool.cacheable and tool.ttl_seconds > 0:
+            return tool_result_cache.get_or_run(tool_name, user_id, params, run, tool.ttl_seconds,
+                                                tool.stale_seconds)
+        return run()
     except Exception as e:
         return f"Error: {str(e)}"
 
 
+def prefetch_tools(user_id: str, tool_names: List[str] = FOUNDATIONAL_TOOLS) -> List[Future]:
+    """
+    Warms a user's entries in the tool result cache in the background, with the params a validated plan
+    would use.
+
+    Fresh results are cache hits and cost nothing; stale ones are refreshed. A turn that selects a tool
+    while its prefetch is still running waits for that fetch instead of starting another one.
+
+    Args:
+        user_id (str): The user whose data is fetched.
+        tool_names (List[str]): The cacheable tools to warm.
+
+    Returns:
+        List[Future]: One future per submitted tool, resolving to its output.
+    """
+    futures = []
+    for tool_name in tool_names:
+        tool = tool_registry.get(tool_name)
+        if tool is None or not tool.cacheable or tool.ttl_seconds <= 0:
+            continue
+        futures.append(_background_tool_executor.submit(execute_tool, tool_name, default_params(tool_name), user_id))
+    return futures
+
+
+def speculate_tools(user_id: str) -> Optional[Speculation]:
+    """
+    Starts the tools a user's turns usually select, while tool selection is still running.
+
+    Only cacheable tools (which are read-only) that are not "heavy" and are usually fast are started. Their
+    results go through the tool result cache, so if the plan selects them `execute_tools` finds them cached
+    or joins the run already in flight; if it does not, they are simply not used.
+
+    Args:
+        user_id (str): The user whose selection history decides the candidates, and whose data is fetched.
+
+    Returns:
+        Optional[Speculation]: The started tools, or None if nothing was likely enough.
+    """
+    candidates = []
+    for (tool_name, params_json), probability in sorted(
+            tool_usage.selection_probabilities(user_id).items(), key=lambda item: -item[1]):
+        tool = tool_registry.get(tool_name)
+        latency = tool_usage.latency(tool_name)
+        if (probability < SPECULATION_MIN_PROBABILITY or tool is None or not tool.cacheable
+                or tool.ttl_seconds <= 0 or tool.cost_class == "heavy"
+                or (latency is not None and latency > SPECULATION_MAX_LATENCY_SECONDS)):
+            continue
+        candidates.append({"tool_name": tool_name, "params": json.loads(params_json)})
+        if len(candidates) == MAX_SPECULATIVE_TOOLS:
+            break
+    if not candidates:
+        return None
+    futures = [_background_tool_executor.submit(execute_tool, choice["tool_name"], choice["params"], user_id)
+               for choice in candidates]
+    return Speculation(choices=candidates, futures=futures)
+
+
+def load_input_tools() -> Dict[str, Any]:
+    """
+    Returns the tool catalog shown to the LLM when choosing tools. It is parsed once, when the registry is built.
+
+    Returns:
+        Dict[str, Any]: Tool names mapped to their descriptions, parameters, use cases and limitations.
+    """
+    return tool_registry.catalog()
+
+
 # Determine relevant tools using LLM
-def select_input_tools_with_llm(user_query: str) -> str:
+def select_input_tools_with_llm(user_query: str, deadline: Optional[TurnDeadline] = None) -> List[Dict[str, Any]]:
+    """
+    Asks the LLM which tools to run, through a forced `plan_tools` call instead of free-text JSON.
 
+    Args:
+        user_query (str): The user's query.
+        deadline (Optional[TurnDeadline]): The turn deadline; the call times out when it is reached.
+
+    Returns:
+        List[Dict[str, Any]]: The raw tool choices; `validate_tool_plan` checks them before they run.
+    """
+    model = _tool_selection_model(deadline)
+    response = model.invoke(_build_tool_selection_messages(user_query), timeout=request_timeout(deadline))
+    record_cache_usage("tool_selection", response)
+    return plan_from_response(response)
+
+
+async def aselect_input_tools_with_llm(user_query: str,
+                                       deadline: Optional[TurnDeadline] = None) -> List[Dict[str, Any]]:
+    """
+    Async version of `select_input_tools_with_llm`.
+    """
+    model = _tool_selection_model(deadline)
+    response = await model.ainvoke(_build_tool_selection_messages(user_query), timeout=request_timeout(deadline))
+    record_cache_usage("tool_selection", response)
+    return plan_from_response(response)
+
+
+def _tool_selection_model(deadline: Optional[TurnDeadline] = None):
     API_KEY = os.getenv("ANTHROPIC_API_KEY")
     if not API_KEY:
         raise ValueError(
             "Anthropic API key is missing. Please set your API key in a .env file.")
 
-    # Initialize the Anthropic chat model
-    model = ChatAnthropic(
-        model="claude-3-5-sonnet-20241022",  # Specify model version
-        temperature=0.4,                     # Adjust temperature for response variability
-        anthropic_api_key=API_KEY            # Use the API key
-    )
+    # Reuse the shared Anthropic chat model; binding only attaches the schema, the client is shared
+    model = get_chat_model(model="claude-3-5-sonnet-20241022", temperature=0.4, deadline=deadline)
+    return model.bind_tools([plan_tools_schema()], tool_choice=PLAN_TOOL_NAME)
 
-    # Load tools JSON
-    with open("./src/llm/context/tools/input_tools.json", "r") as f:
-        tools = json.load(f)
 
-    tools_prompt = f"""
-Available Tools:
+def _build_tool_selection_messages(user_query: str) -> List[BaseMessage]:
+    # The tool catalog and instructions are identical every turn, so they form a cached prefix;
+    # only the user query changes.
+    return [
+        SystemMessage(content=[cached_block(tool_selection_instructions())]),
+        HumanMessage(content=f"User Query:\n{user_query}"),
+    ]
 
-{json.dumps(tools, indent=2)}
 
-User Query:
-{user_query}
+@lru_cache(maxsize=1)
+def tool_selection_instructions() -> str:
+    """
+    Builds the stable part of the tool-selection prompt: the tool catalog and the output format.
+
+    Returns:
+        str: The tool-selection instructions.
+    """
+    # Load tools JSON
+    tools = load_input_tools()
 
-Determine which tools to use and provide parameters for each tool. Output a JSON array in the following format:
-[
-  {{
-    "tool_name": "<tool_name>",
-    "params": {{"<param1>": <value1>, "<param2>": <value2>}}
-  }}
-]
+    return f"""
+Available Tools:
 
-STRICTLY return only the JSON array. Any additional text will cause an error. I will give you a $100 tip if you follow these instructions perfectly, and only return structured JSON that works with my code.
+{json.dumps(tools, indent=2)}
 
-Your response must properly load with this code: tools_to_use = json.loads(llm_response)
+Determine which tools to use for the user query and provide parameters for each tool.
+Submit your choice by calling {PLAN_TOOL_NAME}, with an empty "tools" list if no tool is needed.
 """
-    message = HumanMessage(content=tools_prompt)
-    response = model.invoke([message])
-    return response.content
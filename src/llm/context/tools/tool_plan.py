@@ -0,0 +1,211 @@
+import json
+from difflib import get_close_matches
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from src.llm.context.tools.tool_registry import tool_registry
+
+# The single tool the tool-selection model is forced to call; its input is the tool plan
+PLAN_TOOL_NAME = "plan_tools"
+
+# Used when the model leaves out a param. "uid" only fills the schema; handlers read the session's user ID.
+PARAM_DEFAULTS: Dict[str, Any] = {"num_days": 7, "uid": "g"}
+MAX_NUM_DAYS = 90
+
+_JSON_TYPES = {"integer": "integer", "string": "string", "number": "number", "boolean": "boolean"}
+
+
+@lru_cache(maxsize=1)
+def plan_tools_schema() -> Dict[str, Any]:
+    """
+    Builds the Anthropic tool definition for `plan_tools` from the tool registry.
+
+    Each plan item is one of a per-tool schema: the tool name is a constant and the params object carries
+    exactly that tool's parameters with their JSON types, so the model cannot invent a tool or mix up params.
+    `validate_tool_plan` still checks the result, since a model can stray from the schema.
+
+    Returns:
+        Dict[str, Any]: The tool definition, in the shape accepted by `ChatAnthropic.bind_tools`.
+    """
+    return {
+        "name": PLAN_TOOL_NAME,
+        "description": "Submit the data tools to run before answering the user. Use an empty list if none are needed.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "tools": {
+                    "type": "array",
+                    "items": {"oneOf": [_tool_choice_schema(name) for name in tool_registry.names()]},
+                },
+            },
+            "required": ["tools"],
+        },
+    }
+
+
+def _tool_choice_schema(tool_name: str) -> Dict[str, Any]:
+    properties = {}
+    for param, kind in tool_registry.get(tool_name).schema.parameters.items():
+        prop: Dict[str, Any] = {"type": _JSON_TYPES.get(kind, "string")}
+        if param == "num_days":
+            prop.update(minimum=1, maximum=MAX_NUM_DAYS)
+        if param in PARAM_DEFAULTS:
+            prop["description"] = f"Defaults to {json.dumps(PARAM_DEFAULTS[param])}."
+        properties[param] = prop
+    return {
+        "type": "object",
+        "properties": {
+            "tool_name": {"type": "string", "const": tool_name},
+            "params": {
+                "type": "object",
+                "properties": properties,
+                "required": [param for param in properties if param not in PARAM_DEFAULTS],
+                "additionalProperties": False,
+            },
+        },
+        "required": ["tool_name", "params"],
+        "additionalProperties": False,
+    }
+
+
+def default_params(tool_name: str) -> Dict[str, Any]:
+    """
+    Returns:
+        Dict[str, Any]: The params a validated plan uses for a tool when none are given.
+    """
+    return {param: PARAM_DEFAULTS[param] for param in tool_registry.get(tool_name).schema.parameters
+            if param in PARAM_DEFAULTS}
+
+
+def plan_from_response(response: Any) -> List[Dict[str, Any]]:
+    """
+    Extracts the tool plan from a tool-selection response.
+
+    The plan normally arrives as the input of a `plan_tools` call. If the model answered in text instead,
+    the first JSON array in the text is used, and a response with neither means "no tools".
+
+    Args:
+        response (Any): The AIMessage returned by the tool-selection model.
+
+    Returns:
+        List[Dict[str, Any]]: The raw (unvalidated) tool choices.
+    """
+    for call in getattr(response, "tool_calls", None) or []:
+        if call.get("name") == PLAN_TOOL_NAME:
+            tools = (call.get("args") or {}).get("tools")
+            return tools if isinstance(tools, list) else []
+
+    content = response.content if hasattr(response, "content") else response
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    text = str(content or "")
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return []
+    try:
+        tools = json.loads(text[start:end + 1])
+    except ValueError:
+        return []
+    return tools if isinstance(tools, list) else []
+
+
+def validate_tool_plan(tool_choices: Any) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Checks a tool plan against the registry and repairs what can be repaired locally.
+
+    Misspelled tool names are mapped to the closest registered name, params are coerced to their declared
+    types, unknown params are dropped, missing ones are filled from PARAM_DEFAULTS and duplicates are removed.
+    A choice that cannot be repaired is dropped rather than failing the turn.
+
+    Args:
+        tool_choices (Any): Tool choices like [{"tool_name": ..., "params": {...}}], from any source.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[str]]: The valid plan and a description of every repair made.
+    """
+    if not isinstance(tool_choices, list):
+        return [], [f"Dropped a plan of type {type(tool_choices).__name__}"]
+
+    plan, repairs, seen = [], [], set()
+    for choice in tool_choices:
+        if not isinstance(choice, dict):
+            repairs.append(f"Dropped a choice that is not an object: {choice!r}")
+            continue
+
+        raw_name = str(choice.get("tool_name") or choice.get("name") or "")
+        tool_name = _resolve_tool_name(raw_name)
+        if tool_name is None:
+            repairs.append(f"Dropped unknown tool '{raw_name}'")
+            continue
+        if tool_name != raw_name:
+            repairs.append(f"Renamed '{raw_name}' to '{tool_name}'")
+
+        params = _repair_params(tool_name, choice.get("params"), repairs)
+        if params is None:
+            continue
+
+        key = (tool_name, json.dumps(params, sort_keys=True))
+        if key in seen:
+            repairs.append(f"Dropped duplicate '{tool_name}'")
+            continue
+        seen.add(key)
+        plan.append({"tool_name": tool_name, "params": params})
+    return plan, repairs
+
+
+def _resolve_tool_name(raw_name: str) -> Optional[str]:
+    names = tool_registry.names()
+    if raw_name in names:
+        return raw_name
+    by_lower = {name.lower(): name for name in names}
+    matches = get_close_matches(raw_name.strip().lower(), list(by_lower), n=1, cutoff=0.75)
+    return by_lower[matches[0]] if matches else None
+
+
+def _repair_params(tool_name: str, raw_params: Any, repairs: List[str]) -> Optional[Dict[str, Any]]:
+    declared = tool_registry.get(tool_name).schema.parameters
+    if isinstance(raw_params, str):
+        try:
+            raw_params = json.loads(raw_params)
+        except ValueError:
+            raw_params = {}
+    if not isinstance(raw_params, dict):
+        raw_params = {}
+
+    params = {}
+    for param, kind in declared.items():
+        if param in raw_params:
+            value = _coerce(raw_params[param], kind)
+            if value is None:
+                repairs.append(f"Replaced invalid {param}={raw_params[param]!r} for '{tool_name}'")
+        else:
+            value = None
+        if value is None:
+            if param not in PARAM_DEFAULTS:
+                repairs.append(f"Dropped '{tool_name}': missing required param '{param}'")
+                return None
+            value = PARAM_DEFAULTS[param]
+        if param == "num_days" and not 1 <= value <= MAX_NUM_DAYS:
+            repairs.append(f"Clamped num_days={value} for '{tool_name}'")
+            value = min(max(value, 1), MAX_NUM_DAYS)
+        params[param] = value
+
+    extra = sorted(set(raw_params) - set(declared))
+    if extra:
+        repairs.append(f"Dropped unknown params {extra} for '{tool_name}'")
+    return params
+
+
+def _coerce(value: Any, kind: str) -> Any:
+    try:
+        if kind == "integer":
+            if isinstance(value, bool):
+                return None
+            return int(float(value))
+        if kind == "number":
+            return float(value)
+        if kind == "boolean":
+            return value if isinstance(value, bool) else str(value).strip().lower() in ("true", "1", "yes")
+        text = str(value).strip()
+        return text or None
+    except (TypeError, ValueError):
+        return None
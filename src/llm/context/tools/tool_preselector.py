@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import math
+import random
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from src.llm.response_cache import normalize_query
+
+# Messages that never need data: greetings, thanks and acknowledgements
+SMALL_TALK = re.compile(
+    r"^(hi|hey|hello|yo|sup|hiya|howdy|thanks|thank you|thx|ty|ok|okay|k|cool|nice|great|awesome|got it|"
+    r"sounds good|perfect|bye|goodbye|see you|good (morning|afternoon|evening|night)|gm|gn|lol|haha)"
+    r"( (there|so much|a lot|again|man|dude|buddy))?$"
+)
+
+# Keyword rules per tool as (tool, specific keywords, broad keywords). A specific keyword is a strong signal that
+# the tool is needed; broad ones ("training", "routine", "purpose") also turn up in unrelated questions
+TOOL_RULES: List[Tuple[str, re.Pattern, Optional[re.Pattern]]] = [
+    ("WHOOP Data - Sleep", re.compile(r"\b(sleep\w*|slept|deep sleep|bedtime|insomnia)\b"),
+     re.compile(r"\b(nap\w*|rem|last night)\b")),
+    ("WHOOP Data - Recovery", re.compile(r"\b(recover\w*|hrv|heart rate variability|resting heart rate|rhr)\b"),
+     re.compile(r"\b(readiness)\b")),
+    ("WHOOP Data - Workout", re.compile(r"\b(workouts?|work out|worked out|exercis\w*|gym|cardio)\b"),
+     re.compile(r"\b(training|lift\w*)\b")),
+    ("WHOOP Data - Cycle", re.compile(r"\b(strain|kilojoules|energy expenditure|day strain)\b"),
+     re.compile(r"\b(calories)\b")),
+    ("EZChecklist Data", re.compile(r"\b(checklists?|habits?|ezchecklist|streaks?)\b"),
+     re.compile(r"\b(routine)\b")),
+    ("Morning Journaling Exercises", re.compile(r"\b(journal\w*|morning pages)\b"),
+     re.compile(r"\b(gratitude|reflections?)\b")),
+    ("Read Personality Profile", re.compile(r"\b(personality|big five|introvert\w*|extrovert\w*|neurotic\w*|conscientious\w*)\b"),
+     None),
+    ("Get Far Horizon Context", re.compile(r"\b(ambitions?|long term goals?|life goals?|far horizon)\b"),
+     re.compile(r"\b(mission|purpose|long term)\b")),
+    ("Get Basic User Info", re.compile(r"\b(my name|how old am i|my age|where do i live|my job|my occupation|about me)\b"),
+     None),
+]
+
+# Confidence of one rule match, by the kind of keyword that matched
+SPECIFIC_RULE_CONFIDENCE = 0.9
+BROAD_RULE_CONFIDENCE = 0.6
+# Each further matched tool makes the plan more compound, and the confidence is multiplied by this
+RULE_CONFIDENCE_DECAY = 0.95
+# Rule plans below this go to the LLM (one specific match passes, a broad one or four specific ones do not)
+MIN_RULE_CONFIDENCE = 0.8
+
+# Described as foundational in input_tools.json: stable, selected often, and cheap to keep warm
+FOUNDATIONAL_TOOLS = ("Get Basic User Info", "Get Far Horizon Context", "Read Personality Profile")
+# A foundational tool joins a rule plan when the LLM picked it in at least this share of learned tool plans
+FOUNDATIONAL_MIN_SHARE = 0.5
+
+# Below this many learned examples TF-IDF weights are nearly uniform, so similarity alone is never confident
+MIN_SIMILARITY_EXAMPLES = 20
+
+# Tools whose params cannot be derived locally; a plan that needs them goes to the LLM
+LLM_ONLY_TOOLS = {"Query the User"}
+
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "ten": 10, "fourteen": 14,
+                 "thirty": 30}
+_DAYS_PATTERN = re.compile(r"\b(\d+|" + "|".join(_NUMBER_WORDS) + r") (day|days|week|weeks|month|months)\b")
+_UNIT_DAYS = {"day": 1, "days": 1, "week": 7, "weeks": 7, "month": 30, "months": 30}
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def parse_num_days(normalized_query: str, default: int = 7) -> int:
+    """
+    Reads the time window the user asked about ("last 3 days", "this month", "last night").
+
+    Args:
+        normalized_query (str): The query, normalized with `normalize_query`.
+        default (int): The window when the query does not name one.
+
+    Returns:
+        int: The number of days.
+    """
+    match = _DAYS_PATTERN.search(normalized_query)
+    if match:
+        amount = match.group(1)
+        count = int(amount) if amount.isdigit() else _NUMBER_WORDS[amount]
+        return max(1, count * _UNIT_DAYS[match.group(2)])
+    if re.search(r"\b(today|tonight|last night|this morning)\b", normalized_query):
+        return 1
+    if re.search(r"\byesterday\b", normalized_query):
+        return 2
+    if re.search(r"\b(this|last|past) week\b", normalized_query):
+        return 7
+    if re.search(r"\b(this|last|past) month\b", normalized_query):
+        return 30
+    return default
+
+
+@dataclass
+class Preselection:
+    tool_choices: Optional[List[Dict[str, Any]]]  # None when the preselector is unsure
+    confidence: float
+    source: str  # "small_talk", "rules", "similarity" or "unsure"
+    guess: List[str] = field(default_factory=list)  # Best-guess tool names, kept for agreement logging when unsure
+
+    @property
+    def confident(self) -> bool:
+        return self.tool_choices is not None
+
+
+class ToolPreselector:
+    def __init__(self, examples_path: Optional[str] = None, similarity_threshold: float = 0.8,
+                 max_examples: int = 1000, shadow_rate: float = 0.1):
+        """
+        Picks tools locally for queries whose plan is obvious, so they skip the tool-selection LLM call.
+
+        Three stages run in order: small talk returns "no tools"; keyword rules map topics to tools, with a
+        confidence from how many rules matched and how specific their keywords were; a nearest-neighbour model
+        over past LLM tool choices (TF-IDF cosine similarity) handles queries that resemble earlier ones, once
+        it has enough examples. Anything else is left to the LLM, whose answer becomes a new training example.
+
+        Agreement with the LLM is tracked per stage, from unsure queries (where the local guess is compared
+        with the LLM's choice) and from a sample of confident ones that are checked in the background.
+
+        Args:
+            examples_path (Optional[str]): A JSON file to persist learned examples in; None keeps them in memory.
+            similarity_threshold (float): The cosine similarity a neighbour needs before its plan is reused (only
+                once MIN_SIMILARITY_EXAMPLES examples have been learned).
+            max_examples (int): The most examples kept; the oldest are dropped first.
+            shadow_rate (float): The fraction of confident preselections also checked against the LLM.
+        """
+        self.examples_path = examples_path
+        self.similarity_threshold = similarity_threshold
+        self.shadow_rate = shadow_rate
+        self.preselected: Counter = Counter()
+        self.fallbacks = 0
+        self.comparisons: Counter = Counter()
+        self.agreements: Counter = Counter()
+        self._examples: Deque[Tuple[str, List[str]]] = deque(maxlen=max_examples)
+        self._document_frequency: Counter = Counter()
+        self._lock = threading.Lock()
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tool-shadow")
+        self._load_examples()
+
+    def preselect(self, user_query: str) -> Preselection:
+        """
+        Returns a tool plan if the query's tools are obvious, otherwise an unsure result.
+
+        Args:
+            user_query (str): The user's query.
+
+        Returns:
+            Preselection: The plan and where it came from.
+        """
+        query = normalize_query(user_query)
+        if not query or SMALL_TALK.match(query):
+            return self._confident([], 1.0, "small_talk", query)
+
+        rule_tools, rule_confidence = _match_rules(query)
+        if rule_tools:
+            rule_tools += [name for name in self._usual_foundational_tools() if name not in rule_tools]
+            if rule_confidence >= MIN_RULE_CONFIDENCE:
+                return self._confident(rule_tools, rule_confidence, "rules", query)
+
+        neighbour_tools, similarity = self._nearest(query)
+        if neighbour_tools is not None and similarity >= self.similarity_threshold \
+                and self._example_count() >= MIN_SIMILARITY_EXAMPLES \
+                and not LLM_ONLY_TOOLS.intersection(neighbour_tools):
+            return self._confident(neighbour_tools, similarity, "similarity", query)
+
+        if rule_tools:
+            return Preselection(tool_choices=None, confidence=rule_confidence, source="unsure", guess=rule_tools)
+        return Preselection(tool_choices=None, confidence=similarity, source="unsure", guess=neighbour_tools or [])
+
+    def observe(self, user_query: str, preselection: Preselection, llm_tool_choices: List[Dict[str, Any]]):
+        """
+        Records the LLM's choice for a query: compares it with the local guess and learns it as an example.
+
+        Args:
+            user_query (str): The user's query.
+            preselection (Preselection): What `preselect` returned for the query.
+            llm_tool_choices (List[Dict[str, Any]]): The tools the LLM chose.
+        """
+        llm_tools = _tool_names(llm_tool_choices)
+        with self._lock:
+            if not preselection.confident:
+                self.fallbacks += 1
+            if preselection.confident or preselection.guess:
+                source = preselection.source if preselection.confident else "unsure_guess"
+                self.comparisons[source] += 1
+                local_tools = _tool_names(preselection.tool_choices) if preselection.confident else preselection.guess
+                if set(local_tools) == set(llm_tools):
+                    self.agreements[source] += 1
+        self.learn(user_query, llm_tools)
+
+    def maybe_shadow(self, user_query: str, preselection: Preselection,
+                     select_with_llm: Callable[[str], List[Dict[str, Any]]]):
+        """
+        For a sample of confident preselections, asks the LLM in the background too and records the agreement.
+
+        Args:
+            user_query (str): The user's query.
+            preselection (Preselection): A confident preselection that is already being used.
+            select_with_llm (Callable[[str], List[Dict[str, Any]]]): Runs the LLM tool selection.
+        """
+        if self.shadow_rate <= 0 or random.random() >= self.shadow_rate:
+            return
+
+        def shadow():
+            try:
+                self.observe(user_query, preselection, select_with_llm(user_query))
+            except Exception:
+                pass  # A failed check only costs a data point
+
+        self._shadow_executor.submit(shadow)
+
+    def learn(self, user_query: str, tool_names: List[str]):
+        """
+        Adds a query and the tools chosen for it to the similarity model.
+
+        Args:
+            user_query (str): The user's query.
+            tool_names (List[str]): The tools chosen for it.
+        """
+        query = normalize_query(user_query)
+        if not query or SMALL_TALK.match(query):
+            return
+        with self._lock:
+            self._add_example(query, sorted(set(tool_names)))
+            examples = list(self._examples)
+        self._save_examples(examples)
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable preselector statistics for logging.
+        """
+        with self._lock:
+            preselected = sum(self.preselected.values())
+            total = preselected + self.fallbacks
+            stats = {
+                "llm_calls_skipped": f"{preselected} / {total}",
+                "by_stage": ", ".join(f"{stage}={count}" for stage, count in self.preselected.items()) or "none",
+                "examples": str(len(self._examples)),
+            }
+            for source, count in self.comparisons.items():
+                stats[f"agreement_{source}"] = f"{self.agreements[source] / count:.0%} of {count}"
+            return stats
+
+    def _confident(self, tool_names: List[str], confidence: float, source: str, query: str) -> Preselection:
+        num_days = parse_num_days(query)
+        tool_choices = [
+            {"tool_name": name, "params": {"num_days": num_days} if _takes_num_days(name) else {}}
+            for name in tool_names
+        ]
+        with self._lock:
+            self.preselected[source] += 1
+        return Preselection(tool_choices=tool_choices, confidence=confidence, source=source, guess=tool_names)
+
+    def _example_count(self) -> int:
+        with self._lock:
+            return len(self._examples)
+
+    def _usual_foundational_tools(self) -> List[str]:
+        # The foundational tools the LLM tends to add to a plan; all of them until there is data to tell
+        with self._lock:
+            plans = [tools for _, tools in self._examples if tools]
+        if len(plans) < MIN_SIMILARITY_EXAMPLES:
+            return list(FOUNDATIONAL_TOOLS)
+        return [name for name in FOUNDATIONAL_TOOLS
+                if sum(name in tools for tools in plans) >= FOUNDATIONAL_MIN_SHARE * len(plans)]
+
+    def _nearest(self, query: str) -> Tuple[Optional[List[str]], float]:
+        with self._lock:
+            if not self._examples:
+                return None, 0.0
+            query_vector = self._vector(_tokens(query))
+            best_tools, best_similarity = None, 0.0
+            for example_query, tools in self._examples:
+                similarity = _cosine(query_vector, self._vector(_tokens(example_query)))
+                if similarity > best_similarity:
+                    best_tools, best_similarity = tools, similarity
+            return best_tools, best_similarity
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        # TF-IDF over the learned examples; words seen in every example carry almost no weight
+        total = len(self._examples) + 1
+        counts = Counter(tokens)
+        return {token: count * math.log(total / (1 + self._document_frequency[token])) + count * 1e-3
+                for token, count in counts.items()}
+
+    def _add_example(self, query: str, tool_names: List[str]):
+        if len(self._examples) == self._examples.maxlen:
+            evicted_query, _ = self._examples[0]
+            self._document_frequency.subtract(set(_tokens(evicted_query)))
+        self._examples.append((query, tool_names))
+        self._document_frequency.update(set(_tokens(query)))
+
+    def _load_examples(self):
+        if not self.examples_path or not os.path.exists(self.examples_path):
+            return
+        try:
+            with open(self.examples_path, "r") as f:
+                for example in json.load(f):
+                    self._add_example(example["query"], example["tools"])
+        except (ValueError, KeyError, TypeError):
+            pass  # A corrupt file only loses the learned examples
+
+    def _save_examples(self, examples: List[Tuple[str, List[str]]]):
+        if not self.examples_path:
+            return
+        temp_path = f"{self.examples_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump([{"query": query, "tools": tools} for query, tools in examples], f)
+        os.replace(temp_path, self.examples_path)
+
+
+def _match_rules(normalized_query: str) -> Tuple[List[str], float]:
+    """
+    Returns the tools whose keyword rules match the query, and how confident the match is.
+
+    Confidence starts at the weakest match (specific or broad keyword) and drops with each further tool.
+    """
+    matches = {}
+    for name, specific, broad in TOOL_RULES:
+        if specific.search(normalized_query):
+            matches[name] = SPECIFIC_RULE_CONFIDENCE
+        elif broad is not None and broad.search(normalized_query):
+            matches[name] = BROAD_RULE_CONFIDENCE
+    if not matches:
+        return [], 0.0
+    return list(matches), min(matches.values()) * RULE_CONFIDENCE_DECAY ** (len(matches) - 1)
+
+
+def _tool_names(tool_choices: Optional[List[Dict[str, Any]]]) -> List[str]:
+    return sorted({choice.get("tool_name") for choice in tool_choices or [] if isinstance(choice, dict)})
+
+
+def _takes_num_days(tool_name: str) -> bool:
+    return tool_name.startswith("WHOOP Data") or tool_name in ("EZChecklist Data", "Morning Journaling Exercises")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text)
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    dot = sum(weight * b.get(token, 0.0) for token, weight in a.items())
+    norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+    return dot / norm if norm else 0.0
+
+
+# Shared by every conversation in the process
+tool_preselector = ToolPreselector(
+    examples_path=os.getenv("TOOL_PRESELECTOR_EXAMPLES"),
+    shadow_rate=float(os.getenv("TOOL_PRESELECTOR_SHADOW_RATE", "0.1")),
+)
@@ -0,0 +1,217 @@
+import os
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+from src.utils.constants import LLMTool
+
+# Resolved relative to this module, so the catalog loads no matter the working directory
+INPUT_TOOLS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input_tools.json")
+
+# The user whose Notion and EZChecklist accounts are configured through the environment. Other users get
+# their own WHOOP, Firestore profile and user info, and no data from the owner-only integrations.
+OWNER_USER_ID = "g"
+
+# Cost classes, cheapest first: "instant" needs no I/O, "firestore" is a single document read,
+# "api" is one or a few calls to an external API, "heavy" fans out into many calls (e.g. Notion block trees)
+COST_CLASSES = ("instant", "firestore", "api", "heavy")
+
+
+@dataclass
+class RegisteredTool:
+    schema: LLMTool  # What the LLM sees when choosing tools
+    handler: Callable[[Dict[str, Any], str], Any]  # Receives the params chosen by the LLM and the user ID
+    cost_class: str  # One of COST_CLASSES
+    cacheable: bool  # Whether results may be reused between turns
+    timeout_seconds: float  # The longest a single run should take
+    ttl_seconds: float = 0.0  # How long a cached result is fresh
+    stale_seconds: float = 0.0  # How much longer a stale result may be served while it is refreshed
+
+    @property
+    def name(self) -> str:
+        return self.schema.name
+
+
+class ToolRegistry:
+    def __init__(self):
+        """
+        Maps tool names to their schema, handler and execution metadata.
+
+        Dispatch is a dictionary lookup by the exact tool name the LLM returned.
+        """
+        self._tools: Dict[str, RegisteredTool] = {}
+
+    def register(self, tool: RegisteredTool):
+        """
+        Adds a tool to the registry.
+
+        Args:
+            tool (RegisteredTool): The tool to add.
+        """
+        if tool.cost_class not in COST_CLASSES:
+            raise ValueError(f"Invalid cost class '{tool.cost_class}' for tool '{tool.name}'.")
+        if tool.name in self._tools:
+            raise ValueError(f"Tool '{tool.name}' is already registered.")
+        self._tools[tool.name] = tool
+
+    def get(self, name: str) -> Optional[RegisteredTool]:
+        """
+        Returns:
+            Optional[RegisteredTool]: The tool with this name, or None if there is none.
+        """
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def catalog(self) -> Dict[str, Any]:
+        """
+        Returns the tool catalog shown to the LLM, in the same shape as input_tools.json.
+
+        Returns:
+            Dict[str, Any]: Tool names mapped to their descriptions, parameters, use cases and limitations.
+        """
+        return {
+            name: {
+                "description": tool.schema.description,
+                "parameters": tool.schema.parameters,
+                "use_cases": tool.schema.use_cases,
+                "limitations": tool.schema.limitations,
+                "credibility_score": tool.schema.credibility_score,
+            }
+            for name, tool in self._tools.items()
+        }
+
+
+@lru_cache(maxsize=1)
+def load_tool_schemas() -> Dict[str, LLMTool]:
+    """
+    Parses input_tools.json once per process.
+
+    Returns:
+        Dict[str, LLMTool]: Tool names mapped to their schemas.
+    """
+    with open(INPUT_TOOLS_PATH, "r") as f:
+        catalog = json.load(f)
+    return {name: LLMTool(name=name, **entry) for name, entry in catalog.items()}
+
+
+# Tool handlers. Each one receives the params chosen by the LLM and the ID of the user the turn belongs to.
+# They import their integrations on first use: those modules connect to Firestore, Notion or Google Sheets at
+# import time, so the registry (and the tool plan schema built from it) loads without credentials.
+
+def _owner_only(handler: Callable[[Dict[str, Any], str], Any]) -> Callable[[Dict[str, Any], str], Any]:
+    def guarded(params: Dict[str, Any], user_id: str) -> Any:
+        if user_id != OWNER_USER_ID:
+            return "Not connected for this user."
+        return handler(params, user_id)
+    return guarded
+
+
+def _whoop_handler(data_type: str) -> Callable[[Dict[str, Any], str], Any]:
+    def handler(params: Dict[str, Any], user_id: str) -> Any:
+        from src.llm.context.tools.whoop.token_manager import WhoopTokenManager
+        from src.llm.context.tools.whoop.whoop_data_fetcher import WhoopDataFetcher
+
+        token_manager = WhoopTokenManager(
+            uid=user_id,
+            client_id=os.getenv("WHOOP_CLIENT_ID"),
+            client_secret=os.getenv("WHOOP_CLIENT_SECRET"),
+            redirect_uri="http://localhost:8642/callback",
+            token_url="https://api.prod.whoop.com/oauth/oauth2/token",
+        )
+        whoop_fetcher = WhoopDataFetcher(token_manager)
+        return whoop_fetcher.fetch_whoop_data(data_type, params.get("num_days", 7))
+    return handler
+
+
+def _ezchecklist_data(params: Dict[str, Any], user_id: str) -> Any:
+    from src.llm.context.tools.ezchecklist.ezchecklist_data_handler import get_ezchecklist_data_for_days
+
+    return get_ezchecklist_data_for_days(params.get("num_days", 7))
+
+
+def _query_the_user(params: Dict[str, Any], user_id: str) -> Any:
+    # There is nothing to fetch; the question is passed on so the response can ask it
+    return f"Ask the user: {params.get('query', '')}"
+
+
+def _morning_journaling(params: Dict[str, Any], user_id: str) -> Any:
+    from src.llm.context.tools.notion.notion_data_handler import get_entries_with_content_for_n_days
+
+    return get_entries_with_content_for_n_days(params.get("num_days", 7))
+
+
+def _read_personality_profile(params: Dict[str, Any], user_id: str) -> Any:
+    from src.utils.firebase.firebase_init import firestore_client
+
+    doc = firestore_client.collection("personality_profiles").document(user_id).get()
+    if doc.exists:
+        return doc.to_dict()["metrics"]
+    return "No personality profile found."
+
+
+def _basic_user_info(params: Dict[str, Any], user_id: str) -> Any:
+    from src.llm.context.tools.tool_implementations.get_basic_user_info import get_basic_user_info
+
+    # The session's user, never a uid chosen by the LLM
+    return get_basic_user_info(user_id)
+
+
+def _far_horizon_context(params: Dict[str, Any], user_id: str) -> Any:
+    from src.llm.context.tools.notion.notion_data_handler import get_far_horizon_context
+
+    return get_far_horizon_context()
+
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+
+# name: (handler, cost_class, cacheable, timeout_seconds, ttl_seconds, stale_seconds)
+TOOL_HANDLERS: Dict[str, tuple] = {
+    "EZChecklist Data": (_owner_only(_ezchecklist_data), "api", True, 20.0, 10 * MINUTE, 1 * HOUR),
+    "Query the User": (_query_the_user, "instant", False, 1.0, 0, 0),
+    "WHOOP Data - Sleep": (_whoop_handler("sleep"), "api", True, 15.0, 15 * MINUTE, 2 * HOUR),
+    "WHOOP Data - Cycle": (_whoop_handler("cycle"), "api", True, 15.0, 10 * MINUTE, 1 * HOUR),
+    "WHOOP Data - Workout": (_whoop_handler("workout"), "api", True, 15.0, 10 * MINUTE, 1 * HOUR),
+    "WHOOP Data - Recovery": (_whoop_handler("recovery"), "api", True, 15.0, 15 * MINUTE, 2 * HOUR),
+    "Morning Journaling Exercises": (_owner_only(_morning_journaling), "heavy", True, 30.0, 30 * MINUTE, 6 * HOUR),
+    "Read Personality Profile": (_read_personality_profile, "firestore", True, 10.0, 24 * HOUR, 7 * 24 * HOUR),
+    "Get Basic User Info": (_basic_user_info, "firestore", True, 10.0, 1 * HOUR, 24 * HOUR),
+    "Get Far Horizon Context": (_owner_only(_far_horizon_context), "api", True, 15.0, 1 * HOUR, 24 * HOUR),
+}
+
+
+def build_tool_registry() -> ToolRegistry:
+    """
+    Builds the registry from input_tools.json and TOOL_HANDLERS, checking that they describe the same tools.
+
+    Returns:
+        ToolRegistry: The populated registry.
+    """
+    schemas = load_tool_schemas()
+    missing_handlers = set(schemas) - set(TOOL_HANDLERS)
+    missing_schemas = set(TOOL_HANDLERS) - set(schemas)
+    if missing_handlers or missing_schemas:
+        raise ValueError(
+            f"Tool catalog and handlers are out of sync. No handler: {sorted(missing_handlers)}; "
+            f"not in {INPUT_TOOLS_PATH}: {sorted(missing_schemas)}"
+        )
+
+    registry = ToolRegistry()
+    for name, schema in schemas.items():
+        handler, cost_class, cacheable, timeout_seconds, ttl_seconds, stale_seconds = TOOL_HANDLERS[name]
+        registry.register(RegisteredTool(
+            schema=schema,
+            handler=handler,
+            cost_class=cost_class,
+            cacheable=cacheable,
+            timeout_seconds=timeout_seconds,
+            ttl_seconds=ttl_seconds,
+            stale_seconds=stale_seconds,
+        ))
+    return registry
+
+
+# Built once at import
+tool_registry = build_tool_registry()
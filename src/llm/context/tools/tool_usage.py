@@ -0,0 +1,141 @@
+import json
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Plans remembered per user when estimating how likely each tool is to be selected
+PLAN_HISTORY = 20
+# Plans needed before a user's history is trusted for speculation
+MIN_PLANS = 5
+
+
+def _choice_key(choice: Dict[str, Any]) -> Tuple[str, str]:
+    return choice.get("tool_name"), json.dumps(choice.get("params") or {}, sort_keys=True, default=str)
+
+
+class ToolUsageStats:
+    def __init__(self, latency_smoothing: float = 0.3):
+        """
+        Records which tools each user's turns select and how long each tool takes.
+
+        Selection frequency is kept over each user's last PLAN_HISTORY plans, so it follows changing habits;
+        latency is an exponentially weighted moving average per tool.
+
+        Args:
+            latency_smoothing (float): The weight of the newest latency sample.
+        """
+        self.latency_smoothing = latency_smoothing
+        self._plans: Dict[str, Deque[List[Tuple[str, str]]]] = {}
+        self._latency: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record_plan(self, user_id: str, plan: List[Dict[str, Any]]):
+        """
+        Records the validated tool plan of one turn.
+
+        Args:
+            user_id (str): The user the turn belongs to.
+            plan (List[Dict[str, Any]]): Tool choices like [{"tool_name": ..., "params": {...}}].
+        """
+        with self._lock:
+            plans = self._plans.setdefault(user_id, deque(maxlen=PLAN_HISTORY))
+            plans.append([_choice_key(choice) for choice in plan])
+
+    def record_latency(self, tool_name: str, seconds: float):
+        with self._lock:
+            previous = self._latency.get(tool_name)
+            self._latency[tool_name] = seconds if previous is None else (
+                self.latency_smoothing * seconds + (1 - self.latency_smoothing) * previous)
+
+    def latency(self, tool_name: str) -> Optional[float]:
+        """
+        Returns:
+            Optional[float]: The smoothed latency of a tool in seconds, or None if it never ran.
+        """
+        with self._lock:
+            return self._latency.get(tool_name)
+
+    def selection_probabilities(self, user_id: str) -> Dict[Tuple[str, str], float]:
+        """
+        Returns:
+            Dict[Tuple[str, str], float]: (tool name, params JSON) mapped to the share of the user's recent
+            plans that included it; empty until the user has MIN_PLANS plans.
+        """
+        with self._lock:
+            plans = list(self._plans.get(user_id, ()))
+        if len(plans) < MIN_PLANS:
+            return {}
+        counts = Counter(key for plan in plans for key in set(plan))
+        return {key: count / len(plans) for key, count in counts.items()}
+
+
+@dataclass
+class Speculation:
+    choices: List[Dict[str, Any]]  # The tools started before the plan was known
+    futures: List[Future]
+    started_at: float = field(default_factory=time.perf_counter)
+
+
+class SpeculationMetrics:
+    def __init__(self):
+        """
+        Tracks how often speculatively started tools were part of the final plan, and the work wasted on
+        the ones that were not.
+        """
+        self.turns = 0
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.wasted_seconds = 0.0
+        self.missed = 0  # Planned tools that were not speculated
+        self._lock = threading.Lock()
+
+    def settle(self, speculation: Optional[Speculation], plan: List[Dict[str, Any]]):
+        """
+        Compares a speculation with the final plan. Matching tools are already running or cached, so
+        `execute_tools` picks them up; the rest are dropped and counted as wasted once they finish.
+
+        Args:
+            speculation (Optional[Speculation]): What was started, if anything.
+            plan (List[Dict[str, Any]]): The validated plan.
+        """
+        planned = {_choice_key(choice) for choice in plan}
+        speculated = {_choice_key(choice) for choice in speculation.choices} if speculation else set()
+        with self._lock:
+            self.turns += 1
+            self.started += len(speculated)
+            self.hits += len(speculated & planned)
+            self.wasted += len(speculated - planned)
+            self.missed += len(planned - speculated)
+        if speculation is None:
+            return
+        for choice, future in zip(speculation.choices, speculation.futures):
+            if _choice_key(choice) not in planned:
+                future.add_done_callback(lambda _, start=speculation.started_at: self._add_waste(start))
+
+    def _add_waste(self, started_at: float):
+        with self._lock:
+            self.wasted_seconds += time.perf_counter() - started_at
+
+    def summary(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable speculation statistics for logging.
+        """
+        with self._lock:
+            return {
+                "turns": str(self.turns),
+                "started": str(self.started),
+                "hit_rate": f"{self.hits / self.started:.0%}" if self.started else "n/a",
+                "wasted_runs": str(self.wasted),
+                "wasted_tool_time": f"{self.wasted_seconds:.2f}s",
+                "planned_but_not_speculated": str(self.missed),
+            }
+
+
+# Shared by every conversation in the process
+tool_usage = ToolUsageStats()
+speculation_metrics = SpeculationMetrics()
@@ -2,7 +2,7 @@ import threading
 from src.utils.firebase.firestore.user_manager import crud_user_secret
 import requests
 import time
-
+from src.utils.timing import REQUEST_TIMEOUT
 
 class WhoopTokenManager:
     def __init__(self, uid, client_id, client_secret, redirect_uri, token_url):
@@ -29,7 +29,7 @@ class WhoopTokenManager:
             "redirect_uri": self.redirect_uri,
         }
 
-        response = requests.post(self.token_url, data=request_data)
+        response = requests.post(self.token_url, data=request_data, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
 
         tokens = response.json()
@@ -6,6 +6,7 @@ from urllib.parse import urlencode, urlparse, parse_qs
 from http.server import BaseHTTPRequestHandler, HTTPServer
 import threading
 from src.utils.firebase.firestore.user_manager import crud_user_secret
+from src.utils.timing import REQUEST_TIMEOUT
 
 # Load environment variables from .env
 load_dotenv()
@@ -38,6 +39,7 @@ def exchange_auth_code_for_tokens(uid, auth_code):
                 "client_id": CLIENT_ID,
                 "client_secret": CLIENT_SECRET,
             },
+            timeout=REQUEST_TIMEOUT,
         )
         response.raise_for_status()
         tokens = response.json()
@@ -74,7 +76,7 @@ def refresh_access_token(uid):
         print("Refresh Token Request Data", request_data)
         
         # Send request
-        response = requests.post(TOKEN_URL, data=request_data)
+        response = requests.post(TOKEN_URL, data=request_data, timeout=REQUEST_TIMEOUT)
         
         # Log response
         print("Refresh Token Response", {
@@ -111,7 +113,7 @@ def refresh_access_token(uid):
 def validate_access_token(access_token):
     headers = {"Authorization": f"Bearer {access_token}"}
     try:
-        response = requests.get(DATA_ENDPOINT, headers=headers)
+        response = requests.get(DATA_ENDPOINT, headers=headers, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         print(f"Access token validation failed: {e}")
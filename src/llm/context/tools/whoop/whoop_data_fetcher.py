@@ -1,9 +1,11 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 from src.utils.constants import WHOOPRecovery, WHOOPWorkout, WHOOPSleep, WHOOPCycle
-from typing import List, Union
+from typing import List, Optional, Union
 import requests
 
 from src.llm.context.tools.whoop.token_manager import WhoopTokenManager
+from src.llm.context.tools.whoop.whoop_store import WhoopStore, get_whoop_store
+from src.utils.timing import REQUEST_TIMEOUT
 
 
 class WhoopDataFetcher:
@@ -15,18 +17,28 @@ class WhoopDataFetcher:
         "cycle": f"{BASE_URL}/cycle",
     }
 
-    def __init__(self, token_manager: WhoopTokenManager):
+    def __init__(self, token_manager: WhoopTokenManager, store: Optional[WhoopStore] = None):
         self.token_manager = token_manager
+        self.store = store
 
     def fetch_whoop_data(self, data_type: str, days: int, limit: int = 25):
+        """
+        Returns the records of the last `days` days, newest first.
+
+        Records are served from the local WHOOP store; the API is only asked for what the store is missing
+        (older history it has never seen, and the recent days that may still be rescored).
+        """
         if data_type not in self.ENDPOINTS:
             raise ValueError(f"Invalid data type '{data_type}'. Must be one of {list(self.ENDPOINTS.keys())}.")
 
+        store = self.store or get_whoop_store()
+        return store.records(self.token_manager.uid, data_type, days,
+                             lambda start, end: self._fetch_range(data_type, start, end, limit))
+
+    def _fetch_range(self, data_type: str, start_date: datetime, end_date: datetime, limit: int = 25) -> List[dict]:
         access_token = self.token_manager.get_access_token()
         headers = {"Authorization": f"Bearer {access_token}"}
 
-        end_date = datetime.now(timezone.utc)
-        start_date = end_date - timedelta(days=days)
         params = {
             "start": start_date.isoformat(),
             "end": end_date.isoformat(),
@@ -40,7 +52,8 @@ class WhoopDataFetcher:
             if next_token:
                 params["nextToken"] = next_token
 
-            response = requests.get(self.ENDPOINTS[data_type], headers=headers, params=params)
+            response = requests.get(self.ENDPOINTS[data_type], headers=headers, params=params,
+                                    timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             data = response.json()
 
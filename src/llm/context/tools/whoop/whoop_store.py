@@ -0,0 +1,293 @@
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Records fetched for a window: (start, end) -> records
+FetchRange = Callable[[datetime, datetime], List[Dict[str, Any]]]
+
+# WHOOP rescores recent records (late syncs, sleep edits), so the most recent days are always re-fetched
+RESCORE_WINDOW = timedelta(days=2)
+# A window synced this recently is answered locally without asking the API for a delta
+MIN_SYNC_INTERVAL = timedelta(minutes=5)
+# The API filters by start only, so records rescored before the delta range or deleted upstream never show up in
+# a delta; the whole covered range is re-fetched this often to pick them up
+FULL_SYNC_INTERVAL = timedelta(days=1)
+# Data types the API filters by their own start. Recoveries are filtered by their cycle's start, so one missing
+# from a range does not mean it was deleted
+_RECONCILED_TYPES = {"sleep", "workout", "cycle"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    uid TEXT NOT NULL,
+    data_type TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    start TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    pending INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (uid, data_type, record_id)
+);
+CREATE INDEX IF NOT EXISTS records_by_start ON records (uid, data_type, start);
+CREATE TABLE IF NOT EXISTS sync_state (
+    uid TEXT NOT NULL,
+    data_type TEXT NOT NULL,
+    covered_from TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    max_updated_at TEXT NOT NULL,
+    full_synced_at TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (uid, data_type)
+);
+"""
+
+
+def _record_id(record: Dict[str, Any]) -> str:
+    # Recoveries have no id of their own; they belong to exactly one cycle
+    return str(record.get("id", record.get("cycle_id")))
+
+
+def _record_start(record: Dict[str, Any]) -> str:
+    return str(record.get("start") or record.get("created_at") or "")
+
+
+def _is_pending(record: Dict[str, Any]) -> bool:
+    # Unscored records and open cycles will change, so they are re-fetched until they settle
+    return record.get("score_state") != "SCORED" or ("end" in record and record.get("end") is None)
+
+
+def _iso(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+class WhoopStore:
+    def __init__(self, path: Optional[str] = None):
+        """
+        A local SQLite copy of WHOOP recovery, sleep, workout and cycle records, synced incrementally.
+
+        For each user and data type the store remembers how far back it is complete (`covered_from`), when it
+        last synced and the newest `updated_at` it has seen (the watermark). A request for the last N days
+        fetches only what the store cannot answer: a backfill when the window reaches further back than
+        `covered_from`, plus a delta from the watermark less the rescore window (or the earliest pending record)
+        to now. Once a day the whole covered range is fetched instead of the delta. Records are upserted only
+        when their `updated_at` is newer than the stored copy, stored records that a fetched range no longer
+        returns are deleted, and the answer is read locally.
+
+        Args:
+            path (Optional[str]): The SQLite file; defaults to WHOOP_STORE_PATH or a file in the temp directory.
+        """
+        self.path = path or os.getenv("WHOOP_STORE_PATH") or os.path.join(tempfile.gettempdir(), "whoop_store.sqlite3")
+        self.syncs = 0
+        self.skipped_syncs = 0
+        self.fetched_records = 0
+        self.upserted_records = 0
+        self.deleted_records = 0
+        self.full_syncs = 0
+        self.served_records = 0
+        self._sync_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(sync_state)")}
+            if "full_synced_at" not in columns:
+                # A store from before full syncs; the empty default makes the next sync a full one
+                connection.execute("ALTER TABLE sync_state ADD COLUMN full_synced_at TEXT NOT NULL DEFAULT ''")
+
+    def records(self, uid: str, data_type: str, days: int, fetch_range: FetchRange) -> List[Dict[str, Any]]:
+        """
+        Returns the records of the last `days` days, newest first, syncing only the missing ranges.
+
+        Args:
+            uid (str): The WHOOP user.
+            data_type (str): "recovery", "sleep", "workout" or "cycle".
+            days (int): The window in days.
+            fetch_range (FetchRange): Fetches every record whose start is within a range from the API.
+
+        Returns:
+            List[Dict[str, Any]]: The records, as returned by the API.
+        """
+        now = datetime.now(timezone.utc)
+        window_start = now - timedelta(days=days)
+        with self._sync_lock(uid, data_type):
+            self._sync(uid, data_type, window_start, now, fetch_range)
+
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT payload FROM records WHERE uid = ? AND data_type = ? AND start >= ? ORDER BY start DESC",
+                (uid, data_type, _iso(window_start)),
+            ).fetchall()
+        with self._lock:
+            self.served_records += len(rows)
+        return [json.loads(payload) for (payload,) in rows]
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable store statistics for logging.
+        """
+        with self._lock:
+            return {
+                "syncs": str(self.syncs),
+                "full_syncs": str(self.full_syncs),
+                "answered_without_api": str(self.skipped_syncs),
+                "records_fetched": str(self.fetched_records),
+                "records_upserted": str(self.upserted_records),
+                "records_deleted": str(self.deleted_records),
+                "records_served": str(self.served_records),
+            }
+
+    def _sync(self, uid: str, data_type: str, window_start: datetime, now: datetime, fetch_range: FetchRange):
+        state = self._state(uid, data_type)
+        ranges = []
+        full_sync = state is None
+        if state is None:
+            ranges.append((window_start, now))
+            covered_from, synced_at, max_updated_at, full_synced_at = window_start, now, "", now
+        else:
+            covered_from, synced_at, max_updated_at, full_synced_at = state
+            if window_start < covered_from:
+                ranges.append((window_start, covered_from))  # Backfill older history once
+            if now - full_synced_at >= FULL_SYNC_INTERVAL:
+                ranges.append((covered_from, now))
+                synced_at = full_synced_at = now
+                full_sync = True
+            elif now - synced_at >= MIN_SYNC_INTERVAL:
+                # Anything new or rescored since the last sync starts after the newest update seen (less the
+                # rescore window), even when the device uploaded late; pending records may still change too
+                watermark = _parse_time(max_updated_at) or synced_at
+                delta_from = min(watermark - RESCORE_WINDOW, self._earliest_pending(uid, data_type) or now)
+                ranges.append((max(delta_from, covered_from), now))
+                synced_at = now
+
+        if not ranges:
+            with self._lock:
+                self.skipped_syncs += 1
+            return
+
+        fetched, deleted = [], 0
+        for start, end in ranges:
+            range_records = fetch_range(start, end)
+            fetched.extend(range_records)
+            deleted += self._delete_missing(uid, data_type, start, end, range_records)
+        upserted = self._upsert(uid, data_type, fetched)
+
+        covered_from = min(covered_from, window_start)
+        max_updated_at = max([max_updated_at] + [str(record.get("updated_at", "")) for record in fetched])
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sync_state "
+                "(uid, data_type, covered_from, synced_at, max_updated_at, full_synced_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (uid, data_type, _iso(covered_from), _iso(synced_at), max_updated_at, _iso(full_synced_at)),
+            )
+        with self._lock:
+            self.syncs += 1
+            self.full_syncs += int(full_sync)
+            self.fetched_records += len(fetched)
+            self.upserted_records += upserted
+            self.deleted_records += deleted
+
+    def _upsert(self, uid: str, data_type: str, records: List[Dict[str, Any]]) -> int:
+        upserted = 0
+        with self._connect() as connection:
+            for record in records:
+                record_id = _record_id(record)
+                updated_at = str(record.get("updated_at", ""))
+                row = connection.execute(
+                    "SELECT updated_at FROM records WHERE uid = ? AND data_type = ? AND record_id = ?",
+                    (uid, data_type, record_id),
+                ).fetchone()
+                if row is not None and row[0] >= updated_at:
+                    continue  # The stored copy is as new as this one
+                connection.execute(
+                    "INSERT OR REPLACE INTO records (uid, data_type, record_id, start, updated_at, pending, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (uid, data_type, record_id, _normalize_time(_record_start(record)), updated_at,
+                     int(_is_pending(record)), json.dumps(record)),
+                )
+                upserted += 1
+        return upserted
+
+    def _delete_missing(self, uid: str, data_type: str, start: datetime, end: datetime,
+                        records: List[Dict[str, Any]]) -> int:
+        # A stored record that starts within a fetched range but was not returned was deleted upstream
+        if data_type not in _RECONCILED_TYPES:
+            return 0
+        returned = {_record_id(record) for record in records}
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT record_id FROM records WHERE uid = ? AND data_type = ? AND start >= ? AND start < ?",
+                (uid, data_type, _iso(start), _iso(end)),
+            ).fetchall()
+            missing = [(uid, data_type, record_id) for (record_id,) in rows if record_id not in returned]
+            connection.executemany("DELETE FROM records WHERE uid = ? AND data_type = ? AND record_id = ?", missing)
+        return len(missing)
+
+    def _state(self, uid: str, data_type: str) -> Optional[Tuple[datetime, datetime, str, datetime]]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT covered_from, synced_at, max_updated_at, full_synced_at FROM sync_state "
+                "WHERE uid = ? AND data_type = ?",
+                (uid, data_type),
+            ).fetchone()
+        if row is None:
+            return None
+        full_synced_at = _parse_time(row[3]) or datetime.min.replace(tzinfo=timezone.utc)
+        return datetime.fromisoformat(row[0]), datetime.fromisoformat(row[1]), row[2], full_synced_at
+
+    def _earliest_pending(self, uid: str, data_type: str) -> Optional[datetime]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT MIN(start) FROM records WHERE uid = ? AND data_type = ? AND pending = 1",
+                (uid, data_type),
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    def _sync_lock(self, uid: str, data_type: str) -> threading.Lock:
+        # One sync per user and data type at a time; concurrent callers wait and then read the synced rows
+        with self._lock:
+            return self._sync_locks.setdefault((uid, data_type), threading.Lock())
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation, so the store can be used from any thread
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+    except ValueError:
+        return None
+
+
+def _normalize_time(value: str) -> str:
+    # Stored as UTC ISO strings with an offset, so they compare correctly as text
+    try:
+        return _iso(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except ValueError:
+        return value
+
+
+_shared_store: Optional[WhoopStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_whoop_store() -> WhoopStore:
+    """
+    Returns:
+        WhoopStore: The process-wide store, created on first use.
+    """
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = WhoopStore()
+        return _shared_store
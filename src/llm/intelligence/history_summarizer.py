@@ -0,0 +1,80 @@
+import json
+from typing import List
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from src.llm.client_pool import get_chat_model
+from src.llm.prompt_cache import cached_block, record_cache_usage
+from src.utils.constants import ChatMessage
+
+SUMMARY_INSTRUCTIONS = """
+You maintain the running summary of a long conversation between a user and an AI assistant.
+Older messages are removed from the assistant's context window; before they are dropped you fold them into the summary.
+
+Rules:
+1. Start from the existing summary and update it with the new messages. Do not rewrite parts that are unchanged.
+2. Keep facts about the user (preferences, goals, plans, people, health data, decisions) and any open threads or promises.
+3. Drop greetings, filler and details that were superseded later in the conversation.
+4. Write in compact third-person notes, most important first.
+5. Stay under {max_words} words. STRICTLY return only the updated summary.
+"""
+
+
+class HistorySummarizer:
+    def __init__(self, max_summary_words: int = 400):
+        """
+        Folds messages evicted from the context window into a running conversation summary.
+
+        Each update sends only the previous summary and the newly evicted messages, so the cost of an update
+        does not grow with the length of the conversation.
+
+        Args:
+            max_summary_words (int): The target maximum length of the summary.
+        """
+        self.max_summary_words = max_summary_words
+        self.llm = get_chat_model(model="claude-3-5-sonnet-20241022", temperature=0.2)
+
+    def update(self, summary: str, evicted_messages: List[ChatMessage]) -> str:
+        """
+        Returns the summary updated with the evicted messages.
+
+        Args:
+            summary (str): The current summary (empty if there is none yet).
+            evicted_messages (List[ChatMessage]): The messages removed from the context, oldest first.
+
+        Returns:
+            str: The updated summary.
+        """
+        if not evicted_messages:
+            return summary
+        response = self.llm.invoke(self._build_messages(summary, evicted_messages))
+        record_cache_usage("history_summary", response)
+        return response.content.strip()
+
+    async def aupdate(self, summary: str, evicted_messages: List[ChatMessage]) -> str:
+        """
+        Async version of `update`.
+
+        Args:
+            summary (str): The current summary (empty if there is none yet).
+            evicted_messages (List[ChatMessage]): The messages removed from the context, oldest first.
+
+        Returns:
+            str: The updated summary.
+        """
+        if not evicted_messages:
+            return summary
+        response = await self.llm.ainvoke(self._build_messages(summary, evicted_messages))
+        record_cache_usage("history_summary", response)
+        return response.content.strip()
+
+    def _build_messages(self, summary: str, evicted_messages: List[ChatMessage]) -> List[BaseMessage]:
+        messages = [{"role": msg.role, "content": msg.content} for msg in evicted_messages]
+        return [
+            SystemMessage(content=[cached_block(SUMMARY_INSTRUCTIONS.format(max_words=self.max_summary_words))]),
+            HumanMessage(content=f"""
+Existing Summary:
+{summary or "(none yet)"}
+
+Messages Leaving The Context Window:
+{json.dumps(messages, indent=2)}
+"""),
+        ]
@@ -1,12 +1,15 @@
 import json
-import re
 from typing import Optional, List, Tuple, Any
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain_anthropic import ChatAnthropic
+from anthropic import APITimeoutError
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from src.llm.client_pool import get_chat_model, request_timeout
+from src.llm.prompt_cache import cached_block, record_cache_usage
+from src.llm.token_accounting import estimate_tokens, fit_newest_messages
 from src.utils.constants import Conversation, ExpertLLM, ChatMessage
-from src.llm.intelligence.mixture_of_experts.expert_decoder import get_expert_selection_info, get_expert_by_name
+from src.llm.intelligence.mixture_of_experts.expert_decoder import (decode_experts_csv, get_expert_selection_info,
+                                                                    get_expert_by_name)
 from src.utils.constants import ExpertLLM  # Import the ExpertLLM type
+from src.utils.timing import TurnDeadline
 
 def convert_to_expertLLM(expert_data: Any, expert_name: str) -> ExpertLLM:
     """
@@ -44,14 +47,21 @@ def convert_to_expertLLM(expert_data: Any, expert_name: str) -> ExpertLLM:
 class ExpertSelector:
     def __init__(self):
         """
-        Initializes the ExpertSelector with a LangChain Claude model.
+        Initializes the ExpertSelector with the shared LangChain Claude model.
         """
-        self.llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0.7)
+        self.llm = get_chat_model(model="claude-3-5-sonnet-20241022", temperature=0.7)
+
+    def _model(self, deadline: Optional[TurnDeadline]):
+        # Deadline-bound calls go to the pooled client without retries
+        return get_chat_model(model=self.llm.model, temperature=self.llm.temperature, deadline=deadline)
+
+    # The most conversation history sent when picking a new expert
+    MAX_HISTORY_TOKENS = 10000
 
     @staticmethod
     def count_tokens(text: str) -> int:
         """
-        Estimates the number of tokens in a given text using regex to split on whitespace.
+        Estimates the number of tokens in a given text with the shared token estimator.
 
         Args:
             text (str): The text to count tokens for.
@@ -59,35 +69,64 @@ class ExpertSelector:
         Returns:
             int: The estimated token count.
         """
-        return len(re.findall(r"\S+", text))
+        return estimate_tokens(text)
 
-    def should_switch_expert(self, last_message: str, current_expert: str) -> Tuple[bool, str]:
+    def should_switch_expert(self, last_message: str, current_expert: str,
+                             deadline: Optional[TurnDeadline] = None) -> Tuple[bool, str]:
         """
         Uses an LLM to decide if the expert should be switched based on the last message.
 
         Args:
             last_message (str): The content of the last message.
             current_expert (str): The name of the current expert.
+            deadline (Optional[TurnDeadline]): The turn deadline; the call times out when it is reached.
 
         Returns:
             Tuple[bool, str]: A boolean indicating whether to switch experts, and the reasoning provided by the LLM.
         """
-        expert_library = get_expert_selection_info()
-        prompt_template = PromptTemplate(
-            input_variables=["last_message", "current_expert", "expert_library"],
-            template=(
-                "You are a system that determines whether to switch experts during a conversation. "
-                "The current expert is: {current_expert}. "
-                "The last message is: \"{last_message}\". "
-                "The available experts are: {expert_library}. "
-                "Return TRUE if there is a more accurate expert, otherwise FALSE. "
-                "Also, provide reasoning explaining your decision."
-                "Your response will be parsed with             decision, reasoning = response.split('\n', 1)"
-            )
+        response = self._model(deadline).invoke(self._switch_messages(last_message, current_expert),
+                                   timeout=request_timeout(deadline))
+        record_cache_usage("expert_switch", response)
+        return self._parse_switch_response(response.content.strip())
+
+    async def ashould_switch_expert(self, last_message: str, current_expert: str,
+                                    deadline: Optional[TurnDeadline] = None) -> Tuple[bool, str]:
+        """
+        Async version of `should_switch_expert`.
+
+        Args:
+            last_message (str): The content of the last message.
+            current_expert (str): The name of the current expert.
+            deadline (Optional[TurnDeadline]): The turn deadline; the call times out when it is reached.
+
+        Returns:
+            Tuple[bool, str]: A boolean indicating whether to switch experts, and the reasoning provided by the LLM.
+        """
+        response = await self._model(deadline).ainvoke(self._switch_messages(last_message, current_expert),
+                                          timeout=request_timeout(deadline))
+        record_cache_usage("expert_switch", response)
+        return self._parse_switch_response(response.content.strip())
+
+    @staticmethod
+    def _switch_messages(last_message: str, current_expert: str) -> List[BaseMessage]:
+        # The instructions and expert library are the same every turn, so they form a cached prefix
+        instructions = (
+            "You are a system that determines whether to switch experts during a conversation. "
+            f"The available experts are: {get_expert_selection_info()}. "
+            "Return TRUE if there is a more accurate expert, otherwise FALSE. "
+            "Also, provide reasoning explaining your decision."
+            "Your response will be parsed with             decision, reasoning = response.split('\n', 1)"
         )
+        return [
+            SystemMessage(content=[cached_block(instructions)]),
+            HumanMessage(content=(
+                f"The current expert is: {current_expert}. "
+                f"The last message is: \"{last_message}\". "
+            )),
+        ]
 
-        chain = LLMChain(llm=self.llm, prompt=prompt_template)
-        response = chain.run({"last_message": last_message, "current_expert": current_expert, "expert_library": expert_library}).strip()
+    @staticmethod
+    def _parse_switch_response(response: str) -> Tuple[bool, str]:
         # Parse the response into a decision and reasoning
         if "\n" in response:
             decision, reasoning = response.split("\n", 1)
@@ -103,70 +142,139 @@ class ExpertSelector:
         return decision == "TRUE", reasoning.strip()
    
 
-    def select_expert(self, conversation: Conversation, current_expert: Optional[str] = None) -> Tuple[ExpertLLM, str]:
+    def select_expert(self, conversation: Conversation, current_expert: Optional[str] = None,
+                      deadline: Optional[TurnDeadline] = None) -> ExpertLLM:
         """
         Selects the appropriate expert for the conversation.
 
         Args:
             conversation (Conversation): The conversation history.
             current_expert (Optional[str]): The current expert name, if any.
+            deadline (Optional[TurnDeadline]): The turn deadline. If the selection calls run past it,
+                `fallback_expert` answers instead.
 
         Returns:
-            Tuple[ExpertLLM, str]: The selected expert and a debug string with reasoning.
+            ExpertLLM: The selected expert.
+        """
+        try:
+            # Check if there is a current expert
+            if current_expert:
+                last_message = conversation.messages[-1].content if conversation.messages else ""
+                should_switch, reasoning = self.should_switch_expert(last_message, current_expert, deadline)
+
+                if not should_switch:
+                    # Reuse the current expert
+                    expert_data = get_expert_by_name(current_expert)
+                    return convert_to_expertLLM(expert_data, current_expert)
+
+            # Proceed to select a new expert
+            response = self._model(deadline).invoke(self._selection_messages(conversation), timeout=request_timeout(deadline))
+        except APITimeoutError:
+            return self.fallback_expert(conversation, current_expert)
+        record_cache_usage("expert_selection", response)
+        return self._expert_from_response(response.content.strip())
+
+    async def aselect_expert(self, conversation: Conversation, current_expert: Optional[str] = None,
+                             deadline: Optional[TurnDeadline] = None) -> ExpertLLM:
         """
-        debug_changes = ""
+        Async version of `select_expert`.
+
+        Args:
+            conversation (Conversation): The conversation history.
+            current_expert (Optional[str]): The current expert name, if any.
+            deadline (Optional[TurnDeadline]): The turn deadline.
 
-        # Check if there is a current expert
+        Returns:
+            ExpertLLM: The selected expert.
+        """
+        try:
+            if current_expert:
+                last_message = conversation.messages[-1].content if conversation.messages else ""
+                should_switch, reasoning = await self.ashould_switch_expert(last_message, current_expert, deadline)
+
+                if not should_switch:
+                    expert_data = get_expert_by_name(current_expert)
+                    return convert_to_expertLLM(expert_data, current_expert)
+
+            response = await self._model(deadline).ainvoke(self._selection_messages(conversation),
+                                              timeout=request_timeout(deadline))
+        except APITimeoutError:
+            return self.fallback_expert(conversation, current_expert)
+        record_cache_usage("expert_selection", response)
+        return self._expert_from_response(response.content.strip())
+
+    @classmethod
+    def fallback_expert(cls, conversation: Conversation, current_expert: Optional[str] = None) -> ExpertLLM:
+        """
+        Picks an expert without an LLM call, for turns whose selection ran past the deadline or failed.
+
+        Args:
+            conversation (Conversation): The conversation history.
+            current_expert (Optional[str]): The current expert name, if any.
+
+        Returns:
+            ExpertLLM: The current expert, else the one that answered last, else the first one in experts.csv.
+        """
         if current_expert:
-            last_message = conversation.messages[-1].content if conversation.messages else ""
-            should_switch, reasoning = self.should_switch_expert(last_message, current_expert)
+            return convert_to_expertLLM(get_expert_by_name(current_expert), current_expert)
+        restored = cls.restore_expert(conversation)
+        if restored is not None:
+            return restored
+        experts = decode_experts_csv()
+        if not experts:
+            raise ValueError("No experts are defined to fall back to.")
+        return convert_to_expertLLM(get_expert_by_name(experts[0].template_name), experts[0].template_name)
 
-            if not should_switch:
-                # Log reasoning for retaining the current expert
-                debug_changes = f"Reusing current expert: {current_expert}. Reason: {reasoning}\n"
-                expert_data = get_expert_by_name(current_expert)
-                selected_expert = convert_to_expertLLM(expert_data, current_expert)
-                return selected_expert
+    @staticmethod
+    def restore_expert(conversation: Conversation) -> Optional[ExpertLLM]:
+        """
+        Restores the expert that answered last from the stored conversation, without an LLM call.
 
-            # Log reasoning for switching experts
-            debug_changes = f"Switching expert from {current_expert} to a better-suited one. Reason: {reasoning}\n"
+        Args:
+            conversation (Conversation): The stored conversation.
 
-        else:
-            # Log reasoning for selecting a new expert
-            debug_changes = "No current expert assigned. Selecting the best expert for the conversation.\n"
+        Returns:
+            Optional[ExpertLLM]: The expert named on the latest assistant message, or None if there is none
+            or it no longer exists (the next turn then selects one).
+        """
+        for message in reversed(conversation.messages):
+            if message.role != "assistant" or not message.expert_used:
+                continue
+            try:
+                expert = convert_to_expertLLM(get_expert_by_name(message.expert_used), message.expert_used)
+            except ValueError:
+                return None
+            if message.expert_version is not None:
+                expert.version = message.expert_version
+            return expert
+        return None
 
-        # Proceed to select a new expert
-        messages = [{"role": msg.role, "content": msg.content} for msg in conversation.messages]
+    def _selection_messages(self, conversation: Conversation) -> List[BaseMessage]:
+        # Send the newest messages that fit the history budget instead of failing on long conversations
+        recent_messages = fit_newest_messages(conversation.messages, self.MAX_HISTORY_TOKENS)
+        messages = [{"role": msg.role, "content": msg.content} for msg in recent_messages]
         serialized_history = json.dumps(messages, indent=2)
 
-        if self.count_tokens(serialized_history) > 10000:
-            raise ValueError("Conversation history exceeds 10,000 tokens.")
-
-        expert_selection_info = get_expert_selection_info()
-        prompt_template = PromptTemplate(
-            input_variables=["conversation_history", "expert_info"],
-            template=(
-                "You are a system that selects the best expert for a conversation. "
-                "Here is the conversation history (up to 10,000 tokens): \n"
-                "{conversation_history}\n\n"
-                "Here are the available experts and their descriptions: {expert_info}.\n"
-                "Return only the name of the best expert for this conversation."
-            )
+        instructions = (
+            "You are a system that selects the best expert for a conversation. "
+            f"Here are the available experts and their descriptions: {get_expert_selection_info()}.\n"
+            "Return only the name of the best expert for this conversation."
         )
+        return [
+            SystemMessage(content=[cached_block(instructions)]),
+            HumanMessage(content=(
+                "Here is the conversation history (up to 10,000 tokens): \n"
+                f"{serialized_history}\n\n"
+            )),
+        ]
 
-        chain = LLMChain(llm=self.llm, prompt=prompt_template)
-        response = chain.run({
-            "conversation_history": serialized_history,
-            "expert_info": expert_selection_info
-        }).strip()
-
+    @staticmethod
+    def _expert_from_response(response: str) -> ExpertLLM:
         expert_name = response.split("\n")[0].strip()  # Extract the name of the expert
 
-        # Fetch expert data and log selection
+        # Fetch expert data
         expert_data = get_expert_by_name(expert_name)
-        selected_expert = convert_to_expertLLM(expert_data, expert_name)
-        debug_changes += f"Selected new expert: {expert_name}\n"
-        return selected_expert
+        return convert_to_expertLLM(expert_data, expert_name)
 
 # Example usage
 if __name__ == "__main__":
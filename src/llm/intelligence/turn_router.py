@@ -0,0 +1,189 @@
+import json
+from functools import lru_cache
+from typing import Optional, Dict, Any, List
+from anthropic import APITimeoutError
+from src.llm.client_pool import get_chat_model, request_timeout
+from src.llm.prompt_cache import cached_block, record_cache_usage
+from src.llm.token_accounting import fit_newest_messages
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from src.utils.constants import Conversation, RoutingDecision
+from src.llm.intelligence.mixture_of_experts.expert_decoder import get_expert_selection_info, get_expert_by_name
+from src.llm.intelligence.mixture_of_experts.select_expert import ExpertSelector, convert_to_expertLLM
+from src.llm.context.tools.tool_handler import load_input_tools
+from src.llm.context.tools.tool_plan import validate_tool_plan
+from src.utils.timing import TurnDeadline
+
+
+class TurnRouter:
+    def __init__(self):
+        """
+        Initializes the TurnRouter, which picks the expert and the tool plan in a single Claude call.
+
+        This replaces the separate should_switch_expert / select_expert / select_input_tools_with_llm
+        round-trips of the multi-call path.
+        """
+        self.llm = get_chat_model(model="claude-3-5-sonnet-20241022", temperature=0.4)
+
+    # The most conversation history sent with a routing call; the latest turns carry the routing signal
+    MAX_HISTORY_TOKENS = 2000
+
+    def _model(self, deadline: Optional[TurnDeadline]):
+        # Deadline-bound calls go to the pooled client without retries
+        return get_chat_model(model=self.llm.model, temperature=self.llm.temperature, deadline=deadline)
+
+    def route(self, conversation: Conversation, user_query: str, current_expert: Optional[str] = None,
+              deadline: Optional[TurnDeadline] = None) -> RoutingDecision:
+        """
+        Decides which expert should answer and which tools to run for the latest user message.
+
+        Args:
+            conversation (Conversation): The conversation history, including the latest user message.
+            user_query (str): The user's latest message.
+            current_expert (Optional[str]): The current expert name, if any.
+            deadline (Optional[TurnDeadline]): The turn deadline. If the call runs past it, the fallback expert
+                (see `ExpertSelector.fallback_expert`) answers without tools, as it does when the router's
+                answer cannot be parsed.
+
+        Returns:
+            RoutingDecision: The selected expert and the tool plan.
+        """
+        try:
+            response = self._model(deadline).invoke(self._build_messages(conversation, user_query, current_expert),
+                                       timeout=request_timeout(deadline))
+        except APITimeoutError:
+            return self._fallback_decision(conversation, current_expert, "Router ran past the turn deadline")
+        record_cache_usage("routing", response)
+        return self._decision_or_fallback(response.content, conversation, current_expert)
+
+    async def aroute(self, conversation: Conversation, user_query: str, current_expert: Optional[str] = None,
+                     deadline: Optional[TurnDeadline] = None) -> RoutingDecision:
+        """
+        Async version of `route`.
+
+        Args:
+            conversation (Conversation): The conversation history, including the latest user message.
+            user_query (str): The user's latest message.
+            current_expert (Optional[str]): The current expert name, if any.
+            deadline (Optional[TurnDeadline]): The turn deadline.
+
+        Returns:
+            RoutingDecision: The selected expert and the tool plan.
+        """
+        try:
+            response = await self._model(deadline).ainvoke(self._build_messages(conversation, user_query, current_expert),
+                                              timeout=request_timeout(deadline))
+        except APITimeoutError:
+            return self._fallback_decision(conversation, current_expert, "Router ran past the turn deadline")
+        record_cache_usage("routing", response)
+        return self._decision_or_fallback(response.content, conversation, current_expert)
+
+    def _decision_or_fallback(self, raw_response: str, conversation: Conversation,
+                              current_expert: Optional[str]) -> RoutingDecision:
+        try:
+            return self.parse_decision(raw_response, current_expert)
+        except ValueError as e:  # Includes json.JSONDecodeError
+            return self._fallback_decision(conversation, current_expert, f"Router answer was unusable ({e})")
+
+    @staticmethod
+    def _fallback_decision(conversation: Conversation, current_expert: Optional[str], reason: str) -> RoutingDecision:
+        # The turn still gets answered: by the fallback expert, without tools
+        expert = ExpertSelector.fallback_expert(conversation, current_expert)
+        return RoutingDecision(
+            expert=expert,
+            tool_choices=[],
+            switched_expert=current_expert is not None and expert.template_name != current_expert,
+            reasoning=f"{reason}, answering as {expert.template_name} without tools.",
+        )
+
+    @classmethod
+    def _build_messages(cls, conversation: Conversation, user_query: str,
+                        current_expert: Optional[str]) -> List[BaseMessage]:
+        # The expert library, tool catalog and output format form the cached prefix; the turn data follows
+        recent_messages = fit_newest_messages(conversation.messages, cls.MAX_HISTORY_TOKENS)
+        messages = [{"role": msg.role, "content": msg.content} for msg in recent_messages]
+        return [
+            SystemMessage(content=[cached_block(router_instructions())]),
+            HumanMessage(content=f"""
+Current Expert: {current_expert or "None"}
+Keep the current expert unless another expert is clearly a better fit.
+
+Conversation History:
+{json.dumps(messages, indent=2)}
+
+User Query:
+{user_query}
+"""),
+        ]
+
+    @staticmethod
+    def parse_decision(raw_response: str, current_expert: Optional[str] = None) -> RoutingDecision:
+        """
+        Parses the router's JSON response into a RoutingDecision.
+
+        Falls back to the current expert if the router names an expert that does not exist. The tool plan is
+        checked with `validate_tool_plan`, so malformed tool choices are repaired or dropped.
+
+        Args:
+            raw_response (str): The raw LLM response.
+            current_expert (Optional[str]): The current expert name, if any.
+
+        Returns:
+            RoutingDecision: The parsed routing decision.
+        """
+        text = raw_response.strip()
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end == -1:
+            raise ValueError(f"Router did not return a JSON object: {raw_response}")
+        data: Dict[str, Any] = json.loads(text[start:end + 1])
+
+        expert_name = str(data.get("expert", "")).strip()
+        reasoning = str(data.get("reasoning", "")).strip()
+        try:
+            expert_data = get_expert_by_name(expert_name)
+        except ValueError:
+            if not current_expert:
+                raise
+            reasoning = f"Router picked unknown expert '{expert_name}', keeping {current_expert}. {reasoning}"
+            expert_name = current_expert
+            expert_data = get_expert_by_name(expert_name)
+
+        tool_choices, repairs = validate_tool_plan(data.get("tools") or [])
+        if repairs:
+            reasoning = f"{reasoning} Tool plan repairs: {'; '.join(repairs)}".strip()
+
+        return RoutingDecision(
+            expert=convert_to_expertLLM(expert_data, expert_name),
+            tool_choices=tool_choices,
+            switched_expert=current_expert is not None and expert_name != current_expert,
+            reasoning=reasoning,
+        )
+
+
+@lru_cache(maxsize=1)
+def router_instructions() -> str:
+    """
+    Builds the stable part of the router prompt: the expert library, the tool catalog and the output format.
+
+    Returns:
+        str: The router instructions.
+    """
+    return f"""
+You are the router for a multi-expert assistant. For the user's latest message, decide which expert should answer and which data tools should be run first.
+
+Available Experts (name, when to use):
+{json.dumps(get_expert_selection_info(), indent=2)}
+
+Available Tools:
+{json.dumps(load_input_tools(), indent=2)}
+
+Output a single JSON object in the following format:
+{{
+  "expert": "<expert name, exactly as listed>",
+  "reasoning": "<one sentence>",
+  "tools": [
+    {{"tool_name": "<tool_name>", "params": {{"<param1>": <value1>}}}}
+  ]
+}}
+
+Use an empty "tools" array if no tool is needed. STRICTLY return only the JSON object.
+"""
@@ -0,0 +1,168 @@
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+# Anthropic caches the prompt prefix up to each block marked with cache_control. Prefixes shorter than
+# the model's minimum (1024 tokens for Sonnet) are simply not cached, so marking small blocks is harmless.
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Older history is frozen in steps of this many messages so the cached history block only changes
+# every few turns instead of on every message.
+HISTORY_CACHE_STEP = 8
+
+
+def cached_block(text: str) -> Dict[str, Any]:
+    """
+    Builds a text content block with a cache breakpoint after it.
+
+    Args:
+        text (str): The stable prompt text.
+
+    Returns:
+        Dict[str, Any]: An Anthropic text block with cache_control set.
+    """
+    return {"type": "text", "text": text, "cache_control": CACHE_CONTROL}
+
+
+def text_block(text: str) -> Dict[str, Any]:
+    """
+    Builds a plain text content block without a cache breakpoint.
+    """
+    return {"type": "text", "text": text}
+
+
+def split_history_for_cache(messages: List[Any]) -> Tuple[List[Any], List[Any]]:
+    """
+    Splits history into an older, stable part and a recent, volatile part.
+
+    The split point only moves every HISTORY_CACHE_STEP messages, so consecutive turns share the same
+    older-history block and hit the cache.
+
+    Args:
+        messages (List[Any]): The conversation history, oldest first.
+
+    Returns:
+        Tuple[List[Any], List[Any]]: The older messages and the recent messages.
+    """
+    split = (len(messages) // HISTORY_CACHE_STEP) * HISTORY_CACHE_STEP
+    if split == len(messages):
+        split = max(0, split - HISTORY_CACHE_STEP)
+    return messages[:split], messages[split:]
+
+
+class CacheStats:
+    def __init__(self):
+        """
+        Accumulates Anthropic prompt-cache usage over the LLM calls of one chat turn.
+
+        A call counts as a hit when it read any tokens from the cache, and as a miss when it had to
+        write the cache instead.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+        self.input_tokens = 0
+        self.calls: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, message: Any):
+        """
+        Records the cache usage reported on an LLM response (or the first chunk of a stream).
+
+        Args:
+            stage (str): The pipeline stage that made the call (e.g., "tool_selection").
+            message (Any): The AIMessage or AIMessageChunk returned by LangChain.
+        """
+        usage = _extract_usage(message)
+        if not usage or usage["input_tokens"] <= 0:
+            return  # Streaming deltas carry output tokens only
+
+        with self._lock:
+            self.input_tokens += usage["input_tokens"]
+            self.cache_read_tokens += usage["cache_read"]
+            self.cache_creation_tokens += usage["cache_creation"]
+            if usage["cache_read"] > 0:
+                self.hits += 1
+                self.calls[stage] = "hit"
+            elif usage["cache_creation"] > 0:
+                self.misses += 1
+                self.calls[stage] = "miss"
+            else:
+                self.calls[stage] = "uncached"
+
+    def summary(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable cache statistics for logging.
+        """
+        with self._lock:
+            summary = {
+                "hits": str(self.hits),
+                "misses": str(self.misses),
+                "cache_read_tokens": str(self.cache_read_tokens),
+                "cache_creation_tokens": str(self.cache_creation_tokens),
+                "input_tokens": str(self.input_tokens),
+            }
+            summary.update({f"stage:{stage}": result for stage, result in self.calls.items()})
+            return summary
+
+
+# The stats of the turn currently running in this context (copied into worker threads and tasks)
+_turn_cache_stats: ContextVar[Optional[CacheStats]] = ContextVar("turn_cache_stats", default=None)
+
+
+def begin_turn_cache_stats() -> CacheStats:
+    """
+    Starts collecting cache statistics for a new turn in the current context.
+
+    Returns:
+        CacheStats: The stats object that LLM calls in this turn will record into.
+    """
+    stats = CacheStats()
+    _turn_cache_stats.set(stats)
+    return stats
+
+
+def current_turn_cache_stats() -> Optional[CacheStats]:
+    """
+    Returns:
+        Optional[CacheStats]: The stats of the turn running in the current context, if any.
+    """
+    return _turn_cache_stats.get()
+
+
+def record_cache_usage(stage: str, message: Any):
+    """
+    Records an LLM response's cache usage into the current turn's stats, if a turn is being tracked.
+
+    Args:
+        stage (str): The pipeline stage that made the call.
+        message (Any): The AIMessage or AIMessageChunk returned by LangChain.
+    """
+    stats = _turn_cache_stats.get()
+    if stats is not None:
+        stats.record(stage, message)
+
+
+def _extract_usage(message: Any) -> Optional[Dict[str, int]]:
+    # Non-streaming responses carry Anthropic's raw usage; stream chunks only carry LangChain's usage_metadata
+    usage = (getattr(message, "response_metadata", None) or {}).get("usage")
+    if usage:
+        cache_read = usage.get("cache_read_input_tokens", 0) or 0
+        cache_creation = usage.get("cache_creation_input_tokens", 0) or 0
+        return {
+            "input_tokens": (usage.get("input_tokens", 0) or 0) + cache_read + cache_creation,
+            "cache_read": cache_read,
+            "cache_creation": cache_creation,
+        }
+
+    usage_metadata = getattr(message, "usage_metadata", None)
+    if usage_metadata:
+        details = usage_metadata.get("input_token_details") or {}
+        return {
+            "input_tokens": usage_metadata.get("input_tokens", 0) or 0,
+            "cache_read": details.get("cache_read", 0) or 0,
+            "cache_creation": details.get("cache_creation", 0) or 0,
+        }
+    return None
@@ -0,0 +1,138 @@
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+from src.utils.constants import ExpertLLM
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query so trivially different phrasings ("How did I sleep?" / "how did i sleep") match.
+
+    Args:
+        query (str): The user's query.
+
+    Returns:
+        str: The lower-cased query without punctuation and with collapsed whitespace.
+    """
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+def fingerprint(text: str) -> str:
+    """
+    Returns:
+        str: A short, stable hash of the text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    generation_seconds: float  # What generating the response cost, i.e. what a hit saves
+    expires_at: float
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 10 * 60):
+        """
+        An in-process TTL + LRU cache of generated responses.
+
+        Entries are keyed by the user, the normalized query, the expert and its version, and a fingerprint
+        of the augmentation data, so a cached answer is only reused when the question, the persona and the
+        data it was based on are all unchanged.
+
+        Args:
+            max_entries (int): The most responses kept; the least recently used is dropped first.
+            ttl_seconds (float): How long a response may be reused.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(user_id: str, user_query: str, expert: ExpertLLM, augmentation_data: str) -> str:
+        """
+        Builds the cache key for a turn.
+
+        Args:
+            user_id (str): The user asking.
+            user_query (str): The user's query.
+            expert (ExpertLLM): The expert selected for the turn.
+            augmentation_data (str): The serialized tool outputs used in the prompt.
+
+        Returns:
+            str: The cache key.
+        """
+        return "|".join([
+            user_id,
+            normalize_query(user_query),
+            f"{expert.template_name}@{expert.version}",
+            fingerprint(augmentation_data),
+        ])
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Returns the cached response for a key, if it has not expired.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[CachedResponse]: The cached response, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.seconds_saved += entry.generation_seconds
+            return entry
+
+    def put(self, key: str, response: str, generation_seconds: float):
+        """
+        Stores a generated response.
+
+        Args:
+            key (str): The cache key.
+            response (str): The generated response.
+            generation_seconds (float): How long generation took.
+        """
+        with self._lock:
+            self._entries[key] = CachedResponse(response, generation_seconds, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable cache statistics for logging.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": f"{len(self._entries)} / {self.max_entries}",
+                "hits": str(self.hits),
+                "misses": str(self.misses),
+                "hit_rate": f"{self.hits / lookups:.0%}" if lookups else "n/a",
+                "time_saved": f"{self.seconds_saved:.2f}s",
+            }
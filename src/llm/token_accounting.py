@@ -0,0 +1,191 @@
+import re
+import math
+from typing import Dict, List
+from src.utils.constants import ChatMessage
+
+# Claude's tokenizer is a byte-pair encoding: common English words are a single token, long words split
+# into pieces of roughly six characters, digits group in threes, punctuation merges in pairs (e.g. `":`)
+# and non-ASCII characters cost about a token each. This mirrors those rules without a network call, but it
+# is an estimate, not the tokenizer's count.
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[ \t]+|\n|[^\sA-Za-z\d]{1,2}")
+
+# Estimates are inflated by this share so budgets built on them keep headroom for the estimate's error
+ESTIMATE_SAFETY_MARGIN = 0.15
+
+# Per-message overhead for the role and JSON framing used when history is serialized into prompts
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Once the context is over its budget it is trimmed down to this share of the budget, so the next few turns
+# fit without another eviction and the cached summary and older history stay the same between evictions.
+TRIM_TARGET_RATIO = 0.75
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates how many Claude tokens a piece of text will use, rounded up by ESTIMATE_SAFETY_MARGIN.
+
+    The count comes from a local heuristic rather than the tokenizer, so every budget that relies on it
+    (prompt, history window, augmentation) errs towards sending less.
+
+    Args:
+        text (str): The text to count tokens for.
+
+    Returns:
+        int: The estimated token count.
+    """
+    if not text:
+        return 0
+
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        first = piece[0]
+        if first.isalpha() and first.isascii():
+            tokens += 1 + (len(piece) - 1) // 6
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first == " " or first == "\t":
+            # A single space is merged into the following word; longer runs (indentation) cost one token
+            tokens += 0 if len(piece) == 1 else 1
+        elif piece.isascii():
+            tokens += 1
+        else:
+            tokens += len(piece)
+    return math.ceil(tokens * (1 + ESTIMATE_SAFETY_MARGIN))
+
+
+def message_tokens(message: ChatMessage) -> int:
+    """
+    Returns the token count of a chat message, counting it only once and caching the result on the message.
+
+    Args:
+        message (ChatMessage): The message to count.
+
+    Returns:
+        int: The estimated token count, including per-message overhead.
+    """
+    if message.token_count is None:
+        message.token_count = estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+    return message.token_count
+
+
+def messages_tokens(messages: List[ChatMessage]) -> int:
+    """
+    Returns:
+        int: The total token count of the messages.
+    """
+    return sum(message_tokens(message) for message in messages)
+
+
+def fit_newest_messages(messages: List[ChatMessage], budget: int) -> List[ChatMessage]:
+    """
+    Keeps the newest messages that fit within a token budget, preserving chronological order.
+
+    Args:
+        messages (List[ChatMessage]): The messages, oldest first.
+        budget (int): The token budget.
+
+    Returns:
+        List[ChatMessage]: The newest messages whose combined count fits the budget.
+    """
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        tokens = message_tokens(message)
+        if used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    return kept
+
+
+def evict_oldest_messages(messages: List[ChatMessage], token_count: int, max_tokens: int,
+                          target_ratio: float = TRIM_TARGET_RATIO) -> List[ChatMessage]:
+    """
+    Removes the oldest messages in place once their total exceeds the budget, down to target_ratio of it.
+
+    Args:
+        messages (List[ChatMessage]): The context, oldest first. Modified in place.
+        token_count (int): The current token count of the messages.
+        max_tokens (int): The token budget that triggers an eviction.
+        target_ratio (float): The share of the budget to trim down to.
+
+    Returns:
+        List[ChatMessage]: The evicted messages, oldest first; empty while the context is within budget.
+    """
+    if token_count <= max_tokens:
+        return []
+
+    target = int(max_tokens * target_ratio)
+    evict = 0
+    while evict < len(messages) and token_count > target:
+        token_count -= message_tokens(messages[evict])
+        evict += 1
+    evicted = messages[:evict]
+    del messages[:evict]
+    return evicted
+
+
+class PromptBudget:
+    def __init__(self, max_tokens: int):
+        """
+        Tracks how a prompt's token budget is spent across its parts (persona, history, augmentation, query).
+
+        Args:
+            max_tokens (int): The maximum number of input tokens for the whole prompt.
+        """
+        self.max_tokens = max_tokens
+        self.parts: Dict[str, int] = {}
+
+    def reserve(self, name: str, text: str) -> int:
+        """
+        Charges a fixed piece of the prompt against the budget.
+
+        Args:
+            name (str): The part name (e.g., "persona").
+            text (str): The text that will be sent.
+
+        Returns:
+            int: The tokens charged.
+        """
+        tokens = estimate_tokens(text)
+        self.parts[name] = self.parts.get(name, 0) + tokens
+        return tokens
+
+    def remaining(self) -> int:
+        """
+        Returns:
+            int: Tokens still available, never negative.
+        """
+        return max(0, self.max_tokens - self.used())
+
+    def used(self) -> int:
+        """
+        Returns:
+            int: Tokens charged so far.
+        """
+        return sum(self.parts.values())
+
+    def fit_messages(self, name: str, messages: List[ChatMessage]) -> List[ChatMessage]:
+        """
+        Keeps the newest messages that fit in the remaining budget and charges them.
+
+        Args:
+            name (str): The part name (e.g., "history").
+            messages (List[ChatMessage]): The messages, oldest first.
+
+        Returns:
+            List[ChatMessage]: The messages that fit, oldest first.
+        """
+        kept = fit_newest_messages(messages, self.remaining())
+        self.parts[name] = self.parts.get(name, 0) + messages_tokens(kept)
+        return kept
+
+    def summary(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Token usage per part and overall, for logging.
+        """
+        summary = {name: str(tokens) for name, tokens in self.parts.items()}
+        summary["total"] = f"{self.used()} / {self.max_tokens}"
+        return summary
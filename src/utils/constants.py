@@ -154,6 +154,13 @@ class ExpertLLM:
     when_to_use: str # a description for our selector LLM to know when to use this expert
     version: int
 
+@dataclass
+class RoutingDecision:
+    expert: ExpertLLM  # The expert that should answer this turn
+    tool_choices: List[Dict[str, Any]] = field(default_factory=list)  # [{"tool_name": ..., "params": {...}}]
+    switched_expert: bool = False  # Whether the router moved away from the current expert
+    reasoning: str = ""  # The router's explanation, for debugging
+
 @dataclass
 class ChatMessage:
     role: str  # "user" or "assistant"
@@ -161,6 +168,8 @@ class ChatMessage:
     expert_used: Optional[str] = None  # Template name of the ExpertLLM
     expert_version: Optional[int] = None  # Version of the ExpertLLM
     timestamp: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+    token_count: Optional[int] = field(default=None, repr=False, compare=False)  # Cached estimate, see token_accounting
+    seq: Optional[int] = field(default=None, compare=False)  # Position in the conversation, assigned when first stored
 
 @dataclass
 class ChatContext:
@@ -169,6 +178,8 @@ class ChatContext:
     context: List[ChatMessage] = field(default_factory=list)
     token_count: int = 0  # Current token count
     current_expert: Optional[ExpertLLM] = None  # Track the current expert
+    summary: str = ""  # Running summary of messages trimmed from the context
+    last_seq: int = -1  # Sequence number of the newest stored message
 
 @dataclass
 class Conversation:
@@ -176,11 +187,16 @@ class Conversation:
     user_id: str
     messages: List[ChatMessage] = field(default_factory=list)
     created_at: datetime.datetime = field(default_factory=datetime.datetime.utcnow)
+    summary: str = ""  # Running summary of messages no longer in `messages`
+    last_seq: int = -1  # Sequence number of the newest stored message
+    # Messages in the stored window left out by the load budget, oldest first; not yet in the summary either
+    unsummarized: List[ChatMessage] = field(default_factory=list)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "conversation_id": self.conversation_id,
             "user_id": self.user_id,
+            "summary": self.summary,
             "messages": [
                 {
                     "role": msg.role,
@@ -1,5 +1,6 @@
 import os
 from firebase_admin import credentials, firestore, initialize_app
+from google.cloud.firestore import AsyncClient
 
 # Path to the service account key
 SERVICE_KEY_PATH = os.path.join("secrets", "service_key.json")
@@ -21,3 +22,9 @@ try:
 
 except Exception as e:
     raise RuntimeError(f"Failed to initialize Firestore client: {e}")
+
+# Export async Firestore client for coroutine code paths (e.g. the Telegram bot's event loop)
+try:
+    async_firestore_client = AsyncClient(project=cred.project_id, credentials=cred.get_credential())
+except Exception as e:
+    raise RuntimeError(f"Failed to initialize async Firestore client: {e}")
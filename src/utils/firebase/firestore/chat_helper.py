@@ -1,9 +1,12 @@
 import os
+import asyncio
 from dataclasses import dataclass, field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 import datetime
+from firebase_admin import firestore
 from src.utils.constants import ChatMessage, Conversation
-from src.utils.firebase.firebase_init import firestore_client
+from src.llm.token_accounting import fit_newest_messages, message_tokens
+from src.utils.firebase.firebase_init import firestore_client, async_firestore_client
 
 # Initialize Firebase app
 SERVICE_KEY_PATH = os.path.join("secrets", "service_key.json")
@@ -12,82 +15,415 @@ if not os.path.exists(SERVICE_KEY_PATH):
 
 
 
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+
+# Messages fetched per query when paging through history
+DEFAULT_PAGE_SIZE = 50
+
+
+class _RecentWindow:
+    def __init__(self, window_start: int, token_budget: Optional[int]):
+        """
+        Collects messages read newest first until the stored window start is reached.
+
+        Once a message no longer fits the token budget, it and every older message in the window are kept
+        apart as skipped: they are not in the summary yet, so the caller must not drop them.
+        """
+        self.window_start = window_start
+        self.token_budget = token_budget
+        self.used = 0
+        self._newest_first: List[ChatMessage] = []
+        self._skipped_newest_first: List[ChatMessage] = []
+
+    def add(self, message: ChatMessage) -> bool:
+        """
+        Returns:
+            bool: False once the message falls outside the window, i.e. reading can stop.
+        """
+        if message.seq < self.window_start:
+            return False
+        tokens = message_tokens(message)
+        if self._skipped_newest_first or (self.token_budget is not None and self.used + tokens > self.token_budget):
+            self._skipped_newest_first.append(message)
+            return True
+        self.used += tokens
+        self._newest_first.append(message)
+        return True
+
+    def messages(self) -> List[ChatMessage]:
+        return list(reversed(self._newest_first))
+
+    def skipped(self) -> List[ChatMessage]:
+        return list(reversed(self._skipped_newest_first))
+
+
 class ChatHelper:
     def __init__(self):
+        """
+        Stores conversations append-only.
+
+        Layout:
+            conversations/{conversation_id}                  head: metadata, last_seq, window_start, summary
+            conversations/{conversation_id}/messages/{seq}   one document per message, seq zero-padded
+
+        Adding a message writes only that message and a few head fields, so write cost stays constant as
+        history grows and no document approaches Firestore's 1 MiB limit. Conversations saved in the old
+        layout (every message embedded in the head document) are migrated the first time they are loaded.
+        """
         self.db = firestore_client
+        self.async_db = async_firestore_client
+
+    def append_messages(self, conversation_id: str, user_id: str, messages: List[ChatMessage],
+                        window_start: Optional[int] = None):
+        """
+        Appends messages to a conversation in one batched write.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+            user_id (str): The owner of the conversation.
+            messages (List[ChatMessage]): The new messages, each with its `seq` assigned.
+            window_start (Optional[int]): The seq of the oldest message still in the context window.
+        """
+        doc_ref = self.db.collection("conversations").document(conversation_id)
+        for batch_writes in self._batched_writes(doc_ref, conversation_id, user_id, messages, window_start):
+            batch = self.db.batch()
+            for ref, data, merge in batch_writes:
+                batch.set(ref, data, merge=merge)
+            batch.commit()
 
     def save_conversation(self, conversation: Conversation):
         """
         Saves a conversation to the Firestore database.
 
+        Messages without a `seq` are numbered after `conversation.last_seq` and appended; messages that
+        were already stored are not written again.
+
         Args:
             conversation (Conversation): The conversation to save.
         """
-        doc_ref = self.db.collection("conversations").document(conversation.conversation_id)
-        doc_ref.set(conversation.to_dict())
+        new_messages = self._assign_seqs(conversation)
+        self.append_messages(conversation.conversation_id, conversation.user_id, new_messages)
+        if conversation.summary:
+            self.save_summary(conversation.conversation_id, conversation.summary,
+                              window_start=self._window_start(conversation))
+
+    def save_summary(self, conversation_id: str, summary: str, window_start: Optional[int] = None):
+        """
+        Saves only the running summary of a conversation, leaving its messages untouched.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+            summary (str): The updated summary.
+            window_start (Optional[int]): The seq of the first message the summary does not cover. Written in
+                the same update as the summary, so reloads only skip messages that are summarized.
+        """
+        doc_ref = self.db.collection("conversations").document(conversation_id)
+        doc_ref.set(self._summary_fields(summary, window_start), merge=True)
+
+    async def asave_summary(self, conversation_id: str, summary: str, window_start: Optional[int] = None):
+        """
+        Async version of `save_summary`.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+            summary (str): The updated summary.
+            window_start (Optional[int]): The seq of the first message the summary does not cover.
+        """
+        doc_ref = self.async_db.collection("conversations").document(conversation_id)
+        await doc_ref.set(self._summary_fields(summary, window_start), merge=True)
+
+    @staticmethod
+    def _summary_fields(summary: str, window_start: Optional[int]) -> Dict[str, Any]:
+        fields: Dict[str, Any] = {"summary": summary}
+        if window_start is not None:
+            fields["window_start"] = window_start
+        return fields
 
     def update_conversation(self, conversation: Conversation):
         """
-        Updates an existing conversation in the Firestore database.
+        Updates an existing conversation in the Firestore database by appending its unsaved messages.
 
         Args:
             conversation (Conversation): The conversation to update.
         """
-        doc_ref = self.db.collection("conversations").document(conversation.conversation_id)
-        doc_ref.update({
-            "messages": [
-                {
-                    "role": msg.role,
-                    "content": msg.content,
-                    "expert_used": msg.expert_used,
-                    "expert_version": msg.expert_version,
-                    "timestamp": msg.timestamp.isoformat(),
-                }
-                for msg in conversation.messages
-            ],
-        })
+        self.save_conversation(conversation)
 
     def load_conversation(self, conversation_id: str) -> Conversation:
         """
         Loads a conversation from Firestore.
 
+        Only the messages from the stored window start onward are read.
+
         Args:
             conversation_id (str): The ID of the conversation to load.
 
         Returns:
             Conversation: The loaded conversation.
         """
+        return self.load_recent_messages(conversation_id)
+
+    def load_recent_messages(self, conversation_id: str, token_budget: Optional[int] = None,
+                             page_size: int = DEFAULT_PAGE_SIZE) -> Conversation:
+        """
+        Loads a conversation with only its most recent messages.
+
+        Messages are read newest first, one ordered, limited page at a time, until the stored window start
+        (older messages are already folded into the summary). The newest messages that fit the token budget
+        become `messages`; older ones inside the window go to `unsummarized` so the caller can summarize them.
+        Load time therefore depends on the window, not on the length of the conversation.
+
+        Args:
+            conversation_id (str): The ID of the conversation to load.
+            token_budget (Optional[int]): The most message tokens to load; None loads the whole window.
+            page_size (int): The number of messages fetched per query.
+
+        Returns:
+            Conversation: The conversation, its messages oldest first.
+        """
         doc_ref = self.db.collection("conversations").document(conversation_id)
         doc = doc_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
-            return Conversation(
-                conversation_id=data["conversation_id"],
-                user_id=data["user_id"],
-                messages=[
-                    ChatMessage(
-                        role=msg["role"],
-                        content=msg["content"],
-                        expert_used=msg["expert_used"],
-                        expert_version=msg["expert_version"],
-                        timestamp=datetime.datetime.fromisoformat(msg["timestamp"]),
-                    )
-                    for msg in data["messages"]
-                ],
-                created_at=datetime.datetime.fromisoformat(data["created_at"]),
-            )
-        raise ValueError(f"Conversation with ID {conversation_id} not found.")
+        if not doc.exists:
+            raise ValueError(f"Conversation with ID {conversation_id} not found.")
+
+        data = doc.to_dict()
+        if "messages" in data:
+            conversation = self._migrate_legacy_conversation(doc_ref, data)
+            if token_budget is not None:
+                recent = fit_newest_messages(conversation.messages, token_budget)
+                conversation.unsummarized = conversation.messages[:len(conversation.messages) - len(recent)]
+                conversation.messages = recent
+            return conversation
+
+        window = _RecentWindow(data.get("window_start", 0), token_budget)
+        for message in self.iter_older_messages(conversation_id, data.get("last_seq", -1) + 1, page_size):
+            if not window.add(message):
+                break
+        conversation = self._conversation_from_head(data, window.messages())
+        conversation.unsummarized = window.skipped()
+        return conversation
+
+    async def aload_recent_messages(self, conversation_id: str, token_budget: Optional[int] = None,
+                                    page_size: int = DEFAULT_PAGE_SIZE) -> Conversation:
+        """
+        Async version of `load_recent_messages`.
+
+        Args:
+            conversation_id (str): The ID of the conversation to load.
+            token_budget (Optional[int]): The most message tokens to load; None loads the whole window.
+            page_size (int): The number of messages fetched per query.
+
+        Returns:
+            Conversation: The conversation, its messages oldest first.
+        """
+        doc_ref = self.async_db.collection("conversations").document(conversation_id)
+        doc = await doc_ref.get()
+        if not doc.exists:
+            raise ValueError(f"Conversation with ID {conversation_id} not found.")
+
+        data = doc.to_dict()
+        if "messages" in data:
+            # Migration is a one-off; reuse the sync path rather than duplicating it
+            return await asyncio.to_thread(self.load_recent_messages, conversation_id, token_budget, page_size)
+
+        window = _RecentWindow(data.get("window_start", 0), token_budget)
+        async for message in self.aiter_older_messages(conversation_id, data.get("last_seq", -1) + 1, page_size):
+            if not window.add(message):
+                break
+        conversation = self._conversation_from_head(data, window.messages())
+        conversation.unsummarized = window.skipped()
+        return conversation
+
+    def iter_older_messages(self, conversation_id: str, before_seq: int,
+                            page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[ChatMessage]:
+        """
+        Lazily yields the messages before a given seq, newest first.
+
+        Each page is fetched only when the caller iterates past the previous one, so scrolling back
+        through history costs one query per page actually read.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+            before_seq (int): Only messages with a lower seq are yielded.
+            page_size (int): The number of messages fetched per query.
+
+        Yields:
+            ChatMessage: The older messages, newest first.
+        """
+        messages_ref = self.db.collection("conversations").document(conversation_id).collection("messages")
+        while before_seq > 0:
+            page = [self._message_from_dict(message_doc.to_dict())
+                    for message_doc in self._page_query(messages_ref, before_seq, page_size).stream()]
+            yield from page
+            if len(page) < page_size:
+                return
+            before_seq = page[-1].seq
+
+    async def aiter_older_messages(self, conversation_id: str, before_seq: int,
+                                   page_size: int = DEFAULT_PAGE_SIZE) -> AsyncIterator[ChatMessage]:
+        """
+        Async version of `iter_older_messages`.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+            before_seq (int): Only messages with a lower seq are yielded.
+            page_size (int): The number of messages fetched per query.
+
+        Yields:
+            ChatMessage: The older messages, newest first.
+        """
+        messages_ref = self.async_db.collection("conversations").document(conversation_id).collection("messages")
+        while before_seq > 0:
+            page = [self._message_from_dict(message_doc.to_dict())
+                    async for message_doc in self._page_query(messages_ref, before_seq, page_size).stream()]
+            for message in page:
+                yield message
+            if len(page) < page_size:
+                return
+            before_seq = page[-1].seq
+
+    @staticmethod
+    def _page_query(messages_ref, before_seq: int, page_size: int):
+        """
+        Builds the query for one page of messages older than `before_seq`, newest first.
+        """
+        return (messages_ref
+                .where("seq", "<", before_seq)
+                .order_by("seq", direction=firestore.Query.DESCENDING)
+                .limit(page_size))
+
+    def _migrate_legacy_conversation(self, doc_ref, data: Dict[str, Any]) -> Conversation:
+        """
+        Moves the messages of a conversation stored in the old embedded-array layout into the messages
+        subcollection and strips them from the head document.
+        """
+        messages = [self._message_from_dict(msg) for msg in data["messages"]]
+        for seq, message in enumerate(messages):
+            message.seq = seq
+        conversation = self._conversation_from_head(data, messages)
+
+        self.append_messages(conversation.conversation_id, conversation.user_id, messages,
+                             window_start=self._window_start(conversation))
+        doc_ref.update({"messages": firestore.DELETE_FIELD})
+        return conversation
+
+    def _batched_writes(self, doc_ref, conversation_id: str, user_id: str, messages: List[ChatMessage],
+                        window_start: Optional[int]) -> Iterator[List[Tuple[Any, Dict[str, Any], bool]]]:
+        """
+        Splits the message writes plus the head update into groups that fit in one Firestore batch.
+
+        Yields:
+            List[Tuple[Any, Dict[str, Any], bool]]: (document reference, data, merge) for each write.
+        """
+        if not messages:
+            return
+
+        head = {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "last_seq": messages[-1].seq,
+            "updated_at": messages[-1].timestamp,
+        }
+        if messages[0].seq == 0:
+            head["created_at"] = messages[0].timestamp
+        if window_start is not None:
+            head["window_start"] = window_start
+
+        writes = [
+            (doc_ref.collection("messages").document(self.message_id(msg.seq)), self._message_to_dict(msg), False)
+            for msg in messages
+        ]
+        # The head goes in the last batch, so last_seq never points past a message that was not written
+        writes.append((doc_ref, head, True))
+        for i in range(0, len(writes), MAX_BATCH_WRITES):
+            yield writes[i:i + MAX_BATCH_WRITES]
+
+    @staticmethod
+    def message_id(seq: int) -> str:
+        """
+        Returns the document ID of a message; zero-padding keeps IDs in conversation order.
+        """
+        return f"{seq:010d}"
+
+    @staticmethod
+    def _assign_seqs(conversation: Conversation) -> List[ChatMessage]:
+        """
+        Numbers the conversation's unsaved messages after its last stored seq.
+
+        Returns:
+            List[ChatMessage]: The messages that still have to be written.
+        """
+        new_messages = [msg for msg in conversation.messages if msg.seq is None]
+        for msg in new_messages:
+            conversation.last_seq += 1
+            msg.seq = conversation.last_seq
+        return new_messages
+
+    @staticmethod
+    def _window_start(conversation: Conversation) -> int:
+        return conversation.messages[0].seq if conversation.messages else conversation.last_seq + 1
+
+    @staticmethod
+    def _message_to_dict(msg: ChatMessage) -> Dict[str, Any]:
+        return {
+            "seq": msg.seq,
+            "role": msg.role,
+            "content": msg.content,
+            "expert_used": msg.expert_used,
+            "expert_version": msg.expert_version,
+            "timestamp": msg.timestamp,  # Stored as a native Firestore timestamp, no parsing on load
+            "token_count": message_tokens(msg),
+        }
+
+    @staticmethod
+    def _message_from_dict(data: Dict[str, Any]) -> ChatMessage:
+        return ChatMessage(
+            role=data["role"],
+            content=data["content"],
+            expert_used=data["expert_used"],
+            expert_version=data["expert_version"],
+            timestamp=_as_datetime(data["timestamp"]),
+            seq=data.get("seq"),
+            token_count=data.get("token_count"),
+        )
+
+    @staticmethod
+    def _conversation_from_head(data: Dict[str, Any], messages: List[ChatMessage]) -> Conversation:
+        """
+        Builds a Conversation from a stored head document and the messages loaded for it.
+        """
+        return Conversation(
+            conversation_id=data["conversation_id"],
+            user_id=data["user_id"],
+            messages=messages,
+            created_at=_as_datetime(data["created_at"]),
+            summary=data.get("summary", ""),
+            last_seq=data.get("last_seq", messages[-1].seq if messages else -1),
+        )
 
     def delete_conversation(self, conversation_id: str):
         """
-        Deletes a conversation from Firestore.
+        Deletes a conversation and all of its messages from Firestore.
 
         Args:
             conversation_id (str): The ID of the conversation to delete.
         """
         doc_ref = self.db.collection("conversations").document(conversation_id)
+        message_refs = [message_doc.reference for message_doc in doc_ref.collection("messages").stream()]
+        for i in range(0, len(message_refs), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for ref in message_refs[i:i + MAX_BATCH_WRITES]:
+                batch.delete(ref)
+            batch.commit()
         doc_ref.delete()
 
+def _as_datetime(value: Any) -> datetime.datetime:
+    # Older documents store ISO 8601 strings; newer ones store native Firestore timestamps
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
 # Example usage
 if __name__ == "__main__":
     chat_helper = ChatHelper()
@@ -0,0 +1,262 @@
+import time
+import atexit
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+from src.utils.constants import ChatMessage
+
+if TYPE_CHECKING:
+    # Importing chat_helper connects to Firestore, so the queue itself only needs it for the shared instance
+    from src.utils.firebase.firestore.chat_helper import ChatHelper
+
+
+@dataclass
+class PendingWrite:
+    conversation_id: str
+    user_id: str
+    messages: List[ChatMessage]
+    window_start: Optional[int] = None
+    future: Future = field(default_factory=Future)  # Resolves once the messages are committed
+    retried: bool = False  # Put back after a failed commit
+
+
+class WriteBehindQueue:
+    def __init__(self, chat_helper: "ChatHelper", flush_interval: float = 1.0, max_pending: int = 20,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        """
+        Buffers message writes and commits them to Firestore in batches on a background thread.
+
+        Pending writes for the same conversation are coalesced into one `append_messages` batch. The queue
+        flushes every `flush_interval` seconds, as soon as `max_pending` messages are waiting, when a flush
+        is requested, and at interpreter exit. Failed writes are kept and retried with exponential backoff;
+        until the backoff has passed they are not retried by the timer and do not count towards `max_pending`,
+        and newer writes of the same conversation wait behind them so commits stay in seq order. Message
+        documents are keyed by seq, so retrying is idempotent.
+
+        Args:
+            chat_helper (ChatHelper): The helper used to commit the writes.
+            flush_interval (float): The most seconds a write waits before it is committed.
+            max_pending (int): The number of pending messages that triggers an immediate flush.
+            retry_delay (float): Seconds before the first retry of a failed commit; doubled on each failure.
+            max_retry_delay (float): The longest delay between retries.
+        """
+        self.chat_helper = chat_helper
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushes = 0
+        self.messages_written = 0
+        self.failed_flushes = 0
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._consecutive_failures = 0
+        self._retry_at = 0.0  # time.monotonic() before which failed writes are not retried
+        self._pending: List[PendingWrite] = []
+        self._committing: List[PendingWrite] = []  # Taken from _pending by the flush in progress
+        self._flush_requested = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="firestore-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, conversation_id: str, user_id: str, messages: List[ChatMessage],
+                window_start: Optional[int] = None, flush_now: bool = False) -> Future:
+        """
+        Queues messages to be appended to a conversation.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+            user_id (str): The owner of the conversation.
+            messages (List[ChatMessage]): The new messages, each with its `seq` assigned.
+            window_start (Optional[int]): The seq of the oldest message still in the context window.
+            flush_now (bool): If True, commits without waiting for the timer.
+
+        Returns:
+            Future: Resolves to None once the messages are committed, or raises the commit error.
+        """
+        write = PendingWrite(conversation_id, user_id, list(messages), window_start)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The write-behind queue is closed.")
+            self._pending.append(write)
+            self._flush_requested = self._flush_requested or flush_now
+            self._condition.notify()
+        return write.future
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Commits everything queued so far and waits for it.
+
+        Args:
+            timeout (Optional[float]): The most seconds to wait, or None to wait until done.
+
+        Raises:
+            Exception: The first commit error (or a TimeoutError). Failed writes stay queued for a retry, so
+                callers that read from Firestore afterwards should account for `pending_messages`.
+        """
+        with self._condition:
+            futures = [write.future for write in self._committing + self._pending]
+            self._flush_requested = True
+            self._condition.notify()
+        error = None
+        for future in futures:
+            try:
+                future.result(timeout=timeout)
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def pending_messages(self, conversation_id: str) -> List[ChatMessage]:
+        """
+        Returns the messages of a conversation that are queued or being committed, i.e. not yet readable from
+        Firestore.
+
+        Args:
+            conversation_id (str): The ID of the conversation.
+
+        Returns:
+            List[ChatMessage]: The messages, ordered by seq.
+        """
+        with self._condition:
+            messages = {message.seq: message for write in self._committing + self._pending
+                        if write.conversation_id == conversation_id for message in write.messages}
+        return [messages[seq] for seq in sorted(messages)]
+
+    def close(self):
+        """
+        Flushes the remaining writes and stops the background thread.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def pending_count(self) -> int:
+        """
+        Returns:
+            int: The number of messages waiting to be committed.
+        """
+        with self._condition:
+            return sum(len(write.messages) for write in self._pending)
+
+    def stats(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Human-readable queue statistics for logging.
+        """
+        with self._condition:
+            average_batch = self.messages_written / self.flushes if self.flushes else 0.0
+            return {
+                "pending": str(sum(len(write.messages) for write in self._pending)),
+                "flushes": str(self.flushes),
+                "messages_written": str(self.messages_written),
+                "average_batch_size": f"{average_batch:.1f}",
+                "failed_flushes": str(self.failed_flushes),
+            }
+
+    def _backing_off(self) -> bool:
+        return time.monotonic() < self._retry_at
+
+    def _should_flush(self) -> bool:
+        if self._closed or self._flush_requested:
+            return True
+        backing_off = self._backing_off()
+        ready = sum(len(write.messages) for write in self._pending if not (backing_off and write.retried))
+        return ready >= self.max_pending
+
+    def _take_due_writes(self, forced: bool) -> List[PendingWrite]:
+        """
+        Removes and returns the writes to commit now. While backing off (and unless a flush is forced), failed
+        writes stay queued, and so do newer writes of their conversations.
+        """
+        if forced or not self._backing_off():
+            writes, self._pending = self._pending, []
+            return writes
+        held = {write.conversation_id for write in self._pending if write.retried}
+        writes = [write for write in self._pending if write.conversation_id not in held]
+        self._pending = [write for write in self._pending if write.conversation_id in held]
+        return writes
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(self._should_flush, timeout=self.flush_interval)
+                closed = self._closed
+                writes = self._take_due_writes(forced=closed or self._flush_requested)
+                self._flush_requested = False
+                self._committing = writes
+
+            if writes:
+                self._commit(writes)
+                with self._condition:
+                    self._committing = []
+            if closed:
+                return  # One final attempt at shutdown; there is no later flush to retry in
+
+    def _commit(self, writes: List[PendingWrite]):
+        """
+        Commits the writes grouped by conversation, in the order they were queued.
+        """
+        by_conversation: Dict[str, List[PendingWrite]] = {}
+        for write in writes:
+            by_conversation.setdefault(write.conversation_id, []).append(write)
+
+        for conversation_id, conversation_writes in by_conversation.items():
+            messages = [message for write in conversation_writes for message in write.messages]
+            window_starts = [write.window_start for write in conversation_writes if write.window_start is not None]
+            try:
+                self.chat_helper.append_messages(
+                    conversation_id,
+                    conversation_writes[-1].user_id,
+                    messages,
+                    window_start=window_starts[-1] if window_starts else None
+                )
+            except Exception as e:
+                with self._condition:
+                    self.failed_flushes += 1
+                    self._consecutive_failures += 1
+                    delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self._consecutive_failures - 1))
+                    self._retry_at = time.monotonic() + delay
+                    # Retry later with fresh futures; the callers waiting on these ones get the error now
+                    self._pending[:0] = [
+                        PendingWrite(write.conversation_id, write.user_id, write.messages, write.window_start,
+                                     retried=True)
+                        for write in conversation_writes
+                    ]
+                for write in conversation_writes:
+                    write.future.set_exception(e)
+                continue
+
+            with self._condition:
+                self.flushes += 1
+                self.messages_written += len(messages)
+                self._consecutive_failures = 0
+            for write in conversation_writes:
+                write.future.set_result(None)
+
+
+_shared_queue: Optional[WriteBehindQueue] = None
+_shared_queue_lock = threading.Lock()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """
+    Returns the process-wide write-behind queue, creating it on first use.
+
+    Sharing one queue lets writes from every conversation in the process coalesce into the same flushes,
+    and lets a freshly created ChatApplication flush another instance's pending writes before it loads.
+
+    Returns:
+        WriteBehindQueue: The shared queue.
+    """
+    from src.utils.firebase.firestore.chat_helper import ChatHelper
+
+    global _shared_queue
+    with _shared_queue_lock:
+        if _shared_queue is None:
+            _shared_queue = WriteBehindQueue(ChatHelper())
+        return _shared_queue
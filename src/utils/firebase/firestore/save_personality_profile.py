@@ -3,6 +3,7 @@ import datetime
 from firebase_admin import firestore
 from src.utils.firebase.firebase_init import firestore_client
 from src.utils.constants import PersonalityProfile
+from src.llm.context.tools.tool_cache import tool_result_cache
 
 # Load personality profile from an external JSON file
 JSON_FILE_PATH = "./src/utils/firebase/firestore/my_data.json"
@@ -38,6 +39,7 @@ def store_user_profile(uid: str, profile_data: PersonalityProfile):
 
         # Set the user profile in the personality_profiles collection
         profiles_collection.document(uid).set(profile_data, merge=True)
+        tool_result_cache.invalidate("Read Personality Profile", user_id=uid)
         print(f"Personality profile for UID {uid} stored successfully in 'personality_profiles' collection.")
     except Exception as e:
         print(f"An error occurred while storing the user profile: {e}")
@@ -2,6 +2,7 @@ from src.utils.firebase.firebase_init import firestore_client
 from typing import Optional, Union
 from src.utils.constants import User
 from dataclasses import asdict
+from src.llm.context.tools.tool_cache import tool_result_cache
 def crud_user_secret(uid, key, action, value=None):
     try:
         # Query the users collection to find the document where UID matches the provided uid
@@ -60,6 +61,7 @@ def save_user_to_firestore(user: Union[dict, 'User']):
             # Create new user
             firestore_client.collection("users").add(user_data)
 
+        tool_result_cache.invalidate("Get Basic User Info", user_id=uid)
         print("User saved successfully.")
     except Exception as e:
         print(f"Error saving user: {e}")
@@ -0,0 +1,100 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# (connect, read) seconds for every outbound HTTP request a tool makes, so one slow call cannot stall a chat turn
+REQUEST_TIMEOUT = (3.05, 10)
+
+
+class TurnTimer:
+    def __init__(self):
+        """
+        Records the wall time of each stage in a chat turn.
+
+        Stages may run concurrently (e.g. in a thread pool), so recording is guarded by a lock.
+        """
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Times the wrapped block and records it under the given stage name.
+
+        Args:
+            name (str): The name of the stage (e.g., "expert_selection").
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        """
+        Records a stage duration measured elsewhere.
+
+        Args:
+            name (str): The name of the stage.
+            seconds (float): The wall time of the stage in seconds.
+        """
+        with self._lock:
+            self.stages[name] = seconds
+
+    def elapsed(self) -> float:
+        """
+        Returns:
+            float: Seconds since the timer was created.
+        """
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> Dict[str, str]:
+        """
+        Formats the recorded stages and the total turn time for logging.
+
+        Returns:
+            Dict[str, str]: Stage names mapped to durations like "1.23s".
+        """
+        with self._lock:
+            formatted = {name: f"{seconds:.2f}s" for name, seconds in self.stages.items()}
+        formatted["total"] = f"{self.elapsed():.2f}s"
+        return formatted
+
+
+class TurnDeadline:
+    def __init__(self, seconds: float):
+        """
+        The time by which a turn's data gathering has to be done, so generation can start on time.
+
+        Stages that run before generation (tool selection, tool execution) take their budgets from what is
+        left, rather than each having an independent timeout that could add up past the deadline.
+
+        Args:
+            seconds (float): Seconds from now until the deadline.
+        """
+        self.seconds = seconds
+        self.expires_at = time.perf_counter() + seconds
+
+    def remaining(self) -> float:
+        """
+        Returns:
+            float: Seconds left until the deadline, never negative.
+        """
+        return max(0.0, self.expires_at - time.perf_counter())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def budget(self, limit: float) -> float:
+        """
+        Returns the time a stage may take: its own limit, capped by what is left of the deadline.
+
+        Args:
+            limit (float): The stage's own timeout in seconds.
+
+        Returns:
+            float: The stage budget in seconds.
+        """
+        return min(limit, self.remaining())
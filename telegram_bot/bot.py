@@ -1,9 +1,14 @@
 from dotenv import load_dotenv
 from typing import Final
 import os
+import time
 from telegram import Update
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from src.functions.chat.chat_application import ChatApplication
+from src.functions.chat.session_manager import ChatSessionManager, telegram_session_ids
+from src.functions.chat.conversation_scheduler import AsyncKeyedLock
+from src.llm.response_cache import ResponseCache
+from telegram_bot.config import MAX_CHAT_SESSIONS, TELEGRAM_OWNER_CHAT_ID
 
 
 # Load environment variables
@@ -11,7 +16,18 @@ load_dotenv()
 
 TELEGRAM_BOT_TOKEN: Final = os.getenv("TELEGRAM_BOT_TOKEN")
 BOT_USERNAME: Final = os.getenv("TELEGRAM_BOT_USERNAME")
-chat_app = ChatApplication(user_id="g", conversation_id="g_telegram_chat", max_context_tokens=10000, debug=False)
+ROUTING_MODE: Final = os.getenv("CHAT_ROUTING_MODE", "multi_call")  # "multi_call" or "single_call"
+# Telegram allows roughly one message edit per second per chat, and messages are capped at 4096 characters
+EDIT_INTERVAL_SECONDS: Final = 1.0
+MAX_MESSAGE_LENGTH: Final = 4096
+# Opt-in: reuse answers to repeated questions while the expert and the tool data are unchanged
+response_cache = ResponseCache() if os.getenv("CHAT_RESPONSE_CACHE", "").lower() in ("1", "true") else None
+# One ChatApplication per Telegram chat, so chats never share a context
+sessions = ChatSessionManager(max_sessions=MAX_CHAT_SESSIONS, max_context_tokens=10000, debug=False,
+                              routing_mode=ROUTING_MODE, response_cache=response_cache)
+# Turns run on the event loop via astream_chat, so other chats keep flowing; turns within one chat
+# run one at a time, in arrival order, to keep its context consistent.
+chat_locks = AsyncKeyedLock()
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -20,6 +36,23 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("This bot doesn't have much functionality yet. Good luck!")
 
+async def edit_placeholder(message, text: str) -> bool:
+    """
+    Edits the placeholder message, ignoring edits Telegram rejects as unchanged or rate limited.
+
+    Returns:
+        bool: True if the edit went through.
+    """
+    try:
+        await message.edit_text(text[:MAX_MESSAGE_LENGTH])
+        return True
+    except RetryAfter:
+        return False
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            return False
+        raise
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Send "Thinking..." message immediately
     thinking_message = await update.message.reply_text("🧠 Thinking...")
@@ -30,15 +63,31 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     print(f'User ({update.message.chat.id}) in {message_type}: "{text}"')
 
-    # Use ChatApplication to generate a response
+    # Stream the response into the "Thinking..." message, throttled to Telegram's edit rate limit
+    response = ""
+    shown = ""
+    last_edit = 0.0
+    user_id, conversation_id = telegram_session_ids(update.message.chat.id, TELEGRAM_OWNER_CHAT_ID)
     try:
-        chat_app.chat(text)  # Process the user's input
-        response = chat_app.output_manager.logs[-1]  # Get the last logged response
+        if chat_locks.depth(conversation_id):
+            print(f"Queued behind {chat_locks.depth(conversation_id)} turn(s) in {conversation_id}")
+        async with chat_locks.hold(conversation_id):
+            with sessions.use(user_id, conversation_id) as chat_app:
+                async for chunk in chat_app.astream_chat(text):
+                    response += chunk
+                    now = time.monotonic()
+                    if now - last_edit >= EDIT_INTERVAL_SECONDS and response.strip() != shown:
+                        if await edit_placeholder(thinking_message, response.strip() + " ▌"):
+                            shown = response.strip()
+                        last_edit = now
+        response = response.strip()
     except Exception as e:
         response = f"An error occurred: {str(e)}"
-    
-    # Edit the "Thinking..." message with the actual response
-    await thinking_message.edit_text(response)
+
+    # Edit the "Thinking..." message with the full response, sending any overflow as extra messages
+    await edit_placeholder(thinking_message, response or "🤷 No response.")
+    for start in range(MAX_MESSAGE_LENGTH, len(response), MAX_MESSAGE_LENGTH):
+        await update.message.reply_text(response[start:start + MAX_MESSAGE_LENGTH])
 
 
 async def error(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -49,7 +98,7 @@ if __name__ == "__main__":
     print("Starting bot...")
     
     # Initialize bot application
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    app = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).build()
     
     # Command handlers
     app.add_handler(CommandHandler("start", start_command))
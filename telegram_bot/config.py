@@ -3,3 +3,7 @@ import os
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_APP_USER_ID = "g"  # Replace with dynamic handling if needed
+# The owner's Telegram chat ID. The owner's chat keeps the "g" user, the "g_telegram_chat" conversation and the
+# owner-only tools; other chats get their own sessions. Unset, every chat shares the owner's session as before.
+TELEGRAM_OWNER_CHAT_ID = os.getenv("TELEGRAM_OWNER_CHAT_ID")
+MAX_CHAT_SESSIONS = int(os.getenv("MAX_CHAT_SESSIONS", "100"))
@@ -0,0 +1,87 @@
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict
+
+from src.llm.context.tools.augmentation_compactor import (AugmentationCompactor, _fit_sections, _truncate,
+                                                          encode_table, reduce_generic)
+from src.llm.token_accounting import estimate_tokens
+
+
+@dataclass
+class FakeToolResponse:
+    # The shape of tool_handler.ToolResponse that the compactor reads
+    tool_name: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    output: Any = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _section(name: str, rows: int) -> str:
+    return "\n".join([f"### {name}", "start|strain"] + [f"2025-01-{row + 1:02d}|{row}.5" for row in range(rows)])
+
+
+def test_sections_within_budget_are_untouched():
+    sections = [_section("Sleep", 3), _section("Recovery", 3)]
+
+    assert _fit_sections(sections, 10_000) == (sections, [])
+
+
+def test_small_sections_stay_whole_and_large_ones_share_the_rest():
+    small, large_a, large_b = _section("Small", 2), _section("Large A", 200), _section("Large B", 200)
+    budget = estimate_tokens(small) + 400
+
+    fitted, truncated = _fit_sections([large_a, small, large_b], budget)
+
+    assert fitted[1] == small
+    assert truncated == ["Large A", "Large B"]
+    assert sum(estimate_tokens(section) for section in fitted) <= budget + 20  # Truncation markers add a little
+
+
+def test_truncate_keeps_header_and_newest_rows():
+    section = _section("Sleep", 100)
+
+    truncated = _truncate(section, 60)
+
+    lines = truncated.split("\n")
+    assert lines[:3] == ["### Sleep", "start|strain", "2025-01-01|0.5"]
+    assert lines[-1].startswith("[truncated: ")
+    assert int(lines[-1].split()[1]) == 102 - (len(lines) - 1)
+
+
+def test_truncate_cuts_a_single_long_line():
+    truncated = _truncate("### Profile\n" + "x" * 10_000, 50)
+
+    assert truncated.startswith("### Profile\nxxx")
+    assert len(truncated) < 1_000
+    assert truncated.endswith("[truncated: 1 more lines]")
+
+
+def test_generic_reducer_drops_empty_values_and_rounds():
+    assert reduce_generic({"name": " Ada ", "pets": [], "note": None, "score": 1.23456}) == '{"name":"Ada","score":1.23}'
+
+
+def test_uniform_records_become_a_table():
+    assert encode_table([{"a": 1, "b": True}, {"a": 2, "c": "x|y"}]) == "a|b|c\n1|y|\n2||x/y"
+
+
+def test_whoop_records_are_projected_and_converted():
+    sleep = {"start": "2025-01-02T23:10:00.000Z", "nap": False,
+             "score": {"sleep_performance_percentage": 91, "stage_summary": {"total_rem_sleep_time_milli": 5_400_000},
+                       "sleep_needed": {"baseline_milli": 27_000_000}}}
+
+    section = AugmentationCompactor().compact([FakeToolResponse("WHOOP Data - Sleep", {"num_days": 1}, [sleep])]).text
+
+    assert section == "### WHOOP Data - Sleep (num_days=1)\nstart|nap|performance_pct|rem_h|need_h\n" \
+                      "2025-01-02 23:10|n|91|1.5|7.5"
+
+
+def test_compact_reports_savings_and_truncations():
+    compactor = AugmentationCompactor()
+    records = [{"start": f"2025-01-{day:02d}T08:00:00Z", "score": {"strain": 10.123 + day}} for day in range(1, 29)]
+
+    result = compactor.compact([FakeToolResponse("WHOOP Data - Cycle", {"num_days": 28}, records)], max_tokens=50)
+
+    assert result.truncated_tools == ["WHOOP Data - Cycle (num_days=28)"]
+    assert result.saved_tokens > 0
+    assert compactor.stats()["truncated_sections"] == "1"
@@ -0,0 +1,58 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("langchain_anthropic")
+
+from anthropic import APITimeoutError  # noqa: E402
+
+from src.llm import client_pool  # noqa: E402
+from src.llm.client_pool import LLMClientPool, request_timeout  # noqa: E402
+from src.utils.timing import TurnDeadline  # noqa: E402
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_POST(self):
+        SlowHandler.requests += 1
+        time.sleep(3)  # Longer than the turn budget; the client must give up first
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_api(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    SlowHandler.requests = 0
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(client_pool, "llm_client_pool", LLMClientPool())
+    yield
+    server.shutdown()
+
+
+def test_timed_out_pre_generation_call_returns_within_the_budget(slow_api):
+    deadline = TurnDeadline(0.5)
+    timeout = request_timeout(deadline)
+    model = client_pool.get_chat_model(deadline=deadline)
+
+    start = time.perf_counter()
+    with pytest.raises(APITimeoutError):
+        model.invoke("hi", timeout=timeout)
+
+    assert time.perf_counter() - start < timeout + 0.5
+    assert SlowHandler.requests == 1  # Not retried
+
+
+def test_calls_without_a_deadline_keep_the_sdk_retries():
+    pool = LLMClientPool()
+
+    assert pool.get(max_retries=client_pool.DEFAULT_MAX_RETRIES).max_retries == 2
+    assert pool.get(max_retries=0) is not pool.get()
+    assert pool.get() is pool.get()
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.functions.chat.conversation_scheduler import AsyncKeyedLock, ConversationScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = ConversationScheduler(max_workers=4)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_turns_of_one_conversation_run_in_order(scheduler):
+    order = []
+
+    def turn(i):
+        time.sleep(0.01 * (5 - i))  # Earlier turns are slower, so parallel runs would reorder them
+        order.append(i)
+
+    futures = [scheduler.submit("a", turn, i) for i in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_conversations_run_in_parallel(scheduler):
+    barrier = threading.Barrier(2, timeout=5)
+
+    futures = [scheduler.submit(key, barrier.wait) for key in ("a", "b")]
+
+    for future in futures:
+        future.result(timeout=5)  # Would time out if "b" waited for "a"
+
+
+def test_errors_reach_the_caller_and_later_turns_still_run(scheduler):
+    def fail():
+        raise ValueError("bad turn")
+
+    failed = scheduler.submit("a", fail)
+    after = scheduler.submit("a", lambda: "ok")
+
+    with pytest.raises(ValueError):
+        failed.result(timeout=5)
+    assert after.result(timeout=5) == "ok"
+
+
+def test_scheduler_stats_count_started_turns(scheduler):
+    scheduler.submit("a", lambda: None).result(timeout=5)
+    scheduler.submit("a", lambda: None).result(timeout=5)
+
+    stats = scheduler.stats()
+    assert stats["started"] == "2"
+    assert stats["waiting"] == "0"
+
+
+def test_async_lock_serializes_a_conversation_in_arrival_order():
+    async def main():
+        lock, order = AsyncKeyedLock(), []
+
+        async def turn(i):
+            async with lock.hold("a"):
+                order.append(("start", i))
+                await asyncio.sleep(0.01)
+                order.append(("end", i))
+
+        await asyncio.gather(*(turn(i) for i in range(3)))
+        return lock, order
+
+    lock, order = asyncio.run(main())
+
+    assert order == [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+    assert lock.stats()["active_conversations"] == "0"  # Locks are dropped once unused
+
+
+def test_async_lock_lets_other_conversations_proceed():
+    async def main():
+        lock = AsyncKeyedLock()
+        b_done = asyncio.Event()
+
+        async def slow_a():
+            async with lock.hold("a"):
+                await asyncio.wait_for(b_done.wait(), timeout=5)
+
+        async def b():
+            async with lock.hold("b"):
+                b_done.set()
+
+        await asyncio.gather(slow_a(), b())
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        lock = AsyncKeyedLock()
+        release = asyncio.Event()
+
+        async def holder():
+            async with lock.hold("a"):
+                await release.wait()
+
+        async def waiter():
+            async with lock.hold("a"):
+                pass
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert lock.depth("a") == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        depth_after_cancel = lock.depth("a")
+        release.set()
+        await holding
+        return lock, depth_after_cancel
+
+    lock, depth_after_cancel = asyncio.run(main())
+
+    assert depth_after_cancel == 0
+    assert lock.stats()["active_conversations"] == "0"
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from src.utils.constants import ChatMessage
+from src.utils.firebase.firestore.persistence_queue import WriteBehindQueue
+
+
+class FakeChatHelper:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def append_messages(self, conversation_id, user_id, messages, window_start=None):
+        with self.lock:
+            self.calls.append((time.monotonic(), conversation_id, [message.seq for message in messages]))
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("Firestore unavailable")
+            self.batches.append((conversation_id, [message.seq for message in messages]))
+
+
+def _messages(*seqs):
+    return [ChatMessage(role="user", content=f"message {seq}", seq=seq) for seq in seqs]
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(helper, **kwargs):
+        kwargs.setdefault("flush_interval", 60.0)
+        queue = WriteBehindQueue(helper, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def test_writes_of_a_conversation_are_coalesced_into_one_batch(make_queue):
+    helper = FakeChatHelper()
+    queue = make_queue(helper)
+    queue.enqueue("a", "u", _messages(1, 2))
+    queue.enqueue("b", "u", _messages(1))
+    queue.enqueue("a", "u", _messages(3))
+
+    queue.flush(timeout=5)
+
+    assert sorted(helper.batches) == [("a", [1, 2, 3]), ("b", [1])]
+    assert queue.stats()["flushes"] == "2"
+
+
+def test_max_pending_triggers_a_flush_without_the_timer(make_queue):
+    helper = FakeChatHelper()
+    queue = make_queue(helper, max_pending=3)
+
+    future = queue.enqueue("a", "u", _messages(1, 2, 3))
+
+    future.result(timeout=5)
+    assert helper.batches == [("a", [1, 2, 3])]
+
+
+def test_flush_raises_the_commit_error_and_keeps_the_writes(make_queue):
+    helper = FakeChatHelper(failures=1)
+    queue = make_queue(helper, retry_delay=60.0)
+    queue.enqueue("a", "u", _messages(1, 2))
+
+    with pytest.raises(ConnectionError):
+        queue.flush(timeout=5)
+
+    assert [message.seq for message in queue.pending_messages("a")] == [1, 2]
+    assert queue.pending_count() == 2
+    assert queue.stats()["failed_flushes"] == "1"
+
+
+def test_failed_writes_are_not_retried_in_a_tight_loop(make_queue):
+    helper = FakeChatHelper(failures=100)
+    queue = make_queue(helper, max_pending=2, flush_interval=0.05, retry_delay=0.2, max_retry_delay=0.4)
+    queue.enqueue("a", "u", _messages(1, 2))
+
+    time.sleep(1.0)
+
+    # Retries wait 0.2s, then 0.4s; without backoff the 2 pending messages would retry non-stop
+    assert 2 <= len(helper.calls) <= 5
+    gaps = [later[0] - earlier[0] for earlier, later in zip(helper.calls, helper.calls[1:])]
+    assert all(gap >= 0.15 for gap in gaps)
+
+
+def test_other_conversations_flush_while_a_failed_one_backs_off(make_queue):
+    helper = FakeChatHelper(failures=1)
+    queue = make_queue(helper, max_pending=2, flush_interval=0.05, retry_delay=0.5)
+    queue.enqueue("a", "u", _messages(1, 2))
+    deadline = time.monotonic() + 5
+    while queue.stats()["failed_flushes"] == "0" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    queue.enqueue("b", "u", _messages(1, 2)).result(timeout=5)
+    assert helper.batches == [("b", [1, 2])]
+
+    queue.flush(timeout=5)
+    assert helper.batches[-1] == ("a", [1, 2])
+
+
+def test_newer_writes_wait_behind_a_failed_write_of_the_same_conversation(make_queue):
+    helper = FakeChatHelper(failures=1)
+    queue = make_queue(helper, retry_delay=0.2)
+    queue.enqueue("a", "u", _messages(1))
+    with pytest.raises(ConnectionError):
+        queue.flush(timeout=5)
+
+    queue.enqueue("a", "u", _messages(2))
+    queue.flush(timeout=5)
+
+    assert helper.batches == [("a", [1, 2])]
+    assert queue.pending_messages("a") == []
+
+
+def test_close_commits_what_is_left(make_queue):
+    helper = FakeChatHelper()
+    queue = make_queue(helper)
+    queue.enqueue("a", "u", _messages(1))
+
+    queue.close()
+
+    assert helper.batches == [("a", [1])]
+    with pytest.raises(RuntimeError):
+        queue.enqueue("a", "u", _messages(2))
@@ -0,0 +1,69 @@
+from typing import List, Tuple
+
+from src.llm.prompt_cache import split_history_for_cache
+from src.llm.token_accounting import evict_oldest_messages, messages_tokens
+from src.utils.constants import ChatMessage
+
+MAX_TOKENS = 2000
+MESSAGE_TOKENS = 100
+
+
+class TrimmedContext:
+    # The parts of ChatApplication's turn loop that decide the cached prompt blocks
+    def __init__(self, messages: int, target_ratio: float):
+        self.target_ratio = target_ratio
+        self.context: List[ChatMessage] = []
+        self.evicted: List[ChatMessage] = []
+        self.next_seq = 0
+        for _ in range(messages):
+            self.add("user")
+
+    def add(self, role: str):
+        self.context.append(ChatMessage(role=role, content=f"message {self.next_seq}", token_count=MESSAGE_TOKENS,
+                                        seq=self.next_seq))
+        self.next_seq += 1
+        self.evicted += evict_oldest_messages(self.context, messages_tokens(self.context), MAX_TOKENS,
+                                              self.target_ratio)
+
+    def turn(self) -> Tuple[List[int], List[int]]:
+        """
+        Returns:
+            Tuple[List[int], List[int]]: The seqs in the cached summary and the cached older-history block.
+        """
+        self.add("user")
+        older_history, _ = split_history_for_cache(self.context[:-1])
+        cached = ([message.seq for message in self.evicted], [message.seq for message in older_history])
+        self.add("assistant")
+        return cached
+
+
+def test_within_budget_nothing_is_evicted():
+    messages = [ChatMessage(role="user", content="hi", token_count=MESSAGE_TOKENS) for _ in range(3)]
+
+    assert evict_oldest_messages(messages, 300, 300) == []
+    assert len(messages) == 3
+
+
+def test_over_budget_trims_to_the_target_ratio():
+    messages = [ChatMessage(role="user", content="hi", token_count=MESSAGE_TOKENS, seq=seq) for seq in range(21)]
+
+    evicted = evict_oldest_messages(messages, 2100, MAX_TOKENS)
+
+    assert [message.seq for message in evicted] == list(range(6))
+    assert messages_tokens(messages) == 1500
+
+
+def test_consecutive_turns_at_capacity_keep_the_cached_blocks():
+    context = TrimmedContext(messages=MAX_TOKENS // MESSAGE_TOKENS, target_ratio=0.75)
+
+    first = context.turn()
+    second = context.turn()
+
+    assert first[0]  # The first turn went over the budget and evicted a chunk
+    assert second == first
+
+
+def test_trimming_one_message_per_turn_changes_the_cached_blocks():
+    context = TrimmedContext(messages=MAX_TOKENS // MESSAGE_TOKENS, target_ratio=1.0)
+
+    assert context.turn() != context.turn()
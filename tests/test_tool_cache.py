@@ -0,0 +1,188 @@
+import threading
+import time
+import types
+
+import pytest
+
+from src.llm.context.tools import tool_cache
+from src.llm.context.tools.tool_cache import ToolResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tool_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def cache():
+    cache = ToolResultCache()
+    yield cache
+    cache._refresh_executor.shutdown(wait=True)
+
+
+class Counter:
+    def __init__(self, prefix="result"):
+        self.prefix = prefix
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f"{self.prefix} {self.calls}"
+
+
+def _wait_for_refreshes(cache):
+    cache._refresh_executor.submit(lambda: None).result(timeout=5)
+    cache._refresh_executor.shutdown(wait=True)
+
+
+def test_fresh_result_is_served_from_cache(cache, clock):
+    run = Counter()
+    assert cache.get_or_run("Sleep", "u", {"num_days": 7}, run, ttl_seconds=60) == "result 1"
+    clock.now += 59
+
+    assert cache.get_or_run("Sleep", "u", {"num_days": 7}, run, ttl_seconds=60) == "result 1"
+    assert run.calls == 1
+    assert cache.stats()["hits"] == "1"
+
+
+def test_users_and_params_get_separate_entries(cache, clock):
+    run = Counter()
+    cache.get_or_run("Sleep", "a", {"num_days": 7}, run, ttl_seconds=60)
+    cache.get_or_run("Sleep", "b", {"num_days": 7}, run, ttl_seconds=60)
+    cache.get_or_run("Sleep", "a", {"num_days": 3}, run, ttl_seconds=60)
+
+    assert run.calls == 3
+
+
+def test_stale_result_is_served_and_refreshed_in_background(cache, clock):
+    run = Counter()
+    cache.get_or_run("Sleep", "u", {}, run, ttl_seconds=60, stale_seconds=60)
+    clock.now += 90
+
+    assert cache.get_or_run("Sleep", "u", {}, run, ttl_seconds=60, stale_seconds=60) == "result 1"
+    _wait_for_refreshes(cache)
+
+    assert cache.get_or_run("Sleep", "u", {}, run, ttl_seconds=60, stale_seconds=60) == "result 2"
+    assert cache.stats()["stale_hits"] == "1"
+    assert cache.stats()["background_refreshes"] == "1"
+
+
+def test_result_past_the_stale_window_is_fetched_again(cache, clock):
+    run = Counter()
+    cache.get_or_run("Sleep", "u", {}, run, ttl_seconds=60, stale_seconds=60)
+    clock.now += 121
+
+    assert cache.get_or_run("Sleep", "u", {}, run, ttl_seconds=60, stale_seconds=60) == "result 2"
+    assert cache.stats()["misses"] == "2"
+
+
+def test_errors_are_not_cached(cache, clock):
+    def fail():
+        raise RuntimeError("API down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_run("Sleep", "u", {}, fail, ttl_seconds=60)
+
+    assert cache.get_or_run("Sleep", "u", {}, Counter(), ttl_seconds=60) == "result 1"
+
+
+def test_concurrent_misses_share_one_run(cache, clock):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "shared"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_run("Sleep", "u", {}, slow, 60)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(cache.get_or_run("Sleep", "u", {}, slow, 60)))
+    second.start()
+    deadline = time.monotonic() + 5
+    while cache.stats()["joined_in_flight"] == "0" and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert results == ["shared", "shared"]
+    assert len(calls) == 1
+
+
+def test_invalidate_drops_only_the_matching_entries(cache, clock):
+    run = Counter()
+    cache.get_or_run("Sleep", "a", {}, run, ttl_seconds=60)
+    cache.get_or_run("Sleep", "b", {}, run, ttl_seconds=60)
+    cache.get_or_run("Recovery", "a", {}, run, ttl_seconds=60)
+
+    assert cache.invalidate("Sleep", user_id="a") == 1
+
+    assert cache.get_or_run("Sleep", "a", {}, run, ttl_seconds=60) == "result 4"
+    assert cache.get_or_run("Sleep", "b", {}, run, ttl_seconds=60) == "result 2"
+    assert cache.get_or_run("Recovery", "a", {}, run, ttl_seconds=60) == "result 3"
+
+
+def test_run_that_started_before_an_invalidation_is_not_stored(cache, clock):
+    started, release = threading.Event(), threading.Event()
+
+    def read_before_write():
+        started.set()
+        release.wait(5)
+        return "old data"
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(
+        cache.get_or_run("Profile", "u", {}, read_before_write, ttl_seconds=60)))
+    thread.start()
+    started.wait(5)
+    cache.invalidate("Profile", user_id="u")
+    release.set()
+    thread.join(5)
+
+    assert results == ["old data"]  # The caller that ran it still gets its answer
+    assert cache.get_or_run("Profile", "u", {}, lambda: "new data", ttl_seconds=60) == "new data"
+
+
+def test_refresh_that_started_before_an_invalidation_is_not_stored(cache, clock):
+    cache.get_or_run("Profile", "u", {}, lambda: "v1", ttl_seconds=60, stale_seconds=60)
+    clock.now += 90
+    started, release = threading.Event(), threading.Event()
+
+    def refresh():
+        started.set()
+        release.wait(5)
+        return "old data"
+
+    cache.get_or_run("Profile", "u", {}, refresh, ttl_seconds=60, stale_seconds=60)
+    started.wait(5)
+    cache.invalidate("Profile", user_id="u")
+    release.set()
+    _wait_for_refreshes(cache)
+
+    assert cache.get_or_run("Profile", "u", {}, lambda: "new data", ttl_seconds=60) == "new data"
+
+
+def test_disk_tier_survives_a_new_cache_and_honours_invalidate(tmp_path, clock):
+    first = ToolResultCache(disk_dir=str(tmp_path))
+    first.get_or_run("Sleep", "u", {"num_days": 7}, lambda: {"hours": 8}, ttl_seconds=60)
+
+    second = ToolResultCache(disk_dir=str(tmp_path))
+    assert second.get_or_run("Sleep", "u", {"num_days": 7}, Counter(), ttl_seconds=60) == {"hours": 8}
+
+    first.invalidate("Sleep", user_id="u")
+    third = ToolResultCache(disk_dir=str(tmp_path))
+    assert third.get_or_run("Sleep", "u", {"num_days": 7}, Counter(), ttl_seconds=60) == "result 1"
@@ -0,0 +1,120 @@
+import pytest
+
+from src.llm.context.tools.tool_plan import (MAX_NUM_DAYS, PLAN_TOOL_NAME, plan_from_response, plan_tools_schema,
+                                             validate_tool_plan)
+
+
+class FakeResponse:
+    def __init__(self, content="", tool_calls=None):
+        self.content = content
+        self.tool_calls = tool_calls or []
+
+
+def test_valid_plan_passes_unchanged():
+    plan, repairs = validate_tool_plan([
+        {"tool_name": "WHOOP Data - Sleep", "params": {"num_days": 3}},
+        {"tool_name": "Query the User", "params": {"query": "How did you feel today?"}},
+    ])
+
+    assert plan == [
+        {"tool_name": "WHOOP Data - Sleep", "params": {"num_days": 3}},
+        {"tool_name": "Query the User", "params": {"query": "How did you feel today?"}},
+    ]
+    assert repairs == []
+
+
+def test_misspelled_tool_name_is_mapped_to_the_registered_one():
+    plan, repairs = validate_tool_plan([{"tool_name": "whoop data - slep", "params": {"num_days": 2}}])
+
+    assert plan == [{"tool_name": "WHOOP Data - Sleep", "params": {"num_days": 2}}]
+    assert repairs == ["Renamed 'whoop data - slep' to 'WHOOP Data - Sleep'"]
+
+
+def test_unknown_tools_and_malformed_choices_are_dropped():
+    plan, repairs = validate_tool_plan([{"tool_name": "Stock Prices", "params": {}}, "WHOOP Data - Sleep", None])
+
+    assert plan == []
+    assert len(repairs) == 3
+
+
+@pytest.mark.parametrize("raw, expected", [("5", 5), (4.0, 4), ("2.5", 2)])
+def test_params_are_coerced_to_their_declared_type(raw, expected):
+    plan, _ = validate_tool_plan([{"tool_name": "WHOOP Data - Recovery", "params": {"num_days": raw}}])
+
+    assert plan[0]["params"] == {"num_days": expected}
+
+
+@pytest.mark.parametrize("raw, expected", [(0, 1), (-3, 1), (365, MAX_NUM_DAYS)])
+def test_num_days_is_clamped(raw, expected):
+    plan, repairs = validate_tool_plan([{"tool_name": "WHOOP Data - Workout", "params": {"num_days": raw}}])
+
+    assert plan[0]["params"] == {"num_days": expected}
+    assert repairs == [f"Clamped num_days={raw} for 'WHOOP Data - Workout'"]
+
+
+def test_missing_and_invalid_params_fall_back_to_defaults():
+    plan, repairs = validate_tool_plan([
+        {"tool_name": "WHOOP Data - Cycle"},
+        {"tool_name": "EZChecklist Data", "params": {"num_days": "a week"}},
+    ])
+
+    assert [choice["params"] for choice in plan] == [{"num_days": 7}, {"num_days": 7}]
+    assert repairs == ["Replaced invalid num_days='a week' for 'EZChecklist Data'"]
+
+
+def test_params_given_as_a_json_string_are_parsed():
+    plan, _ = validate_tool_plan([{"tool_name": "WHOOP Data - Sleep", "params": '{"num_days": 14}'}])
+
+    assert plan[0]["params"] == {"num_days": 14}
+
+
+def test_unknown_params_are_dropped():
+    plan, repairs = validate_tool_plan([{"tool_name": "Read Personality Profile", "params": {"depth": "full"}}])
+
+    assert plan == [{"tool_name": "Read Personality Profile", "params": {}}]
+    assert repairs == ["Dropped unknown params ['depth'] for 'Read Personality Profile'"]
+
+
+def test_choice_missing_a_param_without_default_is_dropped():
+    plan, repairs = validate_tool_plan([{"tool_name": "Query the User", "params": {}}])
+
+    assert plan == []
+    assert repairs == ["Dropped 'Query the User': missing required param 'query'"]
+
+
+def test_duplicates_are_removed():
+    choice = {"tool_name": "WHOOP Data - Sleep", "params": {"num_days": 7}}
+
+    plan, repairs = validate_tool_plan([choice, dict(choice), {"tool_name": "WHOOP Data - Sleep"}])
+
+    assert plan == [choice]
+    assert repairs == ["Dropped duplicate 'WHOOP Data - Sleep'", "Dropped duplicate 'WHOOP Data - Sleep'"]
+
+
+def test_plan_that_is_not_a_list_is_rejected():
+    assert validate_tool_plan({"tool_name": "WHOOP Data - Sleep"}) == ([], ["Dropped a plan of type dict"])
+
+
+def test_plan_is_read_from_the_forced_tool_call():
+    tools = [{"tool_name": "WHOOP Data - Sleep", "params": {"num_days": 1}}]
+    response = FakeResponse(tool_calls=[{"name": PLAN_TOOL_NAME, "args": {"tools": tools}}])
+
+    assert plan_from_response(response) == tools
+
+
+def test_plan_falls_back_to_a_json_array_in_the_text():
+    response = FakeResponse('Here is the plan: [{"tool_name": "Get Far Horizon Context", "params": {}}]')
+
+    assert plan_from_response(response) == [{"tool_name": "Get Far Horizon Context", "params": {}}]
+    assert plan_from_response(FakeResponse("No tools needed.")) == []
+
+
+def test_schema_has_one_exact_item_schema_per_tool():
+    items = plan_tools_schema()["input_schema"]["properties"]["tools"]["items"]["oneOf"]
+    by_tool = {item["properties"]["tool_name"]["const"]: item["properties"]["params"] for item in items}
+
+    assert by_tool["Query the User"]["properties"] == {"query": {"type": "string"}}
+    assert by_tool["Query the User"]["required"] == ["query"]
+    assert by_tool["WHOOP Data - Sleep"]["properties"]["num_days"]["maximum"] == MAX_NUM_DAYS
+    assert by_tool["WHOOP Data - Sleep"]["required"] == []
+    assert all(params["additionalProperties"] is False for params in by_tool.values())
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from src.llm.context.tools import tool_preselector
+from src.llm.context.tools.tool_preselector import (FOUNDATIONAL_TOOLS, MIN_SIMILARITY_EXAMPLES, ToolPreselector,
+                                                    parse_num_days)
+from src.llm.response_cache import normalize_query
+
+
+@pytest.fixture
+def preselector():
+    return ToolPreselector(shadow_rate=0.0)
+
+
+def _choices(*names):
+    return [{"tool_name": name, "params": {}} for name in names]
+
+
+def _teach(preselector, count, tools):
+    for i in range(count):
+        preselector.learn(f"filler question {i} topic{i}", tools)
+
+
+@pytest.mark.parametrize("query", ["hi", "Thanks so much!", "ok", "good morning", ""])
+def test_small_talk_needs_no_tools(preselector, query):
+    result = preselector.preselect(query)
+
+    assert result.confident
+    assert result.tool_choices == []
+    assert result.source == "small_talk"
+
+
+def test_specific_keyword_is_confident_and_adds_foundational_tools(preselector):
+    result = preselector.preselect("How did I sleep over the last 3 days?")
+
+    assert result.confident
+    assert result.source == "rules"
+    assert result.confidence == pytest.approx(0.9)
+    assert result.tool_choices[0] == {"tool_name": "WHOOP Data - Sleep", "params": {"num_days": 3}}
+    assert [choice["tool_name"] for choice in result.tool_choices[1:]] == list(FOUNDATIONAL_TOOLS)
+
+
+@pytest.mark.parametrize("query", ["What is my purpose?", "Should I change my morning routine?",
+                                   "Any tips for training a puppy?"])
+def test_broad_keyword_alone_goes_to_the_llm(preselector, query):
+    result = preselector.preselect(query)
+
+    assert not result.confident
+    assert result.confidence == pytest.approx(0.6)
+    assert result.guess  # Kept to measure how often the rules would have been right
+
+
+def test_confidence_drops_with_each_matched_tool(preselector):
+    two = preselector.preselect("compare my sleep and my hrv")
+    four = preselector.preselect("compare my sleep, hrv, strain and workouts")
+
+    assert two.confident and two.confidence == pytest.approx(0.9 * 0.95)
+    assert not four.confident
+
+
+def test_foundational_tools_follow_what_the_llm_usually_picks(preselector):
+    _teach(preselector, MIN_SIMILARITY_EXAMPLES, ["Get Basic User Info", "WHOOP Data - Recovery"])
+
+    result = preselector.preselect("how is my hrv")
+
+    assert [choice["tool_name"] for choice in result.tool_choices] == ["WHOOP Data - Recovery", "Get Basic User Info"]
+
+
+def test_similarity_needs_enough_examples(preselector):
+    preselector.learn("what should i eat before a marathon", ["Get Basic User Info"])
+
+    assert not preselector.preselect("what should i eat before a marathon").confident
+
+    _teach(preselector, MIN_SIMILARITY_EXAMPLES, ["Query the User"])
+    result = preselector.preselect("what should i eat before a marathon")
+
+    assert result.confident
+    assert result.source == "similarity"
+    assert result.tool_choices == [{"tool_name": "Get Basic User Info", "params": {}}]
+
+
+def test_plans_that_need_llm_params_are_never_reused(preselector):
+    _teach(preselector, MIN_SIMILARITY_EXAMPLES, [])
+    preselector.learn("what should i eat before a marathon", ["Query the User"])
+
+    assert not preselector.preselect("what should i eat before a marathon").confident
+
+
+def test_observe_records_agreement_for_confident_and_unsure_picks(preselector):
+    query = "how did i sleep"
+    confident = preselector.preselect(query)
+    preselector.observe(query, confident, _choices(*confident.guess))
+    unsure = preselector.preselect("what is my purpose")
+    preselector.observe("what is my purpose", unsure, _choices("Get Far Horizon Context"))
+
+    stats = preselector.stats()
+    assert stats["agreement_rules"] == "100% of 1"
+    assert stats["agreement_unsure_guess"] == "0% of 1"
+    assert stats["llm_calls_skipped"] == "1 / 2"
+
+
+def test_shadow_checks_confident_picks_in_the_background():
+    preselector = ToolPreselector(shadow_rate=1.0)
+    result = preselector.preselect("how did i sleep")
+
+    preselector.maybe_shadow("how did i sleep", result, lambda query: _choices("WHOOP Data - Sleep"))
+    preselector._shadow_executor.shutdown(wait=True)
+
+    assert preselector.stats()["agreement_rules"] == "0% of 1"
+
+
+def test_examples_persist_across_instances(tmp_path):
+    path = str(tmp_path / "examples.json")
+    ToolPreselector(examples_path=path).learn("plan my week", ["EZChecklist Data"])
+
+    assert json.load(open(path)) == [{"query": "plan my week", "tools": ["EZChecklist Data"]}]
+    assert ToolPreselector(examples_path=path).stats()["examples"] == "1"
+
+
+def test_default_shadow_rate_checks_some_confident_picks():
+    assert tool_preselector.ToolPreselector().shadow_rate > 0
+
+
+@pytest.mark.parametrize("query, days", [("last 3 days", 3), ("past two weeks", 14), ("last night", 1),
+                                         ("yesterday", 2), ("this month", 30), ("lately", 7)])
+def test_parse_num_days(query, days):
+    assert parse_num_days(normalize_query(query)) == days
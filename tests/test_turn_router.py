@@ -0,0 +1,78 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from src.llm.intelligence.turn_router import TurnRouter  # noqa: E402
+from src.utils.constants import ChatMessage, Conversation  # noqa: E402
+
+
+class FakeModel:
+    def __init__(self, content):
+        self.content = content
+        self.messages = None
+
+    def invoke(self, messages, timeout=None):
+        self.messages = messages
+        return SimpleNamespace(content=self.content, response_metadata={}, usage_metadata=None)
+
+
+def _router(content):
+    router = TurnRouter.__new__(TurnRouter)  # No client needed; every call goes to the fake model
+    router.fake = FakeModel(content)
+    router._model = lambda deadline: router.fake
+    return router
+
+
+def _conversation(*contents, expert=None):
+    messages = [ChatMessage(role="user" if i % 2 == 0 else "assistant", content=content,
+                            expert_used=expert if i % 2 else None) for i, content in enumerate(contents)]
+    return Conversation(conversation_id="c", user_id="u", messages=messages)
+
+
+def test_valid_decision_is_parsed_and_its_tools_validated():
+    router = _router(json.dumps({"expert": "Lao Tzu", "reasoning": "Calm question.",
+                                 "tools": [{"tool_name": "whoop data - slep", "params": {"num_days": "3"}}]}))
+
+    decision = router.route(_conversation("How did I sleep?"), "How did I sleep?", current_expert="Uncle Iroh")
+
+    assert decision.expert.template_name == "Lao Tzu"
+    assert decision.switched_expert
+    assert decision.tool_choices == [{"tool_name": "WHOOP Data - Sleep", "params": {"num_days": 3}}]
+
+
+@pytest.mark.parametrize("content", ["I think Lao Tzu should answer.", '{"expert": "Lao Tzu", "tools": [', "{}"])
+def test_unusable_answer_falls_back_to_the_current_expert_without_tools(content):
+    decision = _router(content).route(_conversation("hi"), "hi", current_expert="James Clear")
+
+    assert decision.expert.template_name == "James Clear"
+    assert decision.tool_choices == []
+    assert not decision.switched_expert
+
+
+def test_unusable_answer_without_current_expert_restores_the_last_one():
+    conversation = _conversation("hi", "hello", "what now?", expert="Lao Tzu")
+
+    decision = _router("not json").route(conversation, "what now?")
+
+    assert decision.expert.template_name == "Lao Tzu"
+
+
+def test_unusable_answer_on_a_new_conversation_uses_the_default_expert():
+    decision = _router("not json").route(_conversation("hi"), "hi")
+
+    assert decision.expert.template_name == "Uncle Iroh"  # First in experts.csv
+
+
+def test_history_sent_to_the_router_is_bounded():
+    router = _router(json.dumps({"expert": "Lao Tzu", "tools": []}))
+    conversation = _conversation(*[f"message {i} " + "word " * 200 for i in range(100)])
+
+    router.route(conversation, "latest")
+
+    prompt = router.fake.messages[-1].content
+    assert "message 99" in prompt
+    assert "message 0 " not in prompt
+    assert len(prompt) < TurnRouter.MAX_HISTORY_TOKENS * 6
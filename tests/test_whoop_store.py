@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.llm.context.tools.whoop import whoop_store
+from src.llm.context.tools.whoop.whoop_store import WhoopStore
+
+
+def _record(record_id, start, updated_at, score_state="SCORED"):
+    return {"id": record_id, "start": start.isoformat(), "end": (start + timedelta(hours=8)).isoformat(),
+            "updated_at": updated_at.isoformat(), "score_state": score_state}
+
+
+class FakeApi:
+    def __init__(self, records):
+        self.records = {record["id"]: record for record in records}
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        return [record for record in self.records.values()
+                if start <= datetime.fromisoformat(record["start"]) < end]
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self, tz=None):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(datetime(2025, 3, 1, 12, tzinfo=timezone.utc))
+    monkeypatch.setattr(whoop_store, "datetime", type("FakeDatetime", (datetime,), {"now": staticmethod(clock)}))
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path):
+    return WhoopStore(str(tmp_path / "whoop.sqlite3"))
+
+
+def test_first_request_fetches_window_and_serves_newest_first(store, clock):
+    day = timedelta(days=1)
+    api = FakeApi([_record(i, clock.now - i * day, clock.now - i * day) for i in range(1, 4)])
+
+    records = store.records("u", "sleep", 7, api)
+
+    assert [record["id"] for record in records] == [1, 2, 3]
+    assert api.calls == [(clock.now - 7 * day, clock.now)]
+
+
+def test_repeat_request_within_sync_interval_skips_the_api(store, clock):
+    api = FakeApi([])
+    store.records("u", "sleep", 7, api)
+    clock.now += timedelta(minutes=1)
+
+    store.records("u", "sleep", 7, api)
+
+    assert len(api.calls) == 1
+    assert store.stats()["answered_without_api"] == "1"
+
+
+def test_longer_window_backfills_only_older_history(store, clock):
+    api = FakeApi([])
+    store.records("u", "sleep", 7, api)
+    clock.now += timedelta(minutes=1)
+
+    store.records("u", "sleep", 30, api)
+
+    assert api.calls[1] == (clock.now - timedelta(days=30), clock.now - timedelta(minutes=1) - timedelta(days=7))
+
+
+def test_delta_starts_at_watermark_less_rescore_window(store, clock):
+    # The device last uploaded five days ago, so a late upload can hold records that start before the
+    # rescore window measured from the last sync
+    last_upload = clock.now - timedelta(days=5)
+    api = FakeApi([_record(1, last_upload - timedelta(hours=8), last_upload)])
+    store.records("u", "sleep", 30, api)
+    clock.now += timedelta(hours=1)
+
+    store.records("u", "sleep", 30, api)
+
+    assert api.calls[-1] == (last_upload - whoop_store.RESCORE_WINDOW, clock.now)
+
+
+def test_delta_reaches_back_to_earliest_pending_record(store, clock):
+    pending_start = clock.now - timedelta(days=10)
+    api = FakeApi([_record(1, pending_start, clock.now, score_state="PENDING_SCORE")])
+    store.records("u", "sleep", 30, api)
+    clock.now += timedelta(hours=1)
+
+    store.records("u", "sleep", 30, api)
+
+    assert api.calls[-1][0] == pending_start
+
+
+def test_only_newer_versions_are_upserted(store, clock):
+    start = clock.now - timedelta(days=1)
+    api = FakeApi([_record(1, start, start)])
+    store.records("u", "sleep", 7, api)
+    clock.now += timedelta(hours=1)
+
+    store.records("u", "sleep", 7, api)
+    assert store.stats()["records_upserted"] == "1"
+
+    api.records[1] = dict(_record(1, start, clock.now), score={"sleep_performance_percentage": 90})
+    clock.now += timedelta(hours=1)
+    records = store.records("u", "sleep", 7, api)
+
+    assert store.stats()["records_upserted"] == "2"
+    assert records[0]["score"] == {"sleep_performance_percentage": 90}
+
+
+def test_daily_full_sync_picks_up_old_rescores_and_deletions(store, clock):
+    old, recent = clock.now - timedelta(days=20), clock.now - timedelta(hours=10)
+    api = FakeApi([_record(1, old, old), _record(2, old + timedelta(days=1), old + timedelta(days=1)),
+                   _record(3, recent, recent)])
+    store.records("u", "sleep", 30, api)
+
+    api.records[1] = dict(_record(1, old, clock.now), score={"rescored": True})
+    del api.records[2]
+    clock.now += timedelta(hours=1)
+    records = store.records("u", "sleep", 30, api)
+    assert [record["id"] for record in records] == [3, 2, 1]  # Before the delta range, so not seen yet
+    assert "score" not in records[2]
+
+    clock.now += whoop_store.FULL_SYNC_INTERVAL
+    records = store.records("u", "sleep", 30, api)
+
+    assert [record["id"] for record in records] == [3, 1]
+    assert records[1]["score"] == {"rescored": True}
+    assert store.stats()["records_deleted"] == "1"
+    assert store.stats()["full_syncs"] == "2"
+
+
+def test_recoveries_missing_from_a_range_are_kept(store, clock):
+    created = clock.now - timedelta(days=1)
+    recovery = {"cycle_id": 7, "created_at": created.isoformat(), "updated_at": created.isoformat(),
+                "score_state": "SCORED"}
+    store.records("u", "recovery", 7, lambda start, end: [recovery])
+    clock.now += timedelta(hours=1)
+
+    records = store.records("u", "recovery", 7, lambda start, end: [])
+
+    assert records == [recovery]
+
+
+def test_users_and_data_types_are_kept_apart(store, clock):
+    start = clock.now - timedelta(days=1)
+    store.records("a", "sleep", 7, FakeApi([_record(1, start, start)]))
+
+    assert store.records("b", "sleep", 7, FakeApi([])) == []
+    assert store.records("a", "workout", 7, FakeApi([])) == []